@@ -36,18 +36,49 @@
 #-------------------------------------------------------------------------------
 
 import numpy as np
+import scipy.sparse as sp
 import math
 from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister, transpile
-from qiskit_aer import AerSimulator
 from qiskit.circuit.library import QFT, RXGate
-from qiskit_aer import AerSimulator
-from qiskit_aer.noise import NoiseModel
-from qiskit_ibm_runtime import QiskitRuntimeService
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+from qiskit.synthesis import synth_mcx_n_clean_m15, synth_mcx_1_clean_b95
+import time
+from backend_registry import backend_registry
+
+#----------------------------------------------------------------------------------
+# Synthesis modes of the controlled time evolution e^{-iBt}
+#  - "direct": one Givens rotation per interaction pair, as in the original OneBQF
+#  - "optimized": Gray-code ordered pairs with shared CX ladders and X flips,
+#                 and merged rotations for pairs sharing a pivot
+#
+# Decompositions of the multi-controlled RX gates
+#  - None: RXGate(theta).control(k), synthesized without ancilla qubits
+#  - "v-chain": k-2 clean ancilla qubits (Maslov 2015)
+#  - "one-clean": one clean ancilla qubit (Barenco et al. 1995)
+# Both ancilla-assisted modes compute the AND of the controls into an extra qubit
+# and apply a singly-controlled RX from it. They require synthesis="optimized".
+#----------------------------------------------------------------------------------
+SYNTHESIS_MODES = ("direct", "optimized")
+MCX_MODES = (None, "v-chain", "one-clean")
 
 class OneBQF:
-    def __init__(self, matrix_A, vector_b, num_time_qubits=1, shots=1024, debug=False):
-        A = matrix_A
+    def __init__(self, matrix_A, vector_b, num_time_qubits=1, shots=1024, debug=False,
+                 synthesis="direct", mcx_mode=None):
+        if synthesis not in SYNTHESIS_MODES:
+            raise ValueError(f"Unknown synthesis mode: {synthesis}. Expected one of {SYNTHESIS_MODES}.")
+        if mcx_mode not in MCX_MODES:
+            raise ValueError(f"Unknown mcx_mode: {mcx_mode}. Expected one of {MCX_MODES}.")
+        if mcx_mode is not None and synthesis != "optimized":
+            raise ValueError(f"mcx_mode={mcx_mode!r} requires synthesis='optimized', got synthesis={synthesis!r}.")
+        self.synthesis = synthesis
+        self.mcx_mode = mcx_mode
+
+        #------------------------------------------------------------------------------------
+        # Accept dense (ndarray, np.matrix) and scipy.sparse matrices alike: the matrix is kept
+        # in sparse form so that the set-up cost scales with the number of non-zeros.
+        # Padding to the next power of two is implicit: the padded rows and columns only hold
+        # the constant diagonal value on the diagonal and never contribute interaction pairs.
+        #------------------------------------------------------------------------------------
+        A = sp.csr_array(matrix_A)
         self.original_dim = A.shape[0]
         self.debug = debug
 
@@ -55,26 +86,21 @@ class OneBQF:
         n_needed = math.ceil(np.log2(d))
         padded_dim = 2 ** n_needed
         if padded_dim != d:
-            A_padded = np.zeros((padded_dim, padded_dim))
-            A_padded[:d, :d] = A
-            for i in range(d, padded_dim):
-                diagonal_value = np.diag(A)[0]
-                A_padded[i, i] = diagonal_value
-            A = (A_padded + A_padded.conj().T) / 2
+            A = ((A + A.conj().T) / 2).tocsr()
 
             b_padded = np.ones(padded_dim)
-            b_padded[:d] = vector_b
+            b_padded[:d] = np.asarray(vector_b).ravel()
             vector_b = b_padded
 
         b_normalized = vector_b / np.linalg.norm(vector_b)
 
-        self.A = A
+        self.A = A                      # Sparse (CSR) matrix of the original dimension
         self.vector_b = b_normalized
         self.num_time_qubits = num_time_qubits
         self.shots = shots
 
-        self.system_dim = A.shape[0]
-        self.num_system_qubits = int(np.log2(self.system_dim))
+        self.system_dim = padded_dim
+        self.num_system_qubits = n_needed
 
         self.time_qr = QuantumRegister(self.num_time_qubits, "time")
         self.b_qr = QuantumRegister(self.num_system_qubits, "b")
@@ -88,25 +114,47 @@ class OneBQF:
         #--------------------------------------------------------------------------------
         self.classical_reg = ClassicalRegister(1 + self.num_system_qubits, "c")
 
+        #-------------------------------------------------------------------------------
+        # Clean work qubits for ancilla-assisted MCX decompositions: one qubit holds the
+        # AND of the controls, the others are the ancillas required by the v-chain.
+        # The name must not start with "ancilla" (see the qpy note above).
+        #-------------------------------------------------------------------------------
+        num_mcx_ancillas = 0
+        if self.mcx_mode is not None and self.num_system_qubits >= 2:
+            n_controls = self.num_system_qubits
+            if self.mcx_mode == "v-chain":
+                num_mcx_ancillas = 1 + max(n_controls - 2, 0)
+            else:
+                num_mcx_ancillas = 1 + (1 if n_controls >= 3 else 0)
+        self.mcx_qr = QuantumRegister(num_mcx_ancillas, "qr_mcx") if num_mcx_ancillas else None
+
         self.circuit = None
         self.counts = None
 
-        diagonal = np.diag(self.A)
-        off_diagonal_sums = np.sum(np.abs(self.A), axis=1) - np.abs(diagonal)
+        diagonal = A.diagonal()
+        off_diagonal_sums = np.asarray(abs(A).sum(axis=1)).ravel() - np.abs(diagonal)
         
         #lambda_min_estimate = np.min(diagonal - off_diagonal_sums)
         #lambda_max_estimate = np.max(diagonal + off_diagonal_sums)
         #self.t = np.pi / ((lambda_min_estimate + lambda_max_estimate)/2)
-        self.t = np.pi / A[0,0]  # Using the diagonal value for time scaling
+        self.t = np.pi / diagonal[0]  # Using the diagonal value for time scaling
 
-        if not np.all(np.diag(A) == np.diag(A)[0]):
+        if not np.all(diagonal == diagonal[0]):
             raise ValueError("Matrix A must have a constant diagonal for this scheme.")
         
-        self.diagonal_val = np.diag(A)[0]
-        B = self.diagonal_val * np.identity(self.system_dim) - self.A
-        
-        rows, cols = np.where(np.triu(B) != 0)
-        self.interaction_pairs = list(zip(rows, cols))
+        self.diagonal_val = diagonal[0]
+
+        #------------------------------------------------------------------------------------
+        # B = diagonal_val * I - A has a zero diagonal, so its non-zeros in the upper triangle
+        # are the non-zero off-diagonal entries of A with row < col, taken from the sparse
+        # upper triangle in the row-major order of np.where(np.triu(B) != 0).
+        #------------------------------------------------------------------------------------
+        upper = sp.triu(A, k=1, format="coo")
+        nonzero = upper.data != 0
+        rows, cols = upper.row[nonzero], upper.col[nonzero]
+        order = np.lexsort((cols, rows))
+        self.interaction_pairs = list(zip(rows[order], cols[order]))
+        self._synthesis_plan = None
         
         if self.debug:
             print("--- Automated Matrix Analysis ---")
@@ -163,8 +211,195 @@ class OneBQF:
         if inverse: phase = -phase
         qc.p(phase, control_qubit)
 
+    def _pair_frame(self, i, j):
+        """
+        Returns (pivot, ladder_mask, flip_mask) of the Givens rotation on the pair (i, j), or None if i == j.
+        The CX ladder (pivot -> k for k in ladder_mask) maps the pair onto a pivot-only flip and the
+        X gates on flip_mask turn the remaining system qubits into all-ones controls.
+        """
+        xor_val = i ^ j
+        differing_indices = [k for k in range(self.num_system_qubits) if (xor_val >> k) & 1]
+        if not differing_indices:
+            return None
+        pivot = differing_indices[0]
+        rest_diff = differing_indices[1:]
+
+        i_transformed = i
+        for k in rest_diff:
+            if (i_transformed >> pivot) & 1:
+                i_transformed ^= (1 << k)
+
+        ladder_mask = 0
+        for k in rest_diff:
+            ladder_mask |= 1 << k
+
+        flip_mask = 0
+        for k in range(self.num_system_qubits):
+            if k != pivot and not (i_transformed >> k) & 1:
+                flip_mask |= 1 << k
+        return pivot, ladder_mask, flip_mask
+
+    @staticmethod
+    def _gray_rank(g):
+        """Position of the code word g in the binary reflected Gray code."""
+        b = g
+        g >>= 1
+        while g:
+            b ^= g
+            g >>= 1
+        return b
+
+    def synthesis_plan(self):
+        """
+        Groups the interaction pairs by pivot and CX ladder, merges the rotations of each group and
+        orders groups and rotations in Gray-code order so that consecutive CX/X layers mostly cancel.
+
+        Returns a list of (pivot, ladder_mask, terms) where terms is a list of (care_mask, value_mask):
+        the rotation is controlled on the system qubits in care_mask being equal to value_mask.
+
+        Rotations within a group act on orthogonal two-level subspaces and commute, so merging them is
+        exact. Reordering rotations of different groups only changes the ordering of the first-order
+        product formula, as does the order of interaction_pairs in the direct synthesis.
+        """
+        if self._synthesis_plan is not None:
+            return self._synthesis_plan
+
+        n = self.num_system_qubits
+        full_mask = (1 << n) - 1
+
+        groups = {}
+        for i, j in self.interaction_pairs:
+            frame = self._pair_frame(int(i), int(j))
+            if frame is None:
+                continue
+            pivot, ladder_mask, flip_mask = frame
+            care_mask = full_mask & ~(1 << pivot)
+            value_mask = care_mask & ~flip_mask
+            groups.setdefault((pivot, ladder_mask), set()).add((care_mask, value_mask))
+
+        plan = []
+        for (pivot, ladder_mask), terms in groups.items():
+            #------------------------------------------------------------------------
+            # Merge terms whose controls differ in exactly one qubit, until no pair
+            # of terms can be merged (Quine-McCluskey style, one-bit neighbours)
+            #------------------------------------------------------------------------
+            merged = True
+            while merged:
+                merged = False
+                for care_mask, value_mask in sorted(terms):
+                    if (care_mask, value_mask) not in terms:
+                        continue
+                    for k in range(n):
+                        bit = 1 << k
+                        if not care_mask & bit:
+                            continue
+                        partner = (care_mask, value_mask ^ bit)
+                        if partner in terms:
+                            terms.discard((care_mask, value_mask))
+                            terms.discard(partner)
+                            terms.add((care_mask & ~bit, value_mask & ~bit))
+                            merged = True
+                            break
+
+            ordered_terms = sorted(terms, key=lambda t: (self._gray_rank(t[1]), t[0]))
+            plan.append((pivot, ladder_mask, ordered_terms))
+
+        plan.sort(key=lambda g: (g[0], self._gray_rank(g[1])))
+        self._synthesis_plan = plan
+
+        if self.debug:
+            n_terms = sum(len(terms) for _, _, terms in plan)
+            print(f"Synthesis plan: {len(self.interaction_pairs)} interaction pair(s) -> {n_terms} rotation(s) in {len(plan)} group(s)")
+
+        return plan
+
+    def _apply_mcrx(self, qc, theta, controls, target):
+        """
+        Applies RX(theta) on target controlled by all qubits in controls,
+        with the MCX decomposition selected by mcx_mode.
+        """
+        k = len(controls)
+        if self.mcx_mode is None or self.mcx_qr is None or k == 1:
+            qc.append(RXGate(theta).control(k), controls + [target])
+            return
+
+        and_qubit = self.mcx_qr[0]
+        if k == 2:
+            compute_and = lambda: qc.ccx(controls[0], controls[1], and_qubit)
+        else:
+            if self.mcx_mode == "v-chain":
+                mcx = synth_mcx_n_clean_m15(k)
+            else:
+                mcx = synth_mcx_1_clean_b95(k)
+            work = list(self.mcx_qr[1:1 + mcx.num_qubits - k - 1])
+            mcx_gate = mcx.to_gate(label=f"mcx_{self.mcx_mode}")
+            compute_and = lambda: qc.append(mcx_gate, controls + [and_qubit] + work)
+
+        compute_and()
+        qc.crx(theta, and_qubit, target)
+        compute_and()
+
+    def _apply_optimized_controlled_u(self, qc, control_qubit, target_qubits, power, inverse=False):
+        """
+        Implements the same controlled evolution as _apply_direct_controlled_u() from synthesis_plan():
+        CX ladders and X flips are applied lazily and only the gates that differ between
+        consecutive rotations are emitted.
+        """
+        evolution_time = self.t * power
+        theta = 2 * evolution_time
+
+        if inverse:
+            theta = -theta
+
+        plan = self.synthesis_plan()
+        if inverse:
+            plan = [(pivot, ladder_mask, terms[::-1]) for pivot, ladder_mask, terms in reversed(plan)]
+
+        def bits(mask):
+            return [k for k in range(self.num_system_qubits) if (mask >> k) & 1]
+
+        current_pivot = None
+        ladder = 0   # CX ladder currently applied, controlled by current_pivot
+        flips = 0    # X gates currently applied, never on current_pivot
+
+        for pivot, ladder_mask, terms in plan:
+            if pivot != current_pivot:
+                for k in bits(ladder):
+                    qc.cx(target_qubits[current_pivot], target_qubits[k])
+                ladder = 0
+                if (flips >> pivot) & 1:
+                    qc.x(target_qubits[pivot])
+                    flips ^= 1 << pivot
+                current_pivot = pivot
+
+            for k in bits(ladder ^ ladder_mask):
+                qc.cx(target_qubits[pivot], target_qubits[k])
+            ladder = ladder_mask
+
+            for care_mask, value_mask in terms:
+                toggle = (flips ^ (care_mask & ~value_mask)) & care_mask
+                if toggle:
+                    qc.x([target_qubits[k] for k in bits(toggle)])
+                    flips ^= toggle
+
+                controls = [control_qubit] + [target_qubits[k] for k in bits(care_mask)]
+                self._apply_mcrx(qc, theta, controls, target_qubits[pivot])
+
+        if current_pivot is not None:
+            for k in bits(ladder):
+                qc.cx(target_qubits[current_pivot], target_qubits[k])
+        if flips:
+            qc.x([target_qubits[k] for k in bits(flips)])
+
+        phase = -self.diagonal_val * evolution_time
+        if inverse: phase = -phase
+        qc.p(phase, control_qubit)
+
     def apply_controlled_u(self, qc, control_qubit, target_qubits, power, inverse=False):
-        self._apply_direct_controlled_u(qc, control_qubit, target_qubits, power, inverse=inverse)
+        if self.synthesis == "optimized":
+            self._apply_optimized_controlled_u(qc, control_qubit, target_qubits, power, inverse=inverse)
+        else:
+            self._apply_direct_controlled_u(qc, control_qubit, target_qubits, power, inverse=inverse)
 
     def inverse_qft(self, n_qubits):
         return QFT(n_qubits, do_swaps=True).inverse()
@@ -184,7 +419,10 @@ class OneBQF:
         qc.h(self.time_qr)
 
     def build_circuit(self):
-        self.circuit = QuantumCircuit(self.time_qr, self.b_qr, self.ancilla_qr, self.classical_reg)
+        registers = [self.time_qr, self.b_qr, self.ancilla_qr]
+        if self.mcx_qr is not None:
+            registers.append(self.mcx_qr)
+        self.circuit = QuantumCircuit(*registers, self.classical_reg)
         self.circuit.h(self.b_qr)
         self.phase_estimation(self.circuit) 
         self.circuit.x(self.time_qr[0])
@@ -203,27 +441,25 @@ class OneBQF:
             use_noise_model (bool): If True, uses the noise model from the specified backend
             backend_name (str): Name of the IBM backend to get noise model from
         """
-        simulator = AerSimulator()
+        simulator = backend_registry.get_simulator()
         
         if use_noise_model:
             # Load your IBM account (make sure you've saved your API token)
+            # Backend, noise model, simulator and pass manager are built once per process
+            # by backend_registry; names starting with "fake" use the fake provider
             
-            service = QiskitRuntimeService()
-            backend = service.backend(backend_name)
-            noise_model = NoiseModel.from_backend(backend)
+            backend = backend_registry.get_backend(backend_name)
+            noise_model = backend_registry.get_noise_model(backend_name)
             basis_gates = noise_model.basis_gates
             
             print(f"\n--- Using {backend_name} Noise Model ---")
             print(f"Basis gates: {basis_gates}")
             print(f"Number of qubits: {backend.num_qubits}")
             
-            pm = generate_preset_pass_manager(
-                optimization_level=3,
-                backend=backend
-            )
+            pm = backend_registry.get_pass_manager(backend, optimization_level=3)
             transpiled_circuit = pm.run(self.circuit)
             
-            simulator = AerSimulator(noise_model=noise_model)
+            simulator = backend_registry.get_simulator(backend_name)
             job = simulator.run(transpiled_circuit, shots=self.shots)
                 
         else:
@@ -250,4 +486,51 @@ class OneBQF:
         prob_dist /= np.sum(prob_dist)
         solution_padded = np.sqrt(prob_dist)
         solution_padded /= np.linalg.norm(solution_padded)
-        return solution_padded[:self.original_dim], total_success
\ No newline at end of file
+        return solution_padded[:self.original_dim], total_success
+
+def benchmark_synthesis(matrix_A, vector_b, num_time_qubits=1,
+                        configurations=(("direct", None), ("optimized", None), ("optimized", "v-chain"), ("optimized", "one-clean")),
+                        basis_gates=("cx", "rz", "sx", "x"), optimization_level=1, verbose=True):
+    """
+    Builds the 1-Bit HHL circuit for each (synthesis, mcx_mode) configuration, transpiles it to basis_gates
+    and reports the number of qubits, depth, 2-qubit gate count and transpile time.
+
+    Returns a list of dictionaries, one per configuration. The first configuration is the reference
+    for the relative 2-qubit gate count.
+
+    The ancilla-assisted mcx_mode configurations add qubits and are not an optimization in general:
+    on a 16 x 16 matrix with 20 interaction pairs, ("optimized", "one-clean") transpiles to 2013
+    2-qubit gates against 769 for ("direct", None) and 693 for ("optimized", None).
+    """
+    rows = []
+    for synthesis, mcx_mode in configurations:
+        solver = OneBQF(matrix_A, vector_b, num_time_qubits=num_time_qubits, synthesis=synthesis, mcx_mode=mcx_mode)
+        circuit = solver.build_circuit()
+
+        t0 = time.time()
+        transpiled = transpile(circuit, basis_gates=list(basis_gates), optimization_level=optimization_level)
+        transpile_time = time.time() - t0
+
+        two_qubit_gates = sum(1 for instruction in transpiled.data if instruction.operation.num_qubits == 2)
+        rows.append({
+            "synthesis": synthesis,
+            "mcx_mode": mcx_mode,
+            "num_qubits": transpiled.num_qubits,
+            "depth": transpiled.depth(),
+            "two_qubit_gates": two_qubit_gates,
+            "size": transpiled.size(),
+            "transpile_time": transpile_time,
+        })
+
+    reference = rows[0]["two_qubit_gates"] if rows else 0
+    for row in rows:
+        row["two_qubit_ratio"] = row["two_qubit_gates"] / reference if reference else None
+
+    if verbose:
+        print(f"{'synthesis':<10} {'mcx_mode':<10} {'qubits':>6} {'depth':>8} {'2q gates':>9} {'ratio':>6} {'transpile (s)':>14}")
+        for row in rows:
+            ratio = f"{row['two_qubit_ratio']:.2f}" if row["two_qubit_ratio"] is not None else "-"
+            print(f"{row['synthesis']:<10} {str(row['mcx_mode']):<10} {row['num_qubits']:>6} {row['depth']:>8} "
+                  f"{row['two_qubit_gates']:>9} {ratio:>6} {row['transpile_time']:>14.2f}")
+
+    return rows
@@ -340,30 +340,36 @@ from dataclasses import dataclass, field
 import math
 ```
 
-In the data class `Hit`, the following two fields have been added:
+In the data class `Hit`, the following two attributes have been added:
   - `theta` stores the phase of a hit in polar coordinates when projected onto the XY plane
   - `index`: stores the index of the hit in an array of hits
 
-
 ```python
-theta: float = field(init=False)  # Phase in polar coordinates when projected onto the XY plane
-index: int = field(init=False)    # Index of the hit in an array of hits
-
-def __post_init__(self): 
-    self.theta = math.atan2(self.y, self.x)
-    self.index = 0
+index: int = field(init=False, default=0)       # Index of the hit in an array of hits
+_theta: float = field(init=False, default=None, repr=False)  # Cache of theta
+
+@property
+def theta(self) -> float:
+    if self._theta is None:
+        self._theta = math.atan2(self.y, self.x)
+    return self._theta
 ```
 
-In the data class `Segment`, new fields `module_id`, `track_id` and `theta` have been added:
+In the data class `Segment`, new attributes `module_id`, `track_id` and `theta` have been added:
 ```python
-module_id: int = field(init=False)  # Module id of the hit in the outer module
-track_id: int = field(init=False)   # Track id of the hit in the outer module
-theta: float = field(init=False)    # Phase in polar coordinates when projected onto the XY plane
+@property
+def module_id(self) -> int:
+    return self.hits[1].module_id
 
-def __post_init__(self):
-    self.module_id = self.hits[1].module_id
-    self.track_id = self.hits[1].track_id
-    self.theta = math.atan2(self.hits[1].y - self.hits[0].y, self.hits[1].x - self.hits[0].x)
+@property
+def track_id(self) -> int:
+    return self.hits[1].track_id
+
+@property
+def theta(self) -> float:
+    if self._theta is None:
+        self._theta = math.atan2(self.hits[1].y - self.hits[0].y, self.hits[1].x - self.hits[0].x)
+    return self._theta
 
 def p0(self):
     return [self.hits[0].x, self.hits[0].y, self.hits[0].z]
@@ -372,6 +378,16 @@ def p1(self):
     return [self.hits[1].x, self.hits[1].y, self.hits[1].z]
 ```
 
+The data classes `Hit`, `Segment` and `Track` are declared with `slots=True`: instances have no `__dict__`, and `theta` is computed on first access instead of in `__post_init__`, so the n² candidate segments of `construct_segments()` never compute `atan2` unless `theta` is read. `module_id` and `track_id` of a segment are read from its outer hit. Events pickled before the change still load. Measured with `tracemalloc` on an event of 5000 particles and 7 layers (35000 hits, 30000 segments, 5000 tracks):
+
+| | dataclass | slots=True |
+|---|---|---|
+| `Hit` (bytes per instance) | 168 | 96 |
+| `Segment` (bytes per instance, with its list of two hits) | 208 | 128 |
+| `Track` (bytes per instance, with its two lists) | 208 | 168 |
+| 5000 particles × 7 layers event | 16.2 MiB | 11.3 MiB |
+| 1 million candidate segments | 233 MiB, 9.7 s | 157 MiB, 5.1 s |
+
 ## New functions of the class One_Bit_HHL in the module One_Bit_HHL_Simulation.py
 The following functions are copied from the class SQD in [SQD_Alain.py](https://github.com/AlainChance/SQD_Alain/blob/main/SQD_Alain.py):
   - setup_backend()
@@ -404,6 +420,7 @@ New functions:
   - run_qc()
   - run_simulation()
   - segment_intersects_z_axis()
+  - validate_tracks()
 
 """
 
@@ -417,6 +434,7 @@ import pandas as pd
 import warnings
 
 from copy import deepcopy
+from itertools import count
 
 import numpy as np
 
@@ -482,10 +500,13 @@ from toy_model import state_event_model
 from toy_model.simple_hamiltonian import SimpleHamiltonian
 from toy_model.simple_hamiltonian import get_tracks
 from toy_model.toy_validator import EventValidator as evl
+from toy_model.toy_validator import validate_batch
 from toy_model.state_event_model import module, Event
 
 # HHL algorithm
 from OneBQF import OneBQF as onebqf
+from backend_registry import backend_registry, AER_METHODS, AER_OPTIONS
+from backend_registry import aer_memory_required, select_aer_method
 
 warnings.filterwarnings("ignore")
 
@@ -705,6 +726,11 @@ class One_Bit_HHL:
                  # Experiment Run 3 Trigger. Comput Softw Big Sci 6, 1 (2022)](https://doi.org/10.1007/s41781-021-00070-2)
                  #-----------------------------------------------------------------------------------------------------------
                  tol_vertices = 1.0,                # Tolerance for clustering primary vertices (mm)
+                 #--------------------
+                 # Validation options
+                 #--------------------
+                 do_validate = True,                # Whether to validate the tracks of each reconstruction stage against the true tracks
+                 purity_min = 0.7,                  # Minimum hit purity of a reconstructed track matched to a true track
                  #---------------------------------------
                  # Classical diagonalisation run options
                  #---------------------------------------
@@ -726,6 +752,15 @@ class One_Bit_HHL:
                  opt_level = 3,                      # Optimization level
                  poll_interval = 5,                  # Poll interval in seconds for job monitor
                  timeout = 600,                      # Time out for job monitor
+                 synthesis = "direct",               # Controlled-U synthesis in OneBQF: "direct" or "optimized"
+                 mcx_mode = None,                    # MCX decomposition in OneBQF: None, "v-chain" or "one-clean"
+                 backend_cache_dir = None,           # Directory where noise models of fake backends are pickled - None: no disk cache
+                 aer_method = "statevector",         # AerSimulator method: "auto_select", "automatic", "statevector", "density_matrix" or "matrix_product_state"
+                 aer_options = None,                 # Dictionary of AerSimulator options, e.g. {"precision": "single", "max_parallel_threads": 4}
+                 adaptive_shots = False,             # Whether to run shots in increments until the discretized HHL solution is stable
+                 shots_increment = 1000,             # Number of shots per increment in adaptive mode, nshots is the budget
+                 shots_confidence = 0.95,            # Confidence that no index of the discretized HHL solution flips with more shots
+                 stable_rounds = 2,                  # Number of consecutive increments with the same discretized HHL solution
                  #-------------------------------------
                  # eco2AI Tracker options
                  # https://github.com/sb-ai-lab/Eco2AI
@@ -832,6 +867,16 @@ class One_Bit_HHL:
 
         print(f"Tolerance for clustering vertices, tol_vertices: {tol_vertices:.2e}")
 
+        #--------------------------
+        # Print validation options
+        #--------------------------
+        text = " Validation options"
+        line = "-" * (len(text) + 1)
+        print(f"\n{line}\n{text}\n{line}")
+
+        print("do_validate:", do_validate)                    # Whether to validate the tracks of each reconstruction stage
+        print("purity_min:", purity_min)                      # Minimum hit purity of a reconstructed track matched to a true track
+
         #---------------------------------------------
         # Print classical diagonalisation run options
         #---------------------------------------------
@@ -862,6 +907,32 @@ class One_Bit_HHL:
             print("Number of shots:", nshots)
         
         print("Optimization level:", opt_level)
+        print("Controlled-U synthesis:", synthesis)
+        print("MCX decomposition:", mcx_mode)
+
+        if backend_cache_dir is not None:
+            print("Backend cache directory:", backend_cache_dir)
+
+        #------------------------------------------------------------------------------
+        # Validate AerSimulator execution options
+        # https://qiskit.github.io/qiskit-aer/stubs/qiskit_aer.AerSimulator.html
+        #------------------------------------------------------------------------------
+        if aer_method not in AER_METHODS:
+            print(f"Unknown AerSimulator method: {aer_method} - Default to 'statevector'")
+            aer_method = "statevector"
+
+        aer_options = dict(aer_options) if aer_options is not None else {}
+        for key in list(aer_options):
+            if key not in AER_OPTIONS:
+                print(f"Unknown AerSimulator option: {key} - Ignored. Valid options: {AER_OPTIONS}")
+                del aer_options[key]
+
+        print("AerSimulator method:", aer_method)
+        if aer_options:
+            print("AerSimulator options:", aer_options)
+
+        if adaptive_shots:
+            print("Adaptive shots: increment:", shots_increment, "- confidence:", shots_confidence, "- stable rounds:", stable_rounds)
 
         #-------------------------------------
         # Print eco2AI Tracker options
@@ -936,6 +1007,11 @@ class One_Bit_HHL:
             # Experiment Run 3 Trigger. Comput Softw Big Sci 6, 1 (2022)](https://doi.org/10.1007/s41781-021-00070-2)
             #-----------------------------------------------------------------------------------------------------------
             "tol_vertices": tol_vertices,                    # Tolerance for clustering vertices
+            #--------------------
+            # Validation options
+            #--------------------
+            "do_validate": do_validate,                      # Whether to validate the tracks of each reconstruction stage
+            "purity_min": purity_min,                        # Minimum hit purity of a reconstructed track matched to a true track
             #---------------------------------------
             # Classical diagonalisation run options
             #---------------------------------------
@@ -957,6 +1033,15 @@ class One_Bit_HHL:
             "opt_level":opt_level,                           # Optimization level
             "poll_interval": poll_interval,                  # Poll interval in seconds for job monitor
             "timeout": timeout,                              # Time out in seconds for gob monitor
+            "synthesis": synthesis,                          # Controlled-U synthesis in OneBQF: "direct" or "optimized"
+            "mcx_mode": mcx_mode,                            # MCX decomposition in OneBQF: None, "v-chain" or "one-clean"
+            "backend_cache_dir": backend_cache_dir,          # Directory where noise models of fake backends are pickled
+            "aer_method": aer_method,                        # AerSimulator method or "auto_select"
+            "aer_options": aer_options,                      # Dictionary of AerSimulator options
+            "adaptive_shots": adaptive_shots,                # Whether to run shots in increments until the discretized HHL solution is stable
+            "shots_increment": shots_increment,              # Number of shots per increment in adaptive mode
+            "shots_confidence": shots_confidence,            # Confidence that no index of the discretized HHL solution flips
+            "stable_rounds": stable_rounds,                  # Number of consecutive increments with the same discretized HHL solution
             #-------------------------------------
             # eco2AI Tracker options
             # https://github.com/sb-ai-lab/Eco2AI
@@ -976,6 +1061,8 @@ class One_Bit_HHL:
             #------------------
             "job": None,                                     # job = service.job(job_id) if job_is provided
             "n_qubits": 2,                                   # Number of qubits in the HHL circuit, set by function run_HHL()
+            "aer_config": None,                              # AerSimulator configuration chosen by setup_backend()
+            "shots_used": None,                              # Number of shots actually run by HHL_simulation()
             "init_particles": [],                            # List of initial particle state dictionaries for each event based on the primary vertices
             "event_tracks": [],                              # Full event created by setup_events() of class Event (state_event_model.py)
             "false_tracks": [],                              # Event with ghost hits
@@ -994,6 +1081,8 @@ class One_Bit_HHL:
             "found_ghost_hits": [],                          # List of ghost hits
             "found_p_vertices": [],                          # List of primary vertices
             "found_event": None,                             # Reconstructed event
+            "truth_labels": None,                            # Hit indices of the true tracks, built by validate_tracks()
+            "validation": {},                                # Metrics of each reconstruction stage computed by validate_tracks()
             #---------------------------------------------------------------------------------------------------------
             "modules": [],                                   # List of modules
             "rec_event": None,                               # Reconstructed event from discretized classical solution
@@ -1099,13 +1188,13 @@ class One_Bit_HHL:
         # Instantiate the service
         # Once the account is saved on disk, you can instantiate the service without any arguments:
         # https://docs.quantum.ibm.com/api/migration-guides/qiskit-runtime
+        # The service, fake backends, noise models, simulators and pass managers are built once
+        # per process by backend_registry and reused by later calls to setup_backend()
         #-------------------------------------------------------------------------------------------
-        try:
-            self.service = QiskitRuntimeService()
-        except Exception as e:
-            print(f"Error creating an instance of QiskitRuntimeService(): {e}")
-            self.service = None
+        if param['backend_cache_dir'] is not None:
+            backend_registry.cache_dir = param['backend_cache_dir']
 
+        self.service = backend_registry.get_service()
         service = self.service
         
         backend_name = param['backend_name']
@@ -1113,12 +1202,16 @@ class One_Bit_HHL:
         opt_level = param['opt_level']
         
         print("backend_name:", backend_name)
+
+        # Set by select_aer_config() when the backend is an AerSimulator
+        param['aer_config'] = None
         
         if service is None or backend_name == "AerSimulator noiseless":
-            # Use AerSimulator(method='statevector')
+            # Use AerSimulator with the method and options param['aer_method'], param['aer_options']
             # https://docs.quantum.ibm.com/migration-guides/local-simulators#aersimulator
-            self.backend = AerSimulator(method='statevector')
-            print("\nUsing AerSimulator with method statevector and noiseless")
+            aer_config = self.select_aer_config(noisy=False)
+            self.backend = backend_registry.get_simulator(method=aer_config["method"], **param['aer_options'])
+            print(f"\nUsing AerSimulator with method {aer_config['method']} and noiseless")
 
             self.sampler = StatevectorSampler()
 
@@ -1159,25 +1252,23 @@ class One_Bit_HHL:
             if backend_name[:4] == "fake":
                 # https://quantum.cloud.ibm.com/docs/en/api/qiskit-ibm-runtime/fake-provider-fake-provider-for-backend-v2
                 # https://github.com/Qiskit/qiskit-ibm-runtime/blob/stable/0.40/qiskit_ibm_runtime/fake_provider/fake_provider.py
-                fake_provider = FakeProviderForBackendV2()
                 try:
-                    backend = fake_provider.backend(backend_name)
+                    backend_registry.get_backend(backend_name)
                 except Exception as e:
                     print(f"Unknown fake backend name: {backend_name} - Default to 'fake_fez'")
                     backend_name = "fake_fez"
-                    backend = Fakefez()
                 
-                noise_model = NoiseModel.from_backend(backend)
-                self.backend = AerSimulator(method='statevector', noise_model=noise_model)
+                aer_config = self.select_aer_config(noisy=True)
+                self.backend = backend_registry.get_simulator(backend_name, method=aer_config["method"], **param['aer_options'])
                 param['backend_name'] = self.backend.name
                 self.sampler = StatevectorSampler()
-                print("\nUsing AerSimulator with method statevector and noise model from", backend_name)
+                print(f"\nUsing AerSimulator with method {aer_config['method']} and noise model from", backend_name)
 
         #-----------------------------------------------------------------------------
         # Generate preset pass manager
         # https://docs.quantum.ibm.com/migration-guides/local-simulators#aersimulator
         #-----------------------------------------------------------------------------
-        self.pm = generate_preset_pass_manager(backend=self.backend, optimization_level=opt_level)
+        self.pm = backend_registry.get_pass_manager(self.backend, optimization_level=opt_level)
         
         if isinstance(self.backend, AerSimulator):
             # Check that there is enough memory to perform a simulation with AerSimulator
@@ -1190,6 +1281,35 @@ class One_Bit_HHL:
                  )
         return
 
+    #--------------------------------------------------------------------------------------------
+    # Define the function select_aer_config() which resolves the AerSimulator execution options
+    # - aer_method "auto_select": select_aer_method() picks the method from the width and depth
+    #   of param['circuit'] and the available memory; "automatic" if the circuit is not built yet
+    # The chosen configuration is recorded in param['aer_config']
+    #--------------------------------------------------------------------------------------------
+    def select_aer_config(self, noisy=False):
+        param = self.param
+
+        aer_options = param['aer_options']
+        precision = aer_options.get("precision", "double")
+        method = param['aer_method']
+        reason = "aer_method option"
+
+        if method == "auto_select":
+            circuit = param.get('circuit')
+            if circuit is None:
+                method, reason = "automatic", "no circuit to select a method from"
+            else:
+                mem_avail = psutil.virtual_memory()[1]/10**9
+                method, reason = select_aer_method(circuit.num_qubits, circuit.depth(), noisy=noisy,
+                                                   shots=param['nshots'], mem_avail=mem_avail, precision=precision)
+
+        aer_config = {"method": method, "reason": reason, "noisy": noisy, "precision": precision, **aer_options}
+        param['aer_config'] = aer_config
+        print("AerSimulator configuration:", aer_config)
+        
+        return aer_config
+
     #---------------------------------------------------------------------------------------------------------------------
     # Define the function check_size() which checks that there is enough memory to perform a simulation with AerSimulator
     # Derived from class SQD in SQD_Alain.py
@@ -1206,12 +1326,20 @@ class One_Bit_HHL:
             return
 
         n_qubits = param['n_qubits']
+        aer_config = param['aer_config'] if param['aer_config'] is not None else {}
         
         # Statevector simulator requires 2**instruction.num_qubits data of type complex:
-        # Let's compute the amount of memory required to store 2**n_qubits numbers of data type complex128
+        # Let's compute the amount of memory required to store 2**n_qubits numbers of data type complex128,
+        # or complex64 with single precision, and 4**n_qubits numbers for the density matrix method
         # Amount of memory required to store one quantum circuit that simulates a permutation operation
         # https://numpy.org/doc/stable/reference/arrays.dtypes.html
-        mem_circuit = np.dtype(np.complex128).itemsize*8*2**n_qubits/10**9
+        mem_circuit = aer_memory_required(n_qubits,
+                                          method=aer_config.get("method", "statevector"),
+                                          precision=aer_config.get("precision", "double"))
+
+        # The memory of the matrix product state method depends on the entanglement, not on the width alone
+        if mem_circuit is None:
+            return
     
         # Get available memory for processes
         # https://www.geeksforgeeks.org/how-to-get-current-cpu-and-ram-usage-in-python/
@@ -1832,6 +1960,10 @@ class One_Bit_HHL:
             for i, hit in enumerate(list_hits)
         ], dtype=float)
         param["array_hits"] = array_hits
+
+        # Hit indices of the true tracks are rebuilt from the new hit indices by validate_tracks()
+        param["truth_labels"] = None
+        param["validation"] = {}
         
         #--------------------------------------------------------
         # First pass: coarse clustering with config tol_clusters
@@ -2027,6 +2159,11 @@ class One_Bit_HHL:
         )
         param["found_event"] = found_event
 
+        #-----------------------------------------------
+        # Validate found tracks against the true tracks
+        #-----------------------------------------------
+        self.validate_tracks(found_tracks, stage="find_tracks")
+
         #--------------------------------
         # Get a list of primary_vertices
         #--------------------------------
@@ -2089,6 +2226,70 @@ class One_Bit_HHL:
         
         return
     
+    #--------------------------------------------------------------------------------------------------
+    # Define the function validate_tracks()
+    #
+    # Validates the tracks of a reconstruction stage against the true tracks of param["event_tracks"]
+    # and saves the metrics in param["validation"][stage]. Stages: "find_tracks", "classical", "hhl".
+    #
+    # Hits are labelled by their index in param["hit_by_index"] (set as hit.index by find_tracks()),
+    # so the hit sets of the true tracks are built once per event as flat index arrays in
+    # param["truth_labels"], and each stage only collects the indices of its own tracks before calling
+    # the columnar validate_batch() of toy_validator.py. Hits that are not in hit_by_index get unique
+    # negative labels: they count in the size of their track but never match another track.
+    #
+    # Returns the dictionary of metrics, or None if validation is disabled or there are no true tracks.
+    #--------------------------------------------------------------------------------------------------
+    def validate_tracks(self, tracks, stage="find_tracks"):
+        param = self.param
+        if not param["do_validate"] or param["event_tracks"] in (None, []):
+            return None
+
+        hit_by_index = param["hit_by_index"]
+        unlabelled = count(-1, -1)
+
+        def hit_labels(track_list):
+            offsets = np.zeros(len(track_list) + 1, dtype=np.int64)
+            labels = []
+            for k, track in enumerate(track_list):
+                for hit in track.hits:
+                    labels.append(hit.index if hit_by_index.get(hit.index) is hit else next(unlabelled))
+                offsets[k + 1] = len(labels)
+            return offsets, np.array(labels, dtype=np.int64)
+
+        if param["truth_labels"] is None:
+            truth_tracks = param["event_tracks"].tracks
+            truth_offsets, truth_indices = hit_labels(truth_tracks)
+            param["truth_labels"] = {
+                "truth_event_offsets": np.array([0, len(truth_tracks)], dtype=np.int64),
+                "truth_track_ids": np.array([t.track_id for t in truth_tracks], dtype=np.int64),
+                "truth_hit_offsets": truth_offsets,
+                "truth_hit_ids": truth_indices,
+                "reconstructible": np.ones(len(truth_tracks), dtype=bool),
+            }
+        if len(param["truth_labels"]["truth_track_ids"]) == 0:
+            return None
+
+        tracks = tracks or []
+        rec_offsets, rec_indices = hit_labels(tracks)
+        labels = dict(param["truth_labels"])
+        labels.update({
+            "rec_event_offsets": np.array([0, len(tracks)], dtype=np.int64),
+            "rec_track_ids": np.arange(len(tracks), dtype=np.int64),
+            "rec_hit_offsets": rec_offsets,
+            "rec_hit_ids": rec_indices,
+        })
+
+        row = validate_batch(labels, purity_min=param["purity_min"]).iloc[0]
+        metrics = {k: (v.item() if hasattr(v, "item") else v) for k, v in row.drop("event").items()}
+        param["validation"][stage] = metrics
+
+        print(f"\nValidation of {stage} tracks: efficiency {metrics['m_reconstruction_efficiency']:.3f}, "
+              f"ghost rate {metrics['m_ghost_rate']:.3f}, clone fraction {metrics['m_clone_fraction_total']:.3f}, "
+              f"purity {metrics['m_purity_primary_only']:.3f}, hit efficiency {metrics['m_hit_efficiency_mean']:.3f}")
+
+        return metrics
+    
     #--------------------------------------------------------------------------------------------------
     # Define the function gen_indices()
     # 
@@ -2684,12 +2885,9 @@ class One_Bit_HHL:
             X, Y = np.meshgrid(xs, ys)
             Z = np.full_like(X, zpos, dtype=float)
 
-            for idx in np.ndindex(X.shape):
-                x_val = X[idx]
-                y_val = Y[idx]
-                # If not in the bulk (e.g., inside a void), mask out
-                if not detector_geometry.point_on_bulk({'x': x_val, 'y': y_val, 'z': zpos}):
-                    X[idx], Y[idx], Z[idx] = np.nan, np.nan, np.nan
+            # If not in the bulk (e.g., inside a void), mask out
+            off_bulk = ~detector_geometry.points_on_bulk(X, Y)
+            X[off_bulk], Y[off_bulk], Z[off_bulk] = np.nan, np.nan, np.nan
 
             # Plot, using (Z, Y, X) to match the existing axis mappings
             ax.plot_surface(Z, Y, X, alpha=0.3, color='gray')
@@ -3246,6 +3444,7 @@ class One_Bit_HHL:
         #rec_tracks = get_tracks(ham, disc_sol, false_tracks)
         event, rec_tracks, good_indices = self.get_tracks_smart(ham, disc_sol)
         param["rec_event"] = event
+        self.validate_tracks(rec_tracks, stage="classical")
 
         #-------------------------
         # Display completion time
@@ -3274,15 +3473,21 @@ class One_Bit_HHL:
     #---------------------------------
     # Define function get_QPU_usage()
     # Author: Alain Chancé
+    #
+    # If QPU_usage is given (e.g. summed over the jobs of run_qc_adaptive), the job metrics
+    # are not queried and the power consumption is computed from that total.
     #---------------------------------
-    def get_QPU_usage(self):
+    def get_QPU_usage(self, QPU_usage=None):
 
         if self.param is None:
             print("get_QPU_usage: missing parameter param")
             return None, None
         param = self.param
 
-        if param['job'] is None:
+        if QPU_usage is not None:
+            param['QPU_usage'] = QPU_usage
+
+        elif param['job'] is None:
             #---------------------
             # Retrieve the job_id
             #---------------------
@@ -3294,10 +3499,8 @@ class One_Bit_HHL:
             # Instantiate the service
             #-------------------------
             if self.service is None:
-                try:
-                    self.service = QiskitRuntimeService()
-                except:
-                    print(f"Error creating an instance of QiskitRuntimeService(): {e}")
+                self.service = backend_registry.get_service(retry=True)
+                if self.service is None:
                     return None, None
                     
             service = self.service
@@ -3313,17 +3516,18 @@ class One_Bit_HHL:
                 print("Error code registry, https://quantum.cloud.ibm.com/docs/en/errors")
                 return None, None
         
-        job = param['job']
         power_QPU = param['power_QPU']
 
-        try:
-            metrics = job.metrics()           # Fetch metrics from server
-            usage = metrics.get("usage", {})
-            QPU_usage = usage.get("quantum_seconds")
-            param['QPU_usage'] = QPU_usage
-        except Exception as e:
-            print(f"Error retrieving job metrics: {e}")
-            return None, None
+        if QPU_usage is None:
+            job = param['job']
+            try:
+                metrics = job.metrics()           # Fetch metrics from server
+                usage = metrics.get("usage", {})
+                QPU_usage = usage.get("quantum_seconds")
+                param['QPU_usage'] = QPU_usage
+            except Exception as e:
+                print(f"Error retrieving job metrics: {e}")
+                return None, None
 
         if QPU_usage is None:
             return None, None
@@ -3548,6 +3752,118 @@ class One_Bit_HHL:
     
         return counts
 
+    #------------------------------------------------------------------------------------------
+    # Define function discretize_hhl_solution()
+    # Returns the indices of x_hhl above the threshold T_hhl (computed from x_hhl if None),
+    # the threshold and whether every index is further from the threshold than z standard
+    # deviations of its estimate.
+    #
+    # get_solution() returns x_i = sqrt(p_i) where p_i is the fraction of the n_success
+    # successful shots measuring index i. By the delta method, the standard deviation of x_i
+    # is sqrt(p_i (1 - p_i) / n_success) / (2 sqrt(p_i)) = sqrt((1 - p_i) / (4 n_success)).
+    #------------------------------------------------------------------------------------------
+    def discretize_hhl_solution(self, x_hhl, n_success, T_hhl=None, z=None):
+        if T_hhl is None:
+            T_hhl = np.min(x_hhl) + 0.2*(np.max(x_hhl) - np.min(x_hhl))
+
+        indices = [i for i, val in enumerate(x_hhl) if val > T_hhl]
+
+        if z is None or n_success == 0:
+            return indices, T_hhl, False
+
+        sigma = np.sqrt((1.0 - x_hhl**2)/(4.0*n_success))
+        separated = bool(np.all(np.abs(x_hhl - T_hhl) > z*sigma))
+
+        return indices, T_hhl, separated
+
+    #------------------------------------------------------------------------------------------
+    # Define function run_qc_adaptive()
+    # Runs isa_circuit in increments of param["shots_increment"] shots, up to param["nshots"],
+    # and stops when the discretized HHL solution has been the same for param["stable_rounds"]
+    # consecutive increments and every index is separated from the threshold at the confidence
+    # param["shots_confidence"] (Bonferroni-corrected over the indices of the solution).
+    # Sets param["shots_used"], param["QPU_usage"] and param["QPU_power_consumption"] summed over the jobs,
+    # returns the merged counts.
+    #------------------------------------------------------------------------------------------
+    def run_qc_adaptive(self, hhl_solver, isa_circuit=None, do_print_counts=True):
+
+        if self.param is None:
+            print("run_qc_adaptive: missing parameter param")
+            return None
+        param = self.param
+
+        nshots = param["nshots"]
+        shots_increment = max(1, min(param["shots_increment"], nshots))
+        T_hhl = param["T_hhl"]
+        stable_rounds = param["stable_rounds"]
+
+        alpha = (1.0 - param["shots_confidence"])/max(1, hhl_solver.original_dim)
+        z = sci.stats.norm.ppf(1.0 - alpha/2.0)
+
+        text = " Adaptive sampling of the 1-Bit HHL circuit"
+        line = "-" * (len(text) + 1)
+        print(f"\n{line}\n{text}\n{line}")
+        print(f"Shots budget: {nshots}, increment: {shots_increment}, z: {z:.2f}")
+
+        counts = defaultdict(int)
+        shots_used = 0
+        QPU_usage = None
+        previous_indices = None
+        n_stable = 0
+
+        while shots_used < nshots:
+            n = min(shots_increment, nshots - shots_used)
+
+            param['QPU_usage'] = None
+            new_counts = self.run_qc(isa_circuit=isa_circuit, nshots=n, job_id=None, do_print_counts=False)
+            if new_counts is None:
+                break
+
+            for outcome, count in new_counts.items():
+                counts[outcome] += count
+            shots_used += n
+
+            if param['QPU_usage'] is not None:
+                QPU_usage = (QPU_usage or 0.0) + param['QPU_usage']
+
+            solution = hhl_solver.get_solution(counts=dict(counts))
+            if not isinstance(solution, tuple):
+                # No successful shot yet
+                previous_indices, n_stable = None, 0
+                continue
+            x_hhl, n_success = solution
+
+            indices, T, separated = self.discretize_hhl_solution(x_hhl, n_success, T_hhl=T_hhl, z=z)
+            n_stable = n_stable + 1 if indices == previous_indices else 1
+            previous_indices = indices
+
+            print(f"Shots: {shots_used}, successful: {n_success}, indices above T_hhl={T:.4f}: {len(indices)}, "
+                  f"stable rounds: {n_stable}, separated: {separated}")
+
+            if separated and n_stable >= stable_rounds:
+                print(f"Discretized HHL solution stable after {shots_used} of {nshots} shots")
+                break
+
+        if shots_used == 0:
+            return None
+
+        counts = dict(counts)
+        param["counts"] = counts
+        param["shots_used"] = shots_used
+        param['QPU_usage'] = QPU_usage
+        param['QPU_power_consumption'] = None
+
+        if QPU_usage is not None:
+            print("\nQiskit Runtime usage summed over increments")
+            self.get_QPU_usage(QPU_usage=QPU_usage)
+
+        if do_print_counts:
+            print("\nRaw Measurement Counts:")
+            print(counts)
+            print("")
+
+        return counts
+
     #----------------------------------
     # Define function HHL_simulation()
     # Author: Alain Chancé
@@ -3583,6 +3899,8 @@ class One_Bit_HHL:
         correct_indices = param["correct_indices"]
         hhl_correct_indices = param["hhl_correct_indices"]
         segment_indices = param["segment_indices"]
+        synthesis = param["synthesis"]
+        mcx_mode = param["mcx_mode"]
 
         vector_b = np.ones(len(A))
 
@@ -3599,13 +3917,23 @@ class One_Bit_HHL:
         # Use parameters for simulation with only first 3 layers:
         # - num_time_qubits=1
         # - shots=nshots
+        # - synthesis, mcx_mode: controlled-U synthesis and MCX decomposition
         # https://github.com/Xenofon-Chiotopoulos/OneBQF/blob/main/quantum_algorithms/OneBQF.py
         # https://github.com/Xenofon-Chiotopoulos/OneBQF/blob/main/example.ipynb
         #---------------------------------------------------------------------------------------
-        hhl_solver = onebqf(A, vector_b, num_time_qubits=1, shots=nshots, debug=False)
+        #-----------------------------------------------------------------------------------
+        # OneBQF accepts the sparse Hamiltonian matrix ham.A directly: the extraction of
+        # interaction pairs then scales with the number of non-zeros of A
+        #-----------------------------------------------------------------------------------
+        A_hhl = ham.A if ham is not None and ss.issparse(ham.A) else A
+
+        hhl_solver = onebqf(A_hhl, vector_b, num_time_qubits=1, shots=nshots, debug=False,
+                            synthesis=synthesis, mcx_mode=mcx_mode)
         
         print("\nCreating hhl_solver instance of the HHLAlgorithm as follows:")
         print("Number of time qubits:", hhl_solver.num_time_qubits)
+        print("Controlled-U synthesis:", hhl_solver.synthesis)
+        print("MCX decomposition:", hhl_solver.mcx_mode)
 
         # Build the HHL circuit
         circuit = hhl_solver.build_circuit()
@@ -3664,12 +3992,16 @@ class One_Bit_HHL:
         # Run quantum circuit
         #---------------------
         job_id = param["job_id"]
-        counts = self.run_qc(
-            isa_circuit=isa_circuit,
-            nshots=nshots,
-            job_id=job_id,
-            do_print_counts=do_print_counts
-        )
+        if param["adaptive_shots"] and job_id is None:
+            counts = self.run_qc_adaptive(hhl_solver, isa_circuit=isa_circuit, do_print_counts=do_print_counts)
+        else:
+            counts = self.run_qc(
+                isa_circuit=isa_circuit,
+                nshots=nshots,
+                job_id=job_id,
+                do_print_counts=do_print_counts
+            )
+            param["shots_used"] = nshots if counts is not None else None
 
         if counts is None:
             return None
@@ -3725,7 +4057,7 @@ class One_Bit_HHL:
         # Compute discretized HHL solution and correct indices
         #------------------------------------------------------
         if T_hhl is None:
-            T_hhl = np.min(x_hhl) + 0.2*(np.max(x_hhl) - np.min(x_hhl))
+            _, T_hhl, _ = self.discretize_hhl_solution(x_hhl, total_success)
             print("\nComputed T_hhl:", T_hhl)
         
         disc_x_hhl = (x_hhl > T_hhl).astype(int)
@@ -3741,6 +4073,7 @@ class One_Bit_HHL:
         #------------------------------------------------------------------
         event, hhl_rec_tracks, hhl_good_indices = self.get_tracks_smart(ham, disc_x_hhl)
         param["hhl_rec_event"] = event
+        self.validate_tracks(hhl_rec_tracks, stage="hhl")
 
         #----------------------------------------------------------------------------------
         # Compare good indices of HHL solution and correct indices of classical simulation
@@ -3828,6 +4161,9 @@ class One_Bit_HHL:
         #------------------------------
         OK = True
         if run_on_QPU:
+            # run_qc_adaptive() sums the QPU usage over its jobs, do not re-query only the last one
+            adaptive = self.param["adaptive_shots"] and self.param["job_id"] is None
+
             # Run 1-Bit HHL quantum simulation
             try:
                 self.HHL_simulation()
@@ -3843,7 +4179,7 @@ class One_Bit_HHL:
             # Source: [Green quantum computing, Capgemini, 8 May 2023]
             # (https://www.capgemini.com/insights/expert-perspectives/green-quantum-computing/).
             #------------------------------------------------------------------------------------
-            if OK:
+            if OK and not adaptive:
                 QPU_usage, QPU_power_consumption = self.get_QPU_usage()
 
         #-------------------------
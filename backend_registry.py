@@ -0,0 +1,244 @@
+#---------------------------------------------------------------------------------------
+# Process-wide registry of Qiskit backend objects
+#
+# Building a fake backend, its NoiseModel, an AerSimulator and a preset pass manager
+# takes seconds (NoiseModel.from_backend alone takes several seconds for fake_fez),
+# which dominates sweeps over many small events. The registry builds each object once
+# per process and returns the same instance on every later request:
+#  - QiskitRuntimeService(): instantiated once, a failure is remembered as None
+#  - FakeProviderForBackendV2(): instantiated once
+#  - backends: fake backends from the fake provider, real backends from the service
+#  - noise models: NoiseModel.from_backend(backend), optionally pickled to cache_dir
+#    (fake backends only, since the calibration data of real backends changes)
+#  - simulators: AerSimulator keyed by noise model backend name and run options
+#  - pass managers: generate_preset_pass_manager keyed by target backend and
+#    optimization level
+#
+# Usage:
+#   from backend_registry import backend_registry
+#   simulator = backend_registry.get_simulator("fake_fez", method="statevector")
+#   pm = backend_registry.get_pass_manager(simulator, optimization_level=3)
+#---------------------------------------------------------------------------------------
+
+import os
+import pickle
+import threading
+
+import numpy as np
+
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel
+from qiskit_ibm_runtime import QiskitRuntimeService
+from qiskit_ibm_runtime.fake_provider import FakeProviderForBackendV2
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+
+# Sentinel for "not built yet", since None is a valid cached value for the service
+_MISSING = object()
+
+#---------------------------------------------------------------------------------------
+# AerSimulator execution options
+#  - AER_METHODS: simulation methods accepted by One_Bit_HHL; "auto_select" lets
+#    select_aer_method() pick a method from the circuit width, depth and available RAM
+#  - AER_OPTIONS: AerSimulator options that can be set through aer_options
+# https://qiskit.github.io/qiskit-aer/stubs/qiskit_aer.AerSimulator.html
+#---------------------------------------------------------------------------------------
+AER_METHODS = ("auto_select", "automatic", "statevector", "density_matrix", "matrix_product_state")
+AER_OPTIONS = ("max_parallel_threads", "max_parallel_shots", "max_parallel_experiments",
+               "precision", "fusion_enable", "fusion_threshold", "fusion_max_qubit")
+
+# Safety margin applied to the size of the state, kept from the original check_size() estimate
+AER_MEMORY_MARGIN = 8
+
+# Circuits at least this wide whose depth does not exceed their width are simulated as
+# matrix product states, whose bond dimension stays small for shallow circuits
+MPS_MIN_QUBITS = 24
+
+
+def aer_memory_required(num_qubits, method="statevector", precision="double"):
+    """
+    Returns the memory in GB required to simulate num_qubits qubits with the given method,
+    or None if it cannot be estimated from the width alone (matrix_product_state).
+    """
+    itemsize = np.dtype(np.complex64 if precision == "single" else np.complex128).itemsize
+    if method == "density_matrix":
+        size = 4**num_qubits
+    elif method in ("statevector", "automatic"):
+        size = 2**num_qubits
+    else:
+        return None
+    return AER_MEMORY_MARGIN*itemsize*size/10**9
+
+
+def select_aer_method(num_qubits, depth, noisy=False, shots=1, mem_avail=None, precision="double"):
+    """
+    Picks the AerSimulator method expected to be fastest for a circuit.
+
+      - density_matrix for noisy circuits when 2**num_qubits <= shots and the density matrix fits
+        in memory: one 4**n evolution then costs less than shots noisy 2**n trajectories
+      - matrix_product_state for wide shallow circuits (num_qubits >= MPS_MIN_QUBITS and
+        depth <= num_qubits) or when the statevector does not fit in memory
+      - statevector otherwise
+
+    Args:
+        mem_avail (float): available memory in GB, None: unlimited
+
+    Returns the method and the reason for the choice.
+    """
+    def fits(method):
+        return mem_avail is None or aer_memory_required(num_qubits, method, precision) <= mem_avail
+
+    if noisy and 2**num_qubits <= shots and fits("density_matrix"):
+        return "density_matrix", f"noisy circuit with 2**{num_qubits} <= {shots} shots"
+    if not fits("statevector"):
+        return "matrix_product_state", f"statevector of {num_qubits} qubits does not fit in memory"
+    if num_qubits >= MPS_MIN_QUBITS and depth <= num_qubits:
+        return "matrix_product_state", f"shallow circuit: depth {depth} <= {num_qubits} qubits"
+    return "statevector", f"statevector of {num_qubits} qubits fits in memory"
+
+
+class BackendRegistry:
+    """
+    Memoizes QiskitRuntimeService, fake provider, backends, noise models, AerSimulator
+    instances and preset pass managers for the lifetime of the process.
+
+    Args:
+        cache_dir (str): directory where noise models of fake backends are pickled.
+                         None: no disk cache.
+    """
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._lock = threading.RLock()
+        self._service = _MISSING
+        self._fake_provider = None
+        self._backends = {}
+        self._noise_models = {}
+        self._simulators = {}
+        self._pass_managers = {}
+
+    #-------------------------------------------------------------------------------
+    # Qiskit Runtime service and fake provider
+    #-------------------------------------------------------------------------------
+    def get_service(self, retry=False):
+        """
+        Returns the QiskitRuntimeService instance, or None if it cannot be created.
+        A failed instantiation is not retried unless retry is True.
+        """
+        with self._lock:
+            if self._service is _MISSING or (retry and self._service is None):
+                try:
+                    self._service = QiskitRuntimeService()
+                except Exception as e:
+                    print(f"Error creating an instance of QiskitRuntimeService(): {e}")
+                    self._service = None
+            return self._service
+
+    def get_fake_provider(self):
+        with self._lock:
+            if self._fake_provider is None:
+                self._fake_provider = FakeProviderForBackendV2()
+            return self._fake_provider
+
+    #-------------------------------------------------------------------------------
+    # Backends and noise models
+    #-------------------------------------------------------------------------------
+    def get_backend(self, backend_name):
+        """
+        Returns the backend named backend_name: a fake backend if the name starts with "fake",
+        otherwise the real backend from the Qiskit Runtime service.
+        Raises ValueError if the backend cannot be found.
+        """
+        with self._lock:
+            if backend_name not in self._backends:
+                if backend_name[:4] == "fake":
+                    backend = self.get_fake_provider().backend(backend_name)
+                else:
+                    service = self.get_service()
+                    if service is None:
+                        raise ValueError(f"Cannot get backend {backend_name}: QiskitRuntimeService is not available")
+                    backend = service.backend(backend_name)
+                self._backends[backend_name] = backend
+            return self._backends[backend_name]
+
+    def _noise_model_file(self, backend_name):
+        if self.cache_dir is None or backend_name[:4] != "fake":
+            return None
+        return os.path.join(self.cache_dir, f"noise_model_{backend_name}.pkl")
+
+    def get_noise_model(self, backend_name):
+        """
+        Returns NoiseModel.from_backend() for the backend named backend_name.
+        For fake backends, the noise model is read from and written to cache_dir if it is set.
+        """
+        with self._lock:
+            if backend_name in self._noise_models:
+                return self._noise_models[backend_name]
+
+            noise_model = None
+            path = self._noise_model_file(backend_name)
+            if path is not None and os.path.isfile(path):
+                try:
+                    with open(path, "rb") as f:
+                        noise_model = pickle.load(f)
+                except Exception as e:
+                    print(f"Error loading noise model from {path}: {e}")
+                    noise_model = None
+
+            if noise_model is None:
+                noise_model = NoiseModel.from_backend(self.get_backend(backend_name))
+                if path is not None:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "wb") as f:
+                        pickle.dump(noise_model, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_path, path)
+
+            self._noise_models[backend_name] = noise_model
+            return noise_model
+
+    #-------------------------------------------------------------------------------
+    # Simulators and pass managers
+    #-------------------------------------------------------------------------------
+    def get_simulator(self, backend_name=None, **options):
+        """
+        Returns an AerSimulator with the noise model of backend_name (None: noiseless)
+        and the run options given as keyword arguments, e.g. method="statevector".
+        """
+        key = (backend_name, tuple(sorted(options.items())))
+        with self._lock:
+            if key not in self._simulators:
+                if backend_name is None:
+                    simulator = AerSimulator(**options)
+                else:
+                    simulator = AerSimulator(noise_model=self.get_noise_model(backend_name), **options)
+                self._simulators[key] = simulator
+            return self._simulators[key]
+
+    def get_pass_manager(self, backend, optimization_level=1):
+        """
+        Returns generate_preset_pass_manager(backend=backend, optimization_level=optimization_level).
+        Pass managers are keyed by the identity of backend, which is kept alive by the registry.
+        """
+        key = (id(backend), optimization_level)
+        with self._lock:
+            entry = self._pass_managers.get(key)
+            if entry is None or entry[0] is not backend:
+                pm = generate_preset_pass_manager(backend=backend, optimization_level=optimization_level)
+                entry = (backend, pm)
+                self._pass_managers[key] = entry
+            return entry[1]
+
+    def clear(self):
+        """
+        Forgets all cached objects. Pickled noise models in cache_dir are kept.
+        """
+        with self._lock:
+            self._service = _MISSING
+            self._fake_provider = None
+            self._backends.clear()
+            self._noise_models.clear()
+            self._simulators.clear()
+            self._pass_managers.clear()
+
+
+# Process-wide registry shared by One_Bit_HHL and OneBQF
+backend_registry = BackendRegistry()
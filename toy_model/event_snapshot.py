@@ -0,0 +1,409 @@
+"""
+Columnar event snapshots.
+
+A snapshot written by ``velo_workflow generate`` holds the parameters of one combo,
+the truth and noisy events, the reconstructed tracks, the Hamiltonian and its
+solutions. Instead of pickling the object graphs, ``save_snapshot`` flattens them
+into arrays stored in one compressed NPZ file:
+
+    params_json                 JSON of the params dict
+    geometry_json               geometry class name and dataclass fields
+    hit_id, hit_x, hit_y, hit_z, hit_module_id, hit_track_id, hit_index
+                                one row per distinct Hit object (shared by all parts)
+    <part>_hits                 rows of event.hits in the hit table
+    <part>_ghost_hits           rows of event.ghost_hits
+    <part>_seg_hits, <part>_seg_ids
+                                (n, 2) hit rows and segment ids of event.segments
+    <part>_track_ids            track ids
+    <part>_track_hit_offsets, <part>_track_hit_rows
+                                track -> hit incidence (CSR)
+    <part>_tseg_offsets, <part>_tseg_hits, <part>_tseg_ids
+                                segments of each track (CSR)
+    ham_A_data, ham_A_indices, ham_A_indptr, ham_A_shape
+                                Hamiltonian matrix A in CSR arrays
+    ham_b, ham_seg_hits, ham_seg_ids, ham_group_boundaries, ham_coefficients
+    classical_solution, disc_solution
+
+with <part> one of ``truth`` and ``noisy`` for events, and ``reco`` for the
+reconstructed tracks (the reconstructed event is rebuilt from them with
+``construct_event``, as in ``run_one``). Modules are rebuilt from the geometry
+and the event hits.
+
+``load_snapshot`` returns a ``Snapshot``, a read-only mapping with the same keys
+as the pickled payload. Arrays are read from the NPZ file on first access and
+Event, Track and SimpleHamiltonianFast objects are rebuilt only when requested,
+so reading ``params`` or the solutions never touches the event arrays.
+
+``convert_pickle_snapshot`` converts an existing ``.pkl.gz`` snapshot.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+import dataclasses
+import gzip
+import json
+import os
+from pathlib import Path
+import socket
+
+import numpy as np
+import scipy.sparse as sp
+
+from toy_model import state_event_model
+from toy_model.state_event_model import Event, Hit, Module, Segment, Track
+from toy_model.simple_hamiltonian import SegmentTable, SimpleHamiltonianFast, construct_event
+
+SNAPSHOT_SUFFIX = ".npz"
+
+# Payload keys rebuilt from arrays, in the order of the pickled payload
+PAYLOAD_KEYS = (
+    "params", "truth_event", "noisy_event", "reco_tracks", "reco_event",
+    "classical_solution", "disc_solution", "hamiltonian",
+)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+# =====================================================================
+# Writer
+# =====================================================================
+
+class _HitTable:
+    """Assigns one row to every distinct Hit object, by identity."""
+
+    def __init__(self):
+        self.rows = {}
+        self.hits = []
+
+    def row(self, hit: Hit) -> int:
+        key = id(hit)
+        r = self.rows.get(key)
+        if r is None:
+            r = len(self.hits)
+            self.rows[key] = r
+            self.hits.append(hit)
+        return r
+
+    def rows_of(self, hits) -> np.ndarray:
+        rows = self.rows
+        try:
+            # Fast path: all the hits already have a row
+            return np.array([rows[id(h)] for h in hits], dtype=np.int64)
+        except KeyError:
+            return np.array([self.row(h) for h in hits], dtype=np.int64)
+
+    def seg_rows(self, segments) -> np.ndarray:
+        rows = self.rows
+        try:
+            seg_rows = [(rows[id(s.hits[0])], rows[id(s.hits[1])]) for s in segments]
+        except KeyError:
+            seg_rows = [(self.row(s.hits[0]), self.row(s.hits[1])) for s in segments]
+        return np.array(seg_rows, dtype=np.int64).reshape(-1, 2)
+
+    def arrays(self) -> dict:
+        hits = self.hits
+        return {
+            "hit_id": np.array([h.hit_id for h in hits], dtype=np.int64),
+            "hit_x": np.array([h.x for h in hits], dtype=np.float64),
+            "hit_y": np.array([h.y for h in hits], dtype=np.float64),
+            "hit_z": np.array([h.z for h in hits], dtype=np.float64),
+            "hit_module_id": np.array([h.module_id for h in hits], dtype=np.int64),
+            "hit_track_id": np.array([h.track_id for h in hits], dtype=np.int64),
+            "hit_index": np.array([getattr(h, "index", 0) for h in hits], dtype=np.int64),
+        }
+
+
+def _tracks_arrays(prefix: str, tracks, table: _HitTable) -> dict:
+    hit_offsets = [0]
+    hit_rows = []
+    seg_offsets = [0]
+    seg_hits = []
+    seg_ids = []
+    row = table.row
+    for t in tracks:
+        hit_rows.extend(map(row, t.hits))
+        hit_offsets.append(len(hit_rows))
+        seg_hits.extend((row(s.hits[0]), row(s.hits[1])) for s in t.segments)
+        seg_ids.extend(s.segment_id for s in t.segments)
+        seg_offsets.append(len(seg_ids))
+    return {
+        f"{prefix}_track_ids": np.array([t.track_id for t in tracks], dtype=np.int64),
+        f"{prefix}_track_hit_offsets": np.array(hit_offsets, dtype=np.int64),
+        f"{prefix}_track_hit_rows": np.array(hit_rows, dtype=np.int64),
+        f"{prefix}_tseg_offsets": np.array(seg_offsets, dtype=np.int64),
+        f"{prefix}_tseg_hits": np.array(seg_hits, dtype=np.int64).reshape(-1, 2),
+        f"{prefix}_tseg_ids": np.array(seg_ids, dtype=np.int64),
+    }
+
+
+def _event_arrays(prefix: str, event: Event, table: _HitTable) -> dict:
+    arrays = {
+        f"{prefix}_hits": table.rows_of(event.hits),
+        f"{prefix}_ghost_hits": table.rows_of(event.ghost_hits or []),
+        f"{prefix}_seg_hits": table.seg_rows(event.segments),
+        f"{prefix}_seg_ids": np.array([s.segment_id for s in event.segments], dtype=np.int64),
+    }
+    arrays.update(_tracks_arrays(prefix, event.tracks, table))
+    return arrays
+
+
+def _geometry_json(geometry) -> str:
+    return json.dumps(
+        {"class": type(geometry).__name__, "fields": dataclasses.asdict(geometry)},
+        default=_json_default,
+    )
+
+
+def _hamiltonian_arrays(ham: SimpleHamiltonianFast, table: _HitTable) -> dict:
+    A = sp.csr_matrix(ham.A)
+    st = ham.segment_table
+    if st is None:
+        seg_hits = np.zeros((0, 2), dtype=np.int64)
+        seg_ids = np.zeros(0, dtype=np.int64)
+        boundaries = np.zeros(1, dtype=np.int64)
+    else:
+        rows = table.rows_of(st.hits)
+        seg_hits = np.stack([rows[st.from_rows], rows[st.to_rows]], axis=1)
+        seg_ids = st.segment_ids
+        boundaries = st.group_offsets
+    return {
+        "ham_coefficients": np.array([ham.epsilon, ham.gamma, ham.delta, ham.theta_d], dtype=np.float64),
+        "ham_A_data": A.data,
+        "ham_A_indices": A.indices,
+        "ham_A_indptr": A.indptr,
+        "ham_A_shape": np.array(A.shape, dtype=np.int64),
+        "ham_b": np.asarray(ham.b, dtype=np.float64),
+        "ham_seg_hits": seg_hits,
+        "ham_seg_ids": np.asarray(seg_ids, dtype=np.int64),
+        "ham_group_boundaries": np.asarray(boundaries, dtype=np.int64),
+    }
+
+
+def snapshot_arrays(payload: dict) -> dict:
+    """
+    Flattens a payload built by ``run_one`` into the arrays of an NPZ snapshot.
+    Only truth_event and noisy_event are required; other keys are stored when present.
+    """
+    table = _HitTable()
+    truth = payload["truth_event"]
+    noisy = payload["noisy_event"]
+
+    arrays = {
+        "params_json": np.array(json.dumps(payload.get("params", {}), default=_json_default)),
+        "geometry_json": np.array(_geometry_json(truth.detector_geometry)),
+    }
+    arrays.update(_event_arrays("truth", truth, table))
+    arrays.update(_event_arrays("noisy", noisy, table))
+    arrays.update(_tracks_arrays("reco", payload.get("reco_tracks") or [], table))
+    if payload.get("hamiltonian") is not None:
+        arrays.update(_hamiltonian_arrays(payload["hamiltonian"], table))
+    for key in ("classical_solution", "disc_solution"):
+        if payload.get(key) is not None:
+            arrays[key] = np.asarray(payload[key])
+    arrays.update(table.arrays())
+    return arrays
+
+
+def save_snapshot(payload: dict, path: Path) -> Path:
+    """
+    Writes the payload built by ``run_one`` as a compressed NPZ snapshot.
+    The file is written to a temporary name and renamed, so readers never see a partial file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = snapshot_arrays(payload)
+
+    # Per-process temporary name: concurrent writers of the same snapshot do not collide
+    tmp = path.with_name(path.name + f".{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    tmp.replace(path)
+    return path
+
+
+# =====================================================================
+# Lazy loader
+# =====================================================================
+
+class Snapshot(Mapping):
+    """
+    Read-only mapping view of an NPZ snapshot with the keys of the pickled payload.
+    Objects are rebuilt on first access and cached; all Event and Track objects of
+    one snapshot share the same Hit objects, as in the generator.
+
+    arrays, a mapping of array names to arrays as returned by snapshot_arrays(),
+    replaces the NPZ file, e.g. for entries of a memory-mapped event store.
+    """
+
+    def __init__(self, path: Path = None, arrays: Mapping = None):
+        self.path = Path(path) if path is not None else None
+        self._npz = np.load(self.path, allow_pickle=False) if arrays is None else arrays
+        self._files = set(self._npz.files if arrays is None else arrays.keys())
+        self._cache = {}
+
+    # Mapping interface -------------------------------------------------
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if key not in self:
+                raise KeyError(key)
+            self._cache[key] = getattr(self, f"_build_{key}")()
+        return self._cache[key]
+
+    def __contains__(self, key):
+        if key == "hamiltonian":
+            return "ham_A_data" in self._files
+        if key in ("classical_solution", "disc_solution"):
+            return key in self._files
+        if key in ("reco_tracks", "reco_event"):
+            return "reco_track_ids" in self._files
+        return key in PAYLOAD_KEYS
+
+    def __iter__(self):
+        return (k for k in PAYLOAD_KEYS if k in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def close(self):
+        if hasattr(self._npz, "close"):
+            self._npz.close()
+
+    def array(self, name: str) -> np.ndarray:
+        """Raw array stored under name, e.g. 'hit_x' or 'reco_track_hit_rows'."""
+        return self._npz[name]
+
+    # Builders ------------------------------------------------------------
+    def _build_params(self):
+        return json.loads(str(self._npz["params_json"]))
+
+    def _build_classical_solution(self):
+        return self._npz["classical_solution"]
+
+    def _build_disc_solution(self):
+        return self._npz["disc_solution"]
+
+    def _geometry(self):
+        if "geometry" not in self._cache:
+            spec = json.loads(str(self._npz["geometry_json"]))
+            cls = getattr(state_event_model, spec["class"])
+            self._cache["geometry"] = cls(**spec["fields"])
+        return self._cache["geometry"]
+
+    def _hits(self) -> list:
+        if "hits" not in self._cache:
+            z = self._npz
+            hits = []
+            for hit_id, x, y, hz, module_id, track_id, index in zip(
+                z["hit_id"].tolist(), z["hit_x"].tolist(), z["hit_y"].tolist(), z["hit_z"].tolist(),
+                z["hit_module_id"].tolist(), z["hit_track_id"].tolist(), z["hit_index"].tolist(),
+            ):
+                h = Hit(hit_id=hit_id, x=x, y=y, z=hz, module_id=module_id, track_id=track_id)
+                h.index = index
+                hits.append(h)
+            self._cache["hits"] = hits
+        return self._cache["hits"]
+
+    def _segments(self, seg_hits: np.ndarray, seg_ids: np.ndarray) -> list:
+        hits = self._hits()
+        return [Segment([hits[a], hits[b]], sid) for (a, b), sid in zip(seg_hits.tolist(), seg_ids.tolist())]
+
+    def _tracks(self, prefix: str) -> list:
+        z = self._npz
+        hits = self._hits()
+        hit_offsets = z[f"{prefix}_track_hit_offsets"].tolist()
+        hit_rows = z[f"{prefix}_track_hit_rows"].tolist()
+        seg_offsets = z[f"{prefix}_tseg_offsets"].tolist()
+        segments = self._segments(z[f"{prefix}_tseg_hits"], z[f"{prefix}_tseg_ids"])
+        tracks = []
+        for k, track_id in enumerate(z[f"{prefix}_track_ids"].tolist()):
+            track_hits = [hits[r] for r in hit_rows[hit_offsets[k]:hit_offsets[k + 1]]]
+            tracks.append(Track(track_id, track_hits, segments[seg_offsets[k]:seg_offsets[k + 1]]))
+        return tracks
+
+    def _event(self, prefix: str) -> Event:
+        z = self._npz
+        hits = self._hits()
+        geometry = self._geometry()
+        event_hits = [hits[r] for r in z[f"{prefix}_hits"].tolist()]
+        modules = []
+        for mod_id, lx, ly, zpos in geometry:
+            modules.append(Module(mod_id, zpos, lx, ly, [h for h in event_hits if h.module_id == mod_id]))
+        return Event(
+            geometry,
+            self._tracks(prefix),
+            event_hits,
+            self._segments(z[f"{prefix}_seg_hits"], z[f"{prefix}_seg_ids"]),
+            modules,
+            [hits[r] for r in z[f"{prefix}_ghost_hits"].tolist()],
+        )
+
+    def _build_truth_event(self):
+        return self._event("truth")
+
+    def _build_noisy_event(self):
+        return self._event("noisy")
+
+    def _build_reco_tracks(self):
+        return self._tracks("reco")
+
+    def _build_reco_event(self):
+        rec_tracks = self["reco_tracks"]
+        geometry = self._geometry()
+        return construct_event(
+            geometry,
+            rec_tracks,
+            [t.hits for t in rec_tracks],
+            [t.segments for t in rec_tracks],
+            geometry.module_id,
+        )
+
+    def _build_hamiltonian(self):
+        z = self._npz
+        epsilon, gamma, delta, theta_d = z["ham_coefficients"].tolist()
+        ham = SimpleHamiltonianFast(epsilon=epsilon, gamma=gamma, delta=delta, theta_d=theta_d)
+        ham.A = sp.csr_matrix(
+            (z["ham_A_data"], z["ham_A_indices"], z["ham_A_indptr"]), shape=tuple(z["ham_A_shape"])
+        ).tocsc()
+        ham.b = z["ham_b"]
+
+        seg_hits = z["ham_seg_hits"].reshape(-1, 2)
+        ham.set_segment_table(SegmentTable(
+            self._hits(), seg_hits[:, 0], seg_hits[:, 1], z["ham_group_boundaries"], segment_ids=z["ham_seg_ids"],
+        ))
+        return ham
+
+
+def load_snapshot(path: Path) -> Snapshot:
+    """Opens an NPZ snapshot; objects are rebuilt lazily on access."""
+    return Snapshot(path)
+
+
+# =====================================================================
+# Converter for dill + gzip snapshots
+# =====================================================================
+
+def convert_pickle_snapshot(src: Path, dst: Path = None) -> Path:
+    """
+    Converts an ``events_*.pkl.gz`` snapshot to NPZ. The default destination
+    replaces the ``.pkl.gz`` suffix by ``.npz`` in the same folder.
+    """
+    try:
+        import dill as _pickle
+    except ImportError:  # pragma: no cover
+        import pickle as _pickle
+
+    src = Path(src)
+    if dst is None:
+        name = src.name[: -len(".pkl.gz")] if src.name.endswith(".pkl.gz") else src.stem
+        dst = src.with_name(name + SNAPSHOT_SUFFIX)
+    with gzip.open(src, "rb") as f:
+        payload = _pickle.load(f)
+    return save_snapshot(payload, dst)
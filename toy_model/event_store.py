@@ -0,0 +1,259 @@
+"""
+Memory-mapped event store written by ``velo_workflow aggregate``.
+
+An event store is a directory of immutable parts; each aggregate run writes one
+new part. A part is a directory of ``.npy`` files opened with ``mmap_mode="r"``:
+
+    table.npy                   structured array, one row per entry:
+                                  key, file, job (fixed-length strings),
+                                  p_<name> and m_<name> (float64) for every
+                                  numeric param and metric (NaN if missing)
+    blocks/<name>.npy           variable-length blocks of all entries, concatenated
+    blocks/<name>.offsets.npy   entry i owns rows offsets[i]:offsets[i + 1]
+    blocks/<name>.present.npy   whether entry i has a block <name>
+    meta.json                   number of entries and the dtype of each block
+
+Blocks hold ``params_json`` and ``metrics_json`` (UTF-8 bytes) for every entry and,
+for entries stored with --store-full, the arrays of ``event_snapshot.snapshot_arrays``
+for the truth and noisy events and the reconstructed tracks. Row indices inside a
+block are local to the entry, so one entry is rebuilt from its own slices only.
+
+``EventStore`` opens all parts; when several parts hold the same key, the latest
+wins. Reading one entry touches only the pages of its slices, and the files can be
+opened read-only by any number of analysis processes, which share the page cache.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+import json
+from pathlib import Path
+
+import numpy as np
+
+from toy_model import event_snapshot
+from toy_model.state_event_model import Event
+
+STRING_BLOCKS = ("params_json", "metrics_json", "geometry_json")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (bool, int, float, np.bool_, np.integer, np.floating))
+
+
+# =====================================================================
+# Writer
+# =====================================================================
+
+def _entry_blocks(entry: dict) -> dict:
+    blocks = {
+        "params_json": json.dumps(entry.get("params", {}), default=event_snapshot._json_default),
+        "metrics_json": json.dumps(entry.get("metrics", {}), default=event_snapshot._json_default),
+    }
+    truth, noisy, reco = entry.get("truth"), entry.get("noisy"), entry.get("reco")
+    if truth is not None and noisy is not None:
+        rec_tracks = reco.tracks if isinstance(reco, Event) else (reco or [])
+        arrays = event_snapshot.snapshot_arrays(
+            {"truth_event": truth, "noisy_event": noisy, "reco_tracks": rec_tracks}
+        )
+        arrays.pop("params_json")
+        arrays["geometry_json"] = str(arrays["geometry_json"])
+        blocks.update(arrays)
+    return blocks
+
+
+def write_event_store_part(store_dir: Path, entries: list) -> Path:
+    """
+    Writes a new part of the event store in store_dir.
+
+    entries is a list of (key, job, file, entry) where entry is the dict built by
+    aggregate: {"params", "metrics"} and optionally {"truth", "noisy", "reco"}.
+    Returns the part directory. The part is written under a temporary name and
+    renamed, so readers never see a partial part.
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    existing = sorted(p.name for p in store_dir.glob("part_*") if p.is_dir())
+    part_id = int(existing[-1][5:]) + 1 if existing else 0
+    part_dir = store_dir / f"part_{part_id:05d}"
+    tmp_dir = store_dir / f".tmp_part_{part_id:05d}"
+    (tmp_dir / "blocks").mkdir(parents=True, exist_ok=True)
+
+    n = len(entries)
+
+    # Fixed-dtype table of numeric params and metrics
+    p_names, m_names = [], []
+    for _, _, _, entry in entries:
+        for k, v in entry.get("params", {}).items():
+            if _is_number(v) and k not in p_names:
+                p_names.append(k)
+        metrics = entry.get("metrics", {})
+        if isinstance(metrics, dict):
+            for k, v in metrics.items():
+                if _is_number(v) and k not in m_names:
+                    m_names.append(k)
+
+    str_len = lambda values: max([1] + [len(str(v)) for v in values])
+    dtype = [
+        ("key", f"U{str_len(e[0] for e in entries)}"),
+        ("job", f"U{str_len(e[1] for e in entries)}"),
+        ("file", f"U{str_len(e[2] for e in entries)}"),
+    ]
+    dtype += [(f"p_{k}", np.float64) for k in p_names]
+    dtype += [(f"m_{k}", np.float64) for k in m_names]
+    table = np.zeros(n, dtype=dtype)
+    for i, (key, job, fname, entry) in enumerate(entries):
+        table["key"][i], table["job"][i], table["file"][i] = key, job, fname
+        params = entry.get("params", {})
+        metrics = entry.get("metrics", {}) if isinstance(entry.get("metrics"), dict) else {}
+        for k in p_names:
+            table[f"p_{k}"][i] = float(params[k]) if _is_number(params.get(k)) else np.nan
+        for k in m_names:
+            table[f"m_{k}"][i] = float(metrics[k]) if _is_number(metrics.get(k)) else np.nan
+    np.save(tmp_dir / "table.npy", table)
+
+    # Variable-length blocks
+    per_entry = [_entry_blocks(entry) for _, _, _, entry in entries]
+    names = []
+    for blocks in per_entry:
+        names.extend(k for k in blocks if k not in names)
+
+    meta = {"n": n, "blocks": {}}
+    for name in names:
+        parts = []
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        present = np.zeros(n, dtype=bool)
+        for i, blocks in enumerate(per_entry):
+            value = blocks.get(name)
+            if value is None:
+                arr = None
+            elif isinstance(value, str):
+                arr = np.frombuffer(value.encode("utf-8"), dtype=np.uint8)
+            else:
+                arr = np.asarray(value)
+                if arr.ndim == 0:
+                    arr = arr.reshape(1)
+            if arr is not None:
+                present[i] = True
+                parts.append(arr)
+            offsets[i + 1] = offsets[i] + (len(arr) if arr is not None else 0)
+        data = np.concatenate(parts) if parts else np.zeros(0)
+        np.save(tmp_dir / "blocks" / f"{name}.npy", data)
+        np.save(tmp_dir / "blocks" / f"{name}.offsets.npy", offsets)
+        np.save(tmp_dir / "blocks" / f"{name}.present.npy", present)
+        meta["blocks"][name] = {"dtype": data.dtype.str, "string": name in STRING_BLOCKS}
+
+    (tmp_dir / "meta.json").write_text(json.dumps(meta))
+    tmp_dir.rename(part_dir)
+    return part_dir
+
+
+# =====================================================================
+# Reader
+# =====================================================================
+
+class _Part:
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        self.table = np.load(path / "table.npy", mmap_mode="r")
+        self._blocks = {}
+
+    def block(self, name: str):
+        if name not in self._blocks:
+            d = self.path / "blocks"
+            self._blocks[name] = (
+                np.load(d / f"{name}.npy", mmap_mode="r"),
+                np.load(d / f"{name}.offsets.npy", mmap_mode="r"),
+                np.load(d / f"{name}.present.npy", mmap_mode="r"),
+            )
+        return self._blocks[name]
+
+    def entry_arrays(self, row: int) -> dict:
+        arrays = {}
+        for name, info in self.meta["blocks"].items():
+            data, offsets, present = self.block(name)
+            if not present[row]:
+                continue
+            value = data[offsets[row]:offsets[row + 1]]
+            if info["string"]:
+                value = np.array(bytes(value).decode("utf-8"))
+            arrays[name] = value
+        return arrays
+
+
+class StoreEntry(Mapping):
+    """
+    One entry of the event store with the keys of the pickled store:
+    params and metrics, and truth, noisy and reco if the entry was stored in full.
+    Events are rebuilt on first access.
+    """
+
+    def __init__(self, arrays: dict):
+        self._arrays = arrays
+        self._snapshot = None
+        self._keys = ["params", "metrics"]
+        if "truth_hits" in arrays:
+            self._keys += ["truth", "noisy", "reco"]
+
+    def __getitem__(self, key):
+        if key == "params":
+            return json.loads(str(self._arrays["params_json"]))
+        if key == "metrics":
+            return json.loads(str(self._arrays["metrics_json"]))
+        if key in ("truth", "noisy", "reco") and key in self._keys:
+            if self._snapshot is None:
+                self._snapshot = event_snapshot.Snapshot(arrays=self._arrays)
+            return self._snapshot[{"truth": "truth_event", "noisy": "noisy_event", "reco": "reco_event"}[key]]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class EventStore(Mapping):
+    """
+    Read-only, memory-mapped view of an event store directory, keyed by "<job>/<file>".
+
+    store.table(i) gives the numeric table of part i; store.tables() concatenates
+    the numeric tables of all parts (latest entry per key) into a DataFrame.
+    """
+
+    def __init__(self, store_dir: Path):
+        self.path = Path(store_dir)
+        self.parts = [_Part(p) for p in sorted(self.path.glob("part_*")) if p.is_dir()]
+        self._index = {}
+        for part_id, part in enumerate(self.parts):
+            for row, key in enumerate(part.table["key"]):
+                self._index[str(key)] = (part_id, row)
+
+    def __getitem__(self, key) -> StoreEntry:
+        part_id, row = self._index[key]
+        return StoreEntry(self.parts[part_id].entry_arrays(row))
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def table(self, part_id: int = -1) -> np.ndarray:
+        return self.parts[part_id].table
+
+    def tables(self):
+        """Numeric table of the latest entry of every key, as a pandas DataFrame."""
+        import pandas as pd
+
+        frames = []
+        for part_id, part in enumerate(self.parts):
+            rows = [row for key, (pid, row) in self._index.items() if pid == part_id]
+            if rows:
+                frames.append(pd.DataFrame(np.asarray(part.table[np.sort(rows)])))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def open_event_store(store_dir: Path) -> EventStore:
+    return EventStore(store_dir)
@@ -1,6 +1,7 @@
 import numpy as np
 import toy_model.state_event_model as em
 import dataclasses
+import gc
 from itertools import count
 
 @dataclasses.dataclass(frozen=True)
@@ -16,6 +17,19 @@ class SimpleDetectorGeometry:
     def __len__(self):
         return len(self.module_id)
 
+    def point_on_bulk(self, state: dict):
+        return bool(self.points_on_bulk(state['x'], state['y']))
+
+    def points_on_bulk(self, x, y):
+        """
+        Checks which points (x, y) are within at least one module, lx and ly being the full sizes.
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        mask = np.zeros(np.broadcast_shapes(x.shape, y.shape), dtype=bool)
+        for lx, ly in set(zip(self.lx, self.ly)):
+            mask |= (np.abs(x) < lx / 2) & (np.abs(y) < ly / 2)
+        return mask
+
 @dataclasses.dataclass()
 class MultiScatteringGenerator:
     detector_geometry   : SimpleDetectorGeometry
@@ -25,6 +39,8 @@ class MultiScatteringGenerator:
     theta_min           : float = 0.0
     theta_max           : float = np.pi/10
     rng                 : np.random.Generator = np.random.default_rng()
+    resolution          : float = 1e-5      # Hit resolution (sigma), of order 10 microns
+    mc_info             : list = dataclasses.field(default_factory=list)
     #ToDo : Fix the divergence angles
     theta_divergence = np.pi/20
     phi_divergence = np.pi/20
@@ -43,98 +59,108 @@ class MultiScatteringGenerator:
     
     #ToDo: Fix events naming
     def generate_event(self, n_particles, n_events=1, sigma=(0,0,0), defined_primary_vertex=None):
+        """
+        Generates n_events events of n_particles tracks from the primary vertices.
+
+        The tracks of an event are propagated through all the modules at once: the
+        scattering angles of every track at every module are drawn as one array and
+        accumulate along the track, the positions at the modules are cumulative sums of
+        the straight segments in between, and the hits (with resolution noise) are built
+        in bulk from the acceptance mask. A track that turns backwards (vz <= 0) reaches
+        no further module.
+
+        Returns an em.Event, or a list of em.Event if n_events > 1. The MC truth of each
+        event (primary vertex, phi and theta before each module and after the last one,
+        flight parameter t to each module) is appended to self.mc_info.
+        """
+        geometry = self.detector_geometry
+        module_ids = np.asarray(geometry.module_id)
+        zm = np.asarray(geometry.z, dtype=float)
+        half_lx = np.asarray(geometry.lx, dtype=float) / 2
+        half_ly = np.asarray(geometry.ly, dtype=float) / 2
+        n_modules = len(module_ids)
         hit_id_counter = count()
         all_events = []
 
         for event_index in range(n_events):
-            
+
             if defined_primary_vertex is not None:
                 primary_vertex = defined_primary_vertex[event_index]
-            elif defined_primary_vertex is None:
-                primary_vertex = (0,0,0)
+            elif any(sigma):
+                primary_vertex = self.generate_random_primary_vertices(1, sigma)[0]
             else:
-                primary_vertex = self.generate_random_primary_vertices(1,sigma)[0]
-
-            mc_info = []
-
-            hits_per_module = [[] for _ in range(len(self.detector_geometry.module_id))]
-            hits_per_track = []
+                primary_vertex = (0, 0, 0)
 
             pvx, pvy, pvz = primary_vertex
             self.primary_vertices.append((pvx, pvy, pvz))
 
-            for track_id in range(n_particles):
-                phi = self.rng.uniform(self.phi_min, self.phi_max)
-                cos_theta = self.rng.uniform(np.cos(self.theta_max), np.cos(self.theta_min))
-                theta = np.arccos(cos_theta)
-                sin_theta = np.sin(theta)
-
-                vx, vy, vz = self.find_vs(theta, phi)
-
-                track_hits = []
-                zs = [pvz]
-                x_hits = [pvx]
-                y_hits = [pvy]
-                vxs = [vx]
-                vys = [vy]
-                vzs = [vz]
-                ts = [0]
-                thetas = [theta]
-                phis = [phi]
-                ts = []
-
-                for idx, (module_id, zm, lx, ly) in enumerate(
-                        zip(self.detector_geometry.module_id, self.detector_geometry.z, self.detector_geometry.lx,
-                            self.detector_geometry.ly)):
-                    
-                    t = (zm - zs[idx]) / vz
-                    ts.append(t)
-                    zs.append(zm)
-
-                    x_hits.append(x_hits[idx] + vxs[idx] * t)
-                    y_hits.append(y_hits[idx] + vys[idx] * t)
-                    # ToDo: Name resolution noise a parameter of order 10 microns
-
-                    #ToDo: Impliment as x,y scattering - Marcel to send specification
-                    additional_cos_phi = self.rng.normal(0, self.phi_divergence)
-                    additional_cos_theta = self.rng.normal(0, self.theta_divergence)
-                    additional_phi = np.arccos(additional_cos_phi)
-                    additional_theta = np.arccos(additional_cos_theta)
-
-                    phis.append(phi + additional_phi)
-                    thetas.append(theta + additional_theta)
-
-                    vx, vy, vz = self.find_vs(thetas[idx+1], phis[idx+1])
-                    vxs.append(vx)
-                    vys.append(vy)
-                    vzs.append(vz)
-
-            
-                   
-                    if np.abs(x_hits[idx+1]) < lx / 2 and np.abs(y_hits[idx+1]) < ly / 2: 
-                        hit = em.Hit(next(hit_id_counter), x_hits[idx+1] + self.rng.normal(0, 1e-5), y_hits[idx+1] + self.rng.normal(0, 1e-5), zm, module_id, track_id)
-                        hits_per_module[idx].append(hit)
-                        track_hits = [em.Hit(next(hit_id_counter),x + self.rng.normal(0, 1e-5), y + self.rng.normal(0, 1e-5), z, module_id, track_id) for x, y, z in zip(x_hits[1:], y_hits[1:], zs[1:])]
-                hits_per_track.append(track_hits)
-
-            mc_info.append((track_id, em.MCInfo(
-                    primary_vertex,
-                    phis,
-                    thetas,
-                    ts)))
-
-            modules = [em.Module(module_id, z, lx, ly, hits_per_module[idx]) for idx, (module_id, z, lx, ly) in
-                       enumerate(
-                           zip(self.detector_geometry.module_id, self.detector_geometry.z, self.detector_geometry.lx,
-                                self.detector_geometry.ly))]
-            tracks = []
-
-            for idx, (track_id, mc_info) in enumerate(mc_info):
-                tracks.append(em.Track(track_id, mc_info, hits_per_track[idx]))
-            global_hits = [hit for sublist in hits_per_module for hit in sublist]
-
-            all_events.append(em.Event(modules, tracks, global_hits))
+            # Initial directions, uniform in phi and cos(theta)
+            phi = self.rng.uniform(self.phi_min, self.phi_max, n_particles)
+            cos_theta = self.rng.uniform(np.cos(self.theta_max), np.cos(self.theta_min), n_particles)
+            theta = np.arccos(cos_theta)
+
+            # Scattering at every module, shape (tracks, modules, (phi, theta))
+            #ToDo: Impliment as x,y scattering - Marcel to send specification
+            kicks = self.rng.normal(0, 1, (n_particles, n_modules, 2)) * (self.phi_divergence, self.theta_divergence)
+            phis = np.concatenate((phi[:, None], phi[:, None] + np.cumsum(kicks[:, :, 0], axis=1)), axis=1)
+            thetas = np.concatenate((theta[:, None], theta[:, None] + np.cumsum(kicks[:, :, 1], axis=1)), axis=1)
+
+            # Straight segments between the modules: direction before module k is column k
+            vx, vy, vz = self.find_vs(thetas[:, :-1], phis[:, :-1])
+            reached = np.logical_and.accumulate(vz > 0, axis=1)
+            dz = np.diff(zm, prepend=pvz)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ts = np.where(reached, dz / vz, np.nan)
+                x_hits = pvx + np.cumsum(vx * ts, axis=1)
+                y_hits = pvy + np.cumsum(vy * ts, axis=1)
+                on_module = reached & (np.abs(x_hits) < half_lx) & (np.abs(y_hits) < half_ly)
+
+            # Hits in bulk, in track order then module order
+            track_idx, module_idx = np.nonzero(on_module)
+            noise = self.rng.normal(0, self.resolution, (len(track_idx), 2))
+            # The hits, segments and tracks hold no reference cycles: pause the cyclic
+            # garbage collector, which would otherwise scan them many times while they are built
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                hits = [
+                    em.Hit(next(hit_id_counter), x, y, z, module_id, track_id)
+                    for x, y, z, module_id, track_id in zip(
+                        (x_hits[track_idx, module_idx] + noise[:, 0]).tolist(),
+                        (y_hits[track_idx, module_idx] + noise[:, 1]).tolist(),
+                        zm[module_idx].tolist(),
+                        module_ids[module_idx].tolist(),
+                        track_idx.tolist())
+                ]
+
+                tracks = []
+                segments = []
+                # Segment ids run across the tracks of the event
+                segment_id_counter = count()
+                offsets = np.concatenate(([0], np.cumsum(on_module.sum(axis=1)))).tolist()
+                for track_id in range(n_particles):
+                    track_hits = hits[offsets[track_id]:offsets[track_id + 1]]
+                    track_segments = [em.Segment([track_hits[i], track_hits[i + 1]], next(segment_id_counter)) for i in range(len(track_hits) - 1)]
+                    tracks.append(em.Track(track_id, track_hits, track_segments))
+                    segments.extend(track_segments)
+
+                by_module = np.argsort(module_idx, kind='stable')
+                module_offsets = np.searchsorted(module_idx[by_module], np.arange(n_modules + 1)).tolist()
+                global_hits = [hits[i] for i in by_module.tolist()]
+                modules = [em.Module(module_id, z, lx, ly, global_hits[module_offsets[idx]:module_offsets[idx + 1]])
+                           for idx, (module_id, lx, ly, z) in enumerate(geometry)]
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+            self.mc_info.append({
+                "primary_vertex": primary_vertex,
+                "phi": phis,
+                "theta": thetas,
+                "t": ts,
+            })
+
+            all_events.append(em.Event(geometry, tracks, global_hits, segments, modules, []))
         if n_events == 1:
             all_events = all_events[0]
         return all_events
-                
\ No newline at end of file
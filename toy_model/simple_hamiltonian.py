@@ -200,6 +200,18 @@ class SimpleHamiltonian(Hamiltonian):
             
         return -0.5 * sol.T @ self.A @ sol + self.b.dot(sol)
 
+def hit_lookup(event) -> dict:
+    """
+    Dictionary hit_id -> first hit of event.hits with this id. Uses the cached index of
+    Event objects; other objects with a hits list (e.g. StateEventGenerator) get a new one.
+    """
+    if isinstance(event, Event):
+        return event.hit_index()
+    hit_by_id = {}
+    for h in event.hits:
+        hit_by_id.setdefault(h.hit_id, h)
+    return hit_by_id
+
 def find_segments(s0: Segment, active: Segment):
         found_s = []
         for s1 in active:
@@ -226,13 +238,10 @@ def get_tracks(ham: SimpleHamiltonian, classical_solution: list[int], event: Sta
             track = track.union(set([s.hits[0].hit_id, s.hits[1].hit_id]))
         tracks.append(track)
 
+    hit_by_id = hit_lookup(event)
     tracks_processed = []
     for track_ind, track in enumerate(tracks):
-        track_hits = []
-        for hit_id in track:
-            matching_hits = list(filter(lambda b: b.hit_id == hit_id, event.hits))
-            if matching_hits:  
-                track_hits.append(matching_hits[0])
+        track_hits = [hit_by_id[hit_id] for hit_id in track if hit_id in hit_by_id]
         if track_hits:
             tracks_processed.append(Track(track_ind, track_hits, 1))
     return tracks_processed
@@ -241,6 +250,101 @@ def get_tracks(ham: SimpleHamiltonian, classical_solution: list[int], event: Sta
 
 
 
+class SegmentTable:
+    """
+    Candidate segments of SimpleHamiltonianFast stored as arrays.
+
+    hits is the list of Hit objects indexed by row; segment k goes from hits[from_rows[k]]
+    to hits[to_rows[k]]. Segments of group g (module pair g, g + 1) are the rows
+    group_offsets[g]:group_offsets[g + 1]. Normalized direction vectors ((0, 0, 1) for
+    zero-length segments) and the phase theta of the direction projected onto the XY
+    plane are precomputed. A segment costs 40 bytes; Segment objects are only built by
+    segment(), segments() and groups().
+    """
+
+    def __init__(self, hits, from_rows, to_rows, group_offsets, segment_ids=None):
+        self.hits = hits
+        self.from_rows = np.asarray(from_rows, dtype=np.int32)
+        self.to_rows = np.asarray(to_rows, dtype=np.int32)
+        self.group_offsets = np.asarray(group_offsets, dtype=np.int64)
+        self._segment_ids = None if segment_ids is None else np.asarray(segment_ids, dtype=np.int64)
+
+        xyz = np.array([(h.x, h.y, h.z) for h in hits], dtype=np.float64).reshape(-1, 3)
+        d = xyz[self.to_rows] - xyz[self.from_rows]
+        norm = np.sqrt(d[:, 0]*d[:, 0] + d[:, 1]*d[:, 1] + d[:, 2]*d[:, 2])
+        vectors = np.tile([0.0, 0.0, 1.0], (len(d), 1))
+        nonzero = norm > 0
+        vectors[nonzero] = d[nonzero] / norm[nonzero, None]
+        self.vectors = vectors
+        self.theta = np.arctan2(d[:, 1], d[:, 0])
+
+    @classmethod
+    def from_modules(cls, modules):
+        """
+        All segments between consecutive modules, in the order of
+        product(modules[g].hits, modules[g + 1].hits) for each group g.
+        """
+        hits = [h for m in modules for h in m.hits]
+        starts = np.concatenate([[0], np.cumsum([len(m.hits) for m in modules])]).astype(np.int64)
+        from_rows, to_rows = [], []
+        for g in range(len(modules) - 1):
+            rows_from = np.arange(starts[g], starts[g + 1])
+            rows_to = np.arange(starts[g + 1], starts[g + 2])
+            from_rows.append(np.repeat(rows_from, len(rows_to)))
+            to_rows.append(np.tile(rows_to, len(rows_from)))
+        sizes = [len(r) for r in from_rows]
+        empty = np.zeros(0, dtype=np.int64)
+        return cls(
+            hits,
+            np.concatenate(from_rows) if from_rows else empty,
+            np.concatenate(to_rows) if to_rows else empty,
+            np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+        )
+
+    def __len__(self):
+        return len(self.from_rows)
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.group_offsets) - 1
+
+    @property
+    def segment_ids(self) -> np.ndarray:
+        if self._segment_ids is None:
+            return np.arange(len(self), dtype=np.int64)
+        return self._segment_ids
+
+    def group_of(self) -> np.ndarray:
+        """Group index of every segment."""
+        return np.repeat(np.arange(self.n_groups), np.diff(self.group_offsets))
+
+    def hit_ids(self) -> np.ndarray:
+        """(n, 2) hit IDs of the from and to hit of every segment."""
+        row_ids = np.array([h.hit_id for h in self.hits], dtype=np.int64)
+        return np.stack([row_ids[self.from_rows], row_ids[self.to_rows]], axis=1)
+
+    def segment(self, k: int) -> Segment:
+        return Segment([self.hits[self.from_rows[k]], self.hits[self.to_rows[k]]], int(self.segment_ids[k]))
+
+    def segments(self, indices=None) -> list:
+        """Segment objects of the rows indices (all rows if None)."""
+        if indices is None:
+            indices = np.arange(len(self))
+        hits = self.hits
+        return [
+            Segment([hits[a], hits[b]], sid)
+            for a, b, sid in zip(self.from_rows[indices].tolist(), self.to_rows[indices].tolist(),
+                                 self.segment_ids[indices].tolist())
+        ]
+
+    def groups(self, segments=None) -> list:
+        """Segment objects split by group; segments defaults to segments()."""
+        if segments is None:
+            segments = self.segments()
+        bounds = self.group_offsets.tolist()
+        return [segments[bounds[g]:bounds[g + 1]] for g in range(self.n_groups)]
+
+
 class SimpleHamiltonianFast(Hamiltonian):
     """
     Optimized Hamiltonian construction for track finding.
@@ -257,133 +361,166 @@ class SimpleHamiltonianFast(Hamiltonian):
         self.Z = None
         self.A = None
         self.b = None
-        self.segments = None
-        self.segments_grouped = None
+        self.segment_table = None  # SegmentTable, the primary representation of the segments
         self.n_segments = None
+        self._segments = None  # Segment objects, built from segment_table on request
         
-        # Cached data for fast Hamiltonian construction
-        self._segment_vectors = None  # Normalized direction vectors
-        self._segment_to_hit_ids = None  # (from_hit_id, to_hit_id) for each segment
-        self._group_boundaries = None  # Start indices for each group
+        # Cached connectivity + angle table, independent of epsilon, theta_d and convolution
+        self._pair_i = None  # Segment index in group k of each connected pair
+        self._pair_j = None  # Segment index in group k + 1 of each connected pair
+        self._pair_angles = None  # Angle between the two segments of each pair
     
+    def __setstate__(self, state):
+        """
+        Accepts the state of Hamiltonians pickled before the segments were stored in a
+        SegmentTable: the table is rebuilt from the old segments list and _group_boundaries,
+        the old per-segment caches are dropped and the pair table is rebuilt on request.
+        """
+        state = dict(state)
+        if "segment_table" not in state:
+            segments = state.pop("segments", None)
+            boundaries = state.pop("_group_boundaries", None)
+            for name in ("segments_grouped", "_segment_vectors", "_segment_to_hit_ids",
+                         "_pair_i", "_pair_j", "_pair_angles"):
+                state.pop(name, None)
+            table = None
+            if segments is not None:
+                rows = {}
+                for seg in segments:
+                    for hit in seg.hits:
+                        rows.setdefault(id(hit), (len(rows), hit))
+                table = SegmentTable(
+                    [hit for _, hit in rows.values()],
+                    [rows[id(seg.hits[0])][0] for seg in segments],
+                    [rows[id(seg.hits[1])][0] for seg in segments],
+                    boundaries if boundaries is not None else [0, len(segments)],
+                    [seg.segment_id for seg in segments],
+                )
+            state["segment_table"] = table
+            state["_segments"] = segments
+        for name in ("_segments", "_pair_i", "_pair_j", "_pair_angles"):
+            state.setdefault(name, None)
+        self.__dict__.update(state)
+
     def construct_segments(self, event: StateEventGenerator):
         """
-        Construct segments and pre-compute direction vectors.
+        Construct the segment table of all segments between consecutive modules,
+        with pre-computed direction vectors.
         """
-        segments_grouped = []
-        segments = []
-        segment_vectors = []
-        segment_hit_ids = []
-        group_boundaries = [0]
+        self.set_segment_table(SegmentTable.from_modules(event.modules))
+    
+    def set_segment_table(self, table: SegmentTable):
+        """Use table as the segments of the Hamiltonian and drop the cached pair table."""
+        self.segment_table = table
+        self.n_segments = len(table)
+        self._segments = None
+        self._pair_i = self._pair_j = self._pair_angles = None
+    
+    @property
+    def segments(self):
+        """Segment objects of the segment table, built on first access."""
+        if self._segments is None and self.segment_table is not None:
+            self._segments = self.segment_table.segments()
+        return self._segments
+    
+    @property
+    def segments_grouped(self):
+        """Segment objects split by module pair, built on first access."""
+        if self.segment_table is None:
+            return None
+        return self.segment_table.groups(self.segments)
+    
+    def construct_angle_table(self):
+        """
+        Find all connected segment pairs and their angles.
         
-        segment_id = 0
+        Segment i of group k and segment j of group k + 1 are connected if the to-hit of i
+        is the from-hit of j. Pairs are matched on (group, hit ID) keys with numpy, and
+        sorted by (i, j).
+        """
+        table = self.segment_table
+        n = len(table)
+        hit_ids = table.hit_ids()
+        group = table.group_of()
         
-        for idx in range(len(event.modules) - 1):
-            from_hits = event.modules[idx].hits
-            to_hits = event.modules[idx + 1].hits
-            
-            segments_group = []
-            for from_hit, to_hit in product(from_hits, to_hits):
-                seg = Segment([from_hit, to_hit], segment_id)
-                segments_group.append(seg)
-                segments.append(seg)
-                
-                # Pre-compute normalized direction vector
-                dx = to_hit.x - from_hit.x
-                dy = to_hit.y - from_hit.y
-                dz = to_hit.z - from_hit.z
-                norm = np.sqrt(dx*dx + dy*dy + dz*dz)
-                if norm > 0:
-                    segment_vectors.append((dx/norm, dy/norm, dz/norm))
-                else:
-                    segment_vectors.append((0, 0, 1))
-                
-                # Store hit IDs for fast lookup
-                segment_hit_ids.append((from_hit.hit_id, to_hit.hit_id))
-                
-                segment_id += 1
-            
-            segments_grouped.append(segments_group)
-            group_boundaries.append(segment_id)
+        # Key of the middle hit: (group of j, hit ID), on the to side of i and the from side of j
+        keys = np.concatenate([
+            np.stack([group + 1, hit_ids[:, 1]], axis=1),
+            np.stack([group, hit_ids[:, 0]], axis=1),
+        ])
+        _, codes = np.unique(keys, axis=0, return_inverse=True)
+        codes = codes.reshape(-1)
+        code_i, code_j = codes[:n], codes[n:]
         
-        self.segments_grouped = segments_grouped
-        self.segments = segments
-        self.n_segments = segment_id
-        self._segment_vectors = np.array(segment_vectors)
-        self._segment_to_hit_ids = segment_hit_ids
-        self._group_boundaries = group_boundaries
+        # Cartesian product of the segments i and j sharing each key
+        n_keys = int(codes.max()) + 1 if n else 0
+        order_i = np.argsort(code_i, kind="stable")
+        order_j = np.argsort(code_j, kind="stable")
+        count_i = np.bincount(code_i, minlength=n_keys)
+        count_j = np.bincount(code_j, minlength=n_keys)
+        start_i = np.concatenate([[0], np.cumsum(count_i)[:-1]]).astype(np.int64)
+        start_j = np.concatenate([[0], np.cumsum(count_j)[:-1]]).astype(np.int64)
+        n_pairs = count_i * count_j
+        pair_key = np.repeat(np.arange(n_keys), n_pairs)
+        local = np.arange(int(n_pairs.sum())) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+        pair_i = order_i[start_i[pair_key] + local // count_j[pair_key]]
+        pair_j = order_j[start_j[pair_key] + local % count_j[pair_key]]
+        order = np.lexsort((pair_j, pair_i))
+        pair_i, pair_j = pair_i[order], pair_j[order]
+        
+        vec_i = table.vectors[pair_i]
+        vec_j = table.vectors[pair_j]
+        cosine = vec_i[:, 0]*vec_j[:, 0] + vec_i[:, 1]*vec_j[:, 1] + vec_i[:, 2]*vec_j[:, 2]
+        
+        self._pair_i = pair_i
+        self._pair_j = pair_j
+        self._pair_angles = np.arccos(np.clip(cosine, -1.0, 1.0))
+    
+    def share_segments(self, other: "SimpleHamiltonianFast"):
+        """
+        Reuse the segments and cached data of other, constructed for the same event.
+        construct_hamiltonian() then skips construct_segments(), so Hamiltonians with
+        different epsilon, theta_d or convolution share one segment construction.
+        """
+        self.segment_table = other.segment_table
+        self.n_segments = other.n_segments
+        self._segments = other._segments
+        self._pair_i = getattr(other, "_pair_i", None)
+        self._pair_j = getattr(other, "_pair_j", None)
+        self._pair_angles = getattr(other, "_pair_angles", None)
     
     def construct_hamiltonian(self, event: StateEventGenerator, convolution: bool = False):
         """
         Construct the Hamiltonian matrix using optimized sparse construction.
         
         Uses COO format for efficient construction, then converts to CSC for solving.
+        Segments and the connectivity + angle table are computed on the first call only;
+        later calls with another epsilon, theta_d or convolution only re-weight the pairs.
         """
         Segment.id_counter = 0
-        if self.segments_grouped is None:
+        if self.segment_table is None:
             self.construct_segments(event)
+        if getattr(self, "_pair_angles", None) is None:
+            self.construct_angle_table()
         
         n = self.n_segments
+        pair_i, pair_j, angles = self._pair_i, self._pair_j, self._pair_angles
         
-        # Lists for COO sparse matrix construction
-        row_indices = []
-        col_indices = []
-        data_values = []
-        
-        # Diagonal entries: -(delta + gamma)
-        diag_value = -(self.delta + self.gamma)
-        row_indices.extend(range(n))
-        col_indices.extend(range(n))
-        data_values.extend([diag_value] * n)
-        
-        # Off-diagonal entries: segment connections
-        # Pre-compute for vectorized operations
-        sqrt2_theta_d = self.theta_d * np.sqrt(2)
+        if convolution:
+            # ERF-smoothed step function
+            values = 1 + erf((self.epsilon - angles) / (self.theta_d * np.sqrt(2)))
+        else:
+            # Hard step function: accept if angle < epsilon
+            # This is consistent with the ERF version
+            accepted = angles < self.epsilon
+            pair_i, pair_j = pair_i[accepted], pair_j[accepted]
+            values = np.ones(len(pair_i))
         
-        for group_idx in range(len(self.segments_grouped) - 1):
-            group_i = self.segments_grouped[group_idx]
-            group_j = self.segments_grouped[group_idx + 1]
-            
-            # Get index offsets
-            offset_i = self._group_boundaries[group_idx]
-            offset_j = self._group_boundaries[group_idx + 1]
-            
-            for local_i, seg_i in enumerate(group_i):
-                seg_i_id = offset_i + local_i
-                seg_i_to_hit = self._segment_to_hit_ids[seg_i_id][1]
-                vec_i = self._segment_vectors[seg_i_id]
-                
-                for local_j, seg_j in enumerate(group_j):
-                    seg_j_id = offset_j + local_j
-                    seg_j_from_hit = self._segment_to_hit_ids[seg_j_id][0]
-                    
-                    # Check if segments are connected (share middle hit)
-                    if seg_i_to_hit == seg_j_from_hit:
-                        vec_j = self._segment_vectors[seg_j_id]
-                        
-                        # Compute cosine of angle between segments
-                        cosine = vec_i[0]*vec_j[0] + vec_i[1]*vec_j[1] + vec_i[2]*vec_j[2]
-                        
-                        # Clamp cosine to valid range to avoid numerical issues
-                        cosine = np.clip(cosine, -1.0, 1.0)
-                        
-                        # Compute angle between segments
-                        angle = np.arccos(cosine)
-                        
-                        if convolution:
-                            # ERF-smoothed step function
-                            value = 1 + erf((self.epsilon - angle) / sqrt2_theta_d)
-                            # Symmetric matrix
-                            row_indices.extend([seg_i_id, seg_j_id])
-                            col_indices.extend([seg_j_id, seg_i_id])
-                            data_values.extend([value, value])
-                        else:
-                            # Hard step function: accept if angle < epsilon
-                            # This is consistent with the ERF version
-                            if angle < self.epsilon:
-                                row_indices.extend([seg_i_id, seg_j_id])
-                                col_indices.extend([seg_j_id, seg_i_id])
-                                data_values.extend([1.0, 1.0])
+        # Diagonal entries: -(delta + gamma), off-diagonal entries: symmetric segment connections
+        diag = np.arange(n)
+        row_indices = np.concatenate([diag, pair_i, pair_j])
+        col_indices = np.concatenate([diag, pair_j, pair_i])
+        data_values = np.concatenate([np.full(n, -(self.delta + self.gamma)), values, values])
         
         #-------------------------------------------------------------------------
         # Setup a sparse matrix in COO format that is easy to build incrementally
@@ -400,6 +537,19 @@ class SimpleHamiltonianFast(Hamiltonian):
         self.A, self.b = -A, b
         return -A, b
     
+    def reweight(self, epsilon=None, theta_d=None, convolution: bool = False):
+        """
+        Rebuild A and b for a new epsilon and/or theta_d from the cached connectivity + angle
+        table, without reconstructing segments. construct_hamiltonian() must have been called.
+        """
+        if self.segment_table is None:
+            raise Exception("Not initialised")
+        if epsilon is not None:
+            self.epsilon = epsilon
+        if theta_d is not None:
+            self.theta_d = theta_d
+        return self.construct_hamiltonian(event=None, convolution=convolution)
+    
     def solve_classicaly(self):
         """Solve the linear system using conjugate gradient."""
         if self.A is None:
@@ -449,12 +599,9 @@ def get_tracks_fast(ham: SimpleHamiltonianFast, classical_solution, event: State
     
     Groups connected segments where the solution indicates activity.
     """
-    min_val = np.min(classical_solution)
-    active_segments = [
-        segment for segment, pseudo_state in zip(ham.segments, classical_solution)
-        if pseudo_state > min_val
-    ]
-    active = deepcopy(active_segments)
+    classical_solution = np.asarray(classical_solution)
+    active_rows = np.flatnonzero(classical_solution > np.min(classical_solution))
+    active = ham.segment_table.segments(active_rows)
     tracks = []
     
     while len(active):
@@ -474,14 +621,11 @@ def get_tracks_fast(ham: SimpleHamiltonianFast, classical_solution, event: State
         tracks.append(track)
     
     # Convert to Track objects
+    hit_by_id = hit_lookup(event)
     tracks_processed = []
     for track_ind, track in enumerate(tracks):
-        track_hits = []
         track_segs = []
-        for hit_id in track:
-            matching_hits = [h for h in event.hits if h.hit_id == hit_id]
-            if matching_hits:
-                track_hits.append(matching_hits[0])
+        track_hits = [hit_by_id[hit_id] for hit_id in track if hit_id in hit_by_id]
         
         # Sort hits by z coordinate for proper segment construction
         track_hits.sort(key=lambda h: h.z)
@@ -498,12 +642,13 @@ def get_tracks_fast(ham: SimpleHamiltonianFast, classical_solution, event: State
     return tracks_processed
 
 
-def construct_event(detector_geometry, tracks, hits, segments, modules):
+def construct_event(detector_geometry, tracks, hits, segments, modules, ghost_hits=None):
     """Construct an Event object from components."""
     return Event(
         detector_geometry=detector_geometry,
         tracks=tracks,
         hits=hits,
         segments=segments,
-        modules=modules
+        modules=modules,
+        ghost_hits=ghost_hits if ghost_hits is not None else []
     )
\ No newline at end of file
@@ -68,6 +68,8 @@ collision events parameterized by the LHCb state vector (x, y, tx, ty, p/q).
 import numpy as np
 import toy_model.state_event_model as em
 import dataclasses
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from itertools import count
 from abc import ABC, abstractmethod
 import matplotlib.animation as animation
@@ -94,10 +96,14 @@ class StateEventGenerator:
         n_particles: list[int] = None,
         particles: list[dict] = None,
         measurement_error: float = 0.,
-        collision_noise: float = 0.1e-3
+        collision_noise: float = 0.1e-3,
+        seed = None
     ) -> None:
         """
         Initializes the StateEventGenerator with geometry, angle limits, event counts, etc.
+        seed (int, np.random.SeedSequence or np.random.Generator) seeds all the random draws
+        of the generator, None draws fresh entropy from the OS. Its seed sequence also spawns
+        the child streams of the bunch crossings of iter_event_sample().
         """
         self.detector_geometry = detector_geometry  # Geometry of the detector
         self.primary_vertices = primary_vertices if primary_vertices is not None else []
@@ -108,7 +114,8 @@ class StateEventGenerator:
         self.events_num = events                        # Number of events to generate
         self.n_particles = n_particles if n_particles is not None else []
         self.particles = particles if particles is not None else []
-        self.rng = np.random.default_rng()          # Random number generator
+        self.rng = np.random.default_rng(seed)      # Random number generator
+        self.seed_seq = self.rng.bit_generator.seed_seq  # Parent of the streams of iter_event_sample()
         self.measurment_error_flag = True           # Flag for measurment error
         self.measurement_error = measurement_error       # Measurment error
         self.collision_noise = collision_noise
@@ -218,8 +225,8 @@ class StateEventGenerator:
         Updates a particle's direction to simulate a collision.
         """
         # Update slopes
-        update_x = np.tan(np.random.normal(0, self.collision_noise))
-        update_y = np.tan(np.random.normal(0, self.collision_noise))
+        update_x = np.tan(self.rng.normal(0, self.collision_noise))
+        update_y = np.tan(self.rng.normal(0, self.collision_noise))
 
         particle['tx'] += update_x 
         particle['ty'] += update_y
@@ -232,8 +239,8 @@ class StateEventGenerator:
         Updates a particle's position to simlate a measurenemnt error
         """
         # Random slight shifts in x, y
-        particle['x'] += np.random.normal(0, self.measurement_error)
-        particle['y'] += np.random.normal(0, self.measurement_error)
+        particle['x'] += self.rng.normal(0, self.measurement_error)
+        particle['y'] += self.rng.normal(0, self.measurement_error)
     
         return particle
 
@@ -250,6 +257,125 @@ class StateEventGenerator:
 
         return particle
 
+    def _advance(self, x, y, z, tx, ty, zpos):
+        """
+        Moves states (scalars or arrays) to the layer at zpos, as propagate() does.
+        """
+        dz = zpos - z
+        return x + tx * dz, y + ty * dz, z + dz
+
+    def _hit_noise(self, x, y, tx, ty, normals, j):
+        """
+        Applies the measurement error and the collision noise of hits (scalars or arrays),
+        as measurment_error() and collision_update() do, reading the draws from normals at j.
+        """
+        if self.measurment_error_flag:
+            x = x + (0.0 + self.measurement_error * normals[j])
+            y = y + (0.0 + self.measurement_error * normals[j + 1])
+            j = j + 2
+        tx = tx + np.tan(0.0 + self.collision_noise * normals[j])
+        ty = ty + np.tan(0.0 + self.collision_noise * normals[j + 1])
+        return x, y, tx, ty
+
+    def propagate_event(self, states: list[dict], layers: list[tuple]) -> tuple:
+        """
+        Propagates all the particle states of one event through the layers at once.
+
+        Gives the same result, and consumes the same random draws, as propagating the
+        particles one after the other with propagate(), measurment_error() and
+        collision_update(). Each accepted hit draws 4 normals (x, y measurement error,
+        then x, y collision noise; 2 without measurement error), so the draws of a
+        particle start after the hits of all the particles before it. The numbers of
+        hits are guessed from a propagation without noise, then the layers are simulated
+        for a window of particles with detector_geometry.points_on_bulk() and the guesses
+        are updated: the particles up to the first changed count are final, and the
+        window moves on. Where the noise decides the acceptance of many particles, the
+        guesses keep failing and the particles are propagated one at a time, reading
+        the same draws. Both paths step with _advance() and _hit_noise().
+
+        Returns the arrays x, y and on_bulk of shape (particles, layers) and updates the
+        states in place to their values after the last layer.
+        """
+        n, n_layers = len(states), len(layers)
+        draws = 4 if self.measurment_error_flag else 2
+        keys = ('x', 'y', 'z', 'tx', 'ty')
+        init = {k: np.array([state[k] for state in states], dtype=float) for k in keys}
+        z_layers = [float(zpos) for _, _, _, zpos in layers]
+
+        X = np.zeros((n, n_layers))
+        Y = np.zeros((n, n_layers))
+        on_bulk = np.zeros((n, n_layers), dtype=bool)
+        final = {k: v.copy() for k, v in init.items()}
+
+        rng_state = self.rng.bit_generator.state
+        # Enough draws for a hit on every layer
+        normals = self.rng.standard_normal(draws * n * n_layers)
+
+        # Guess the numbers of hits from a propagation without noise
+        counts = np.zeros(n, dtype=int)
+        x, y, z = (init[k].copy() for k in ('x', 'y', 'z'))
+        for zpos in z_layers:
+            x, y, z = self._advance(x, y, z, init['tx'], init['ty'], zpos)
+            counts += self.detector_geometry.points_on_bulk(x, y)
+
+        start, window, sequential = 0, 64, False
+        while start < n:
+            stop = min(n, start + window)
+            if sequential:
+                # The guesses keep failing (noise decides the acceptance of many particles):
+                # propagate the next window of particles one at a time
+                offset = draws * int(counts[:start].sum())
+                for p_idx in range(start, stop):
+                    x, y, z, tx, ty = (init[k][p_idx] for k in keys)
+                    used = 0
+                    for k, zpos in enumerate(z_layers):
+                        x, y, z = self._advance(x, y, z, tx, ty, zpos)
+                        hit = self.detector_geometry.point_on_bulk({'x': x, 'y': y, 'z': z})
+                        if hit:
+                            x, y, tx, ty = self._hit_noise(x, y, tx, ty, normals, offset)
+                            offset += draws
+                            used += 1
+                        X[p_idx, k], Y[p_idx, k], on_bulk[p_idx, k] = x, y, hit
+                    for k, v in zip(keys, (x, y, z, tx, ty)):
+                        final[k][p_idx] = v
+                    counts[p_idx] = used
+                start, sequential = stop, False
+                continue
+
+            offsets = draws * (np.cumsum(counts) - counts)[start:stop]
+            x, y, z, tx, ty = (init[k][start:stop].copy() for k in keys)
+            used = np.zeros(stop - start, dtype=int)
+            for k, zpos in enumerate(z_layers):
+                x, y, z = self._advance(x, y, z, tx, ty, zpos)
+                hit = self.detector_geometry.points_on_bulk(x, y)
+                i = np.flatnonzero(hit)
+                x[i], y[i], tx[i], ty[i] = self._hit_noise(x[i], y[i], tx[i], ty[i], normals, offsets[i] + draws * used[i])
+                X[start:stop, k], Y[start:stop, k], on_bulk[start:stop, k] = x, y, hit
+                used += hit
+            for k, v in zip(keys, (x, y, z, tx, ty)):
+                final[k][start:stop] = v
+
+            # Grow the window while the guesses hold; fall back to one particle at a time
+            # when a window settles less than an eighth of its particles
+            changed = np.flatnonzero(used != counts[start:stop])
+            counts[start:stop] = used
+            if changed.size:
+                sequential = 8 * (changed[0] + 1) < stop - start
+                start, window = start + changed[0] + 1, max(64, window // 2)
+            else:
+                start, window = stop, 2 * window
+
+        # Advance the generator past the draws actually used
+        self.rng.bit_generator.state = rng_state
+        self.rng.standard_normal(draws * int(counts.sum()))
+
+        # z was advanced by Python float steps, the slopes and positions by numpy scalars
+        final['z'] = final['z'].tolist()
+        for p_idx, state in enumerate(states):
+            for k in keys:
+                state[k] = final[k][p_idx]
+        return X, Y, on_bulk
+
     def generate_complete_events(self):
         """
         Generates fully propagated events, from the primary vertices through each detector layer,
@@ -262,48 +388,29 @@ class StateEventGenerator:
         track_counter = count()
         # Prepare container for all events
         all_event_tracks = []
+        layers = list(self.detector_geometry)
         # Loop over the number of events
         for evt_idx in range(self.events_num):
             # Container for tracks in this event
             event_tracks = []
-            # Retrieve the primary vertex for this event
-            vx, vy, vz = self.primary_vertices[evt_idx]
-            for p_idx in range(self.n_particles[evt_idx]):
+            # Propagate the particles of this event through each layer of the detector geometry
+            states = self.particles[evt_idx][:self.n_particles[evt_idx]]
+            X, Y, on_bulk = self.propagate_event(states, layers)
+            for p_idx in range(len(states)):
                 track_id = next(track_counter)
                 # Create a new track with empty collections of hits and segments
                 track = em.Track(track_id, hits=[], segments=[])
-                # Initialize the particle's state at the primary vertex
-                state = self.particles[evt_idx][p_idx]
-                # Propagate through each layer of the detector geometry
-                for mod_id, lx, ly, zpos in self.detector_geometry:
-                    # Calculate distance to the next layer along z
-                    dz = zpos - state['z']
-                    # Update particle state by propagating in z
-                    state = self.propagate(state, dz)
-                    # print(f'state : {state}')
-                    if not self.detector_geometry.point_on_bulk(state):
-                        continue
-                    # Create and record a new hit at this layer
-                    if self.measurment_error_flag:
-                        errot_state = self.measurment_error(state)
-                        hit = em.Hit(
-                            hit_id = next(hit_counter),
-                            track_id = track_id,         
-                            x=errot_state['x'],
-                            y=errot_state['y'],
-                            z=zpos,
-                            module_id=mod_id
-                        )
-                    else:
-                        hit = em.Hit(
-                            hit_id = next(hit_counter),
-                            track_id = track_id,  
-                            x=state['x'],
-                            y=state['y'],
-                            z=zpos,
-                            module_id=mod_id
-                        )
-                    state = self.collision_update(state)
+                # Record a hit at each layer where the particle is on the bulk
+                for k in np.flatnonzero(on_bulk[p_idx]):
+                    mod_id, lx, ly, zpos = layers[k]
+                    hit = em.Hit(
+                        hit_id = next(hit_counter),
+                        track_id = track_id,
+                        x=X[p_idx, k],
+                        y=Y[p_idx, k],
+                        z=zpos,
+                        module_id=mod_id
+                    )
                     track.hits.append(hit)
                 #find the segments
                 for i in range(len(track.hits)-1):
@@ -361,22 +468,23 @@ class StateEventGenerator:
         # Drop a fraction of hits
         total_hits = len(self.hits)
         to_drop = int(total_hits * drop_rate)
-        drop_indices = self.rng.choice(total_hits, to_drop, replace=False)
+        drop_indices = set(self.rng.choice(total_hits, to_drop, replace=False).tolist())
         self.hits = [hit for i, hit in enumerate(self.hits) if i not in drop_indices]
 
         # Remove invalid segments and update each track
-        valid_hits = self.hits
+        # (hits compare by identity, so membership is tested on their ids)
+        valid_hits = {id(hit) for hit in self.hits}
         self.segments = [
             seg 
             for seg in self.segments
-            if seg.hits[0] in valid_hits and seg.hits[1] in valid_hits
+            if id(seg.hits[0]) in valid_hits and id(seg.hits[1]) in valid_hits
         ]
         for track in self.tracks:
-            track.hits = [hit for hit in track.hits if hit in valid_hits]
+            track.hits = [hit for hit in track.hits if id(hit) in valid_hits]
             track.segments = [
                 seg 
                 for seg in track.segments
-                if seg.hits[0] in valid_hits and seg.hits[1] in valid_hits
+                if id(seg.hits[0]) in valid_hits and id(seg.hits[1]) in valid_hits
             ]
 
         # Insert ghost hits
@@ -409,10 +517,137 @@ class StateEventGenerator:
 
         return self.false_event
 
+    def iter_event_sample(self, n_events, n_particles, pileup=1, particle=None, physical_variance=None,
+                          drop_rate=0.0, ghost_rate=0.0, workers=1, chunk_size=64, max_in_flight=None):
+        """
+        Yields n_events independent bunch crossings, in order, for high-pileup samples.
+
+        A crossing has pileup primary vertices (drawn with physical_variance, at the origin
+        if None) and n_particles particles per vertex (int, or list of pileup ints) of type
+        particle (default: MIP), and make_noisy_event(drop_rate, ghost_rate) is applied to
+        it. It is generated by its own StateEventGenerator, with this generator's geometry,
+        angles and noise, seeded by one child of self.seed_seq: crossing i of a sample only
+        depends on the seed and on i, so the sample is bit-identical whatever workers and
+        chunk_size. Each call spawns new children, so successive samples are independent.
+
+        Chunks of chunk_size crossings are generated in workers processes (in this process
+        if workers <= 1), with at most max_in_flight chunks (default 2 * workers) pending.
+        Crossings are passed as the arrays of event_snapshot.snapshot_arrays(), which cost
+        much less to send between processes and to keep in memory than the objects.
+
+        Yields an event_snapshot.Snapshot per crossing: truth_event and noisy_event are
+        rebuilt on first access, and params holds the entropy and spawn_key of the child
+        seed sequence and the primary vertices.
+        """
+        # event_snapshot imports simple_hamiltonian, which imports this module
+        from toy_model import event_snapshot
+
+        if isinstance(n_particles, (int, np.integer)):
+            n_particles = [int(n_particles)] * pileup
+        if len(n_particles) != pileup:
+            raise ValueError(f"n_particles must have one entry per primary vertex ({pileup})")
+        config = {
+            "detector_geometry": self.detector_geometry,
+            "phi_min": self.phi_min,
+            "phi_max": self.phi_max,
+            "theta_min": self.theta_min,
+            "theta_max": self.theta_max,
+            "measurement_error": self.measurement_error,
+            "collision_noise": self.collision_noise,
+            "measurment_error_flag": self.measurment_error_flag,
+            "n_particles": list(n_particles),
+            "particle": particle if particle is not None else {"type": "MIP", "mass": 0.511, "q": 1},
+            "physical_variance": physical_variance,
+            "drop_rate": drop_rate,
+            "ghost_rate": ghost_rate,
+        }
+        # Children are spawned chunk by chunk, in order: the same children as spawn(n_events)
+        chunks = (self.seed_seq.spawn(min(chunk_size, n_events - start))
+                  for start in range(0, n_events, chunk_size))
+
+        if workers <= 1:
+            for seeds in chunks:
+                for arrays in generate_crossings(config, seeds):
+                    yield event_snapshot.Snapshot(arrays=arrays)
+            return
+
+        max_in_flight = max_in_flight or 2 * workers
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            for seeds in chunks:
+                pending.append(executor.submit(generate_crossings, config, seeds))
+                while len(pending) >= max_in_flight or (pending and pending[0].done()):
+                    for arrays in pending.popleft().result():
+                        yield event_snapshot.Snapshot(arrays=arrays)
+            while pending:
+                for arrays in pending.popleft().result():
+                    yield event_snapshot.Snapshot(arrays=arrays)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def generate_event_sample(self, n_events, n_particles, pileup=1, **kwargs) -> list:
+        """
+        Returns the list of the n_events bunch crossings yielded by iter_event_sample().
+        """
+        return list(self.iter_event_sample(n_events, n_particles, pileup=pileup, **kwargs))
+
     def _rebuild_modules(self):
         """Rebuilds the module list with current hits."""
         self.modules = []
         for mod_id, lx, ly, zpos in self.detector_geometry:
             hits = [h for h in self.hits if h.module_id == mod_id]
             self.modules.append(em.Module(mod_id, zpos, lx, ly, hits))
-        
\ No newline at end of file
+
+
+# -------------------------------------------------------------------------
+# Bunch crossings of iter_event_sample(), one child seed sequence each
+# -------------------------------------------------------------------------
+def generate_crossing(config: dict, seed: np.random.SeedSequence) -> dict:
+    """
+    Generates one bunch crossing with the settings of StateEventGenerator.iter_event_sample()
+    and returns its event_snapshot.snapshot_arrays().
+    """
+    from toy_model import event_snapshot
+
+    pileup = len(config["n_particles"])
+    gen = StateEventGenerator(
+        config["detector_geometry"],
+        phi_min=config["phi_min"],
+        phi_max=config["phi_max"],
+        theta_min=config["theta_min"],
+        theta_max=config["theta_max"],
+        events=pileup,
+        n_particles=config["n_particles"],
+        measurement_error=config["measurement_error"],
+        collision_noise=config["collision_noise"],
+        seed=seed,
+    )
+    gen.measurment_error_flag = config["measurment_error_flag"]
+    if config["physical_variance"] is None:
+        gen.primary_vertices = [(0, 0, 0)] * pileup
+    else:
+        gen.generate_random_primary_vertices(config["physical_variance"])
+    gen.generate_particles([[config["particle"]] * n for n in config["n_particles"]])
+    truth_event = gen.generate_complete_events()
+    noisy_event = gen.make_noisy_event(drop_rate=config["drop_rate"], ghost_rate=config["ghost_rate"])
+    params = {
+        "entropy": seed.entropy,
+        "spawn_key": list(seed.spawn_key),
+        "primary_vertices": gen.primary_vertices,
+        "n_particles": config["n_particles"],
+        "measurement_error": config["measurement_error"],
+        "collision_noise": config["collision_noise"],
+        "drop_rate": config["drop_rate"],
+        "ghost_rate": config["ghost_rate"],
+    }
+    return event_snapshot.snapshot_arrays(
+        {"params": params, "truth_event": truth_event, "noisy_event": noisy_event}
+    )
+
+
+def generate_crossings(config: dict, seeds: list) -> list[dict]:
+    """
+    Generates one bunch crossing per seed sequence of seeds (one task of a worker process).
+    """
+    return [generate_crossing(config, seed) for seed in seeds]
@@ -30,23 +30,15 @@
 #
 # class Hit
 # Added:
-#    theta: float = field(init=False)  # Phase in polar coordinates when projected onto the XY plane
-#    index: int = field(init=False)    # Index of the hit in an array of hits
-#
-#    def __post_init__(self): 
-#        self.theta = math.atan2(self.y, self.x)
-#        self.index = 0
+#    index: int = field(init=False, default=0)  # Index of the hit in an array of hits
+#    theta                                      # Phase in polar coordinates when projected onto the XY plane,
+#                                               # property computed on first access
 #
 # class Segment
 # Added:
-#    module_id: int = field(init=False)  # Module id of the hit in the outer module
-#    track_id: int = field(init=False)   # Track id of the hit in the outer module
-#    theta: float = field(init=False)    # Phase in polar coordinates when projected onto the XY plane
-#
-#    def __post_init__(self):
-#        self.module_id = self.hits[1].module_id
-#        self.track_id = self.hits[1].track_id
-#        self.theta = math.atan2(self.hits[1].y - self.hits[0].y, self.hits[1].x - self.hits[0].x)
+#    module_id   # Module id of the hit in the outer module, property
+#    track_id    # Track id of the hit in the outer module, property
+#    theta       # Phase in polar coordinates when projected onto the XY plane, property computed on first access
 #
 #     def p0(self):
 #         return [self.hits[0].x, self.hits[0].y, self.hits[0].z]
@@ -54,9 +46,14 @@
 #     def p1(self):
 #         return [self.hits[1].x, self.hits[1].y, self.hits[1].z]
 #
+# class Hit, Segment, Track
+#    Declared with slots=True (no per-instance __dict__); __setstate__ also accepts the state of
+#    instances pickled before the classes had slots
+#
 # class Event
 # Added:
 #    ghost_hits: []
+#    Lazily built indexes: get_hit(), hit_index(), segments_of_hit(), hits_in_module(), hits_of_track()
 #-------------------------------------------------------------------------------------------------------------------------
 
 #-----------------------------------------------------------------------------------------------------
@@ -89,7 +86,19 @@ import math
 # Abstract base class for detector geometry definitions
 # -------------------------------------------------------------------------
 
-@dataclasses.dataclass(frozen=False)
+def _set_slot_state(obj, state, renames={}, derived=()):
+    """
+    __setstate__ of the slotted data classes. Accepts the (None, slots) state of slotted
+    instances and the __dict__ state of instances pickled before the classes had slots.
+    """
+    if isinstance(state, tuple):
+        state = {**(state[0] or {}), **(state[1] or {})}
+    for name, value in state.items():
+        if name not in derived:
+            setattr(obj, renames.get(name, name), value)
+
+
+@dataclasses.dataclass(frozen=False, slots=True)
 class Hit:
     hit_id: int
     x: float
@@ -101,8 +110,8 @@ class Hit:
     #-----------------------------------------------------------------------------------------------
     # Added by Alain Chancé
     # Computed fields (must come AFTER all init=True fields)
-    theta: float = field(init=False)  # Phase in polar coordinates when projected onto the XY plane
-    index: int = field(init=False)    # Index of the hit in an array of hits
+    index: int = field(init=False, default=0)       # Index of the hit in an array of hits
+    _theta: float = field(init=False, default=None, repr=False)  # Cache of theta
     #-----------------------------------------------------------------------------------------------
 
     def __getitem__(self, index):
@@ -112,10 +121,16 @@ class Hit:
         return self is __value
 
     #----------------------------------------------------------------
-    # Added by Alain chancé
-    def __post_init__(self): 
-        self.theta = math.atan2(self.y, self.x)
-        self.index = 0
+    # Phase in polar coordinates when projected onto the XY plane,
+    # computed on first access
+    @property
+    def theta(self) -> float:
+        if self._theta is None:
+            self._theta = math.atan2(self.y, self.x)
+        return self._theta
+
+    def __setstate__(self, state):
+        _set_slot_state(self, state, renames={"theta": "_theta"})
     #----------------------------------------------------------------
     
 @dataclasses.dataclass(frozen=False)
@@ -132,15 +147,13 @@ class Module:
         else:
             return False
         
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Segment:
     hits: list[Hit]
     segment_id: int
     #-------------------------------------------------------------------------------------------------
     # Added by Alain Chancé
-    module_id: int = field(init=False)  # Module id of the hit in the outer module
-    track_id: int = field(init=False)   # Track id of the hit in the outer module
-    theta: float = field(init=False)    # Phase in polar coordinates when projected onto the XY plane
+    _theta: float = field(init=False, default=None, repr=False)  # Cache of theta
     #-------------------------------------------------------------------------------------------------
     
     def __eq__(self, __value: object) -> bool:
@@ -162,18 +175,33 @@ class Segment:
     #-----------------------
     # Added by Alain Chancé
     #-----------------------
-    def __post_init__(self):
-        self.module_id = self.hits[1].module_id
-        self.track_id = self.hits[1].track_id
-        self.theta = math.atan2(self.hits[1].y - self.hits[0].y, self.hits[1].x - self.hits[0].x)
+    @property
+    def module_id(self) -> int:
+        """Module id of the hit in the outer module."""
+        return self.hits[1].module_id
+
+    @property
+    def track_id(self) -> int:
+        """Track id of the hit in the outer module."""
+        return self.hits[1].track_id
+
+    @property
+    def theta(self) -> float:
+        """Phase in polar coordinates when projected onto the XY plane, computed on first access."""
+        if self._theta is None:
+            self._theta = math.atan2(self.hits[1].y - self.hits[0].y, self.hits[1].x - self.hits[0].x)
+        return self._theta
 
     def p0(self):
         return [self.hits[0].x, self.hits[0].y, self.hits[0].z]
 
     def p1(self):
         return [self.hits[1].x, self.hits[1].y, self.hits[1].z]
+
+    def __setstate__(self, state):
+        _set_slot_state(self, state, renames={"theta": "_theta"}, derived=("module_id", "track_id"))
         
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Track:
     track_id    : int
     hits        : list[Hit]
@@ -182,6 +210,9 @@ class Track:
     def __eq__(self, __value: object) -> bool:
         return self is __value
 
+    def __setstate__(self, state):
+        _set_slot_state(self, state)
+
 @dataclasses.dataclass
 class module:
     module_id: int
@@ -218,6 +249,18 @@ class Geometry(ABC):
         """
         pass
 
+    def points_on_bulk(self, x, y):
+        """
+        Vectorized point_on_bulk: returns a boolean mask with the broadcast shape of
+        the arrays x and y, True where the point (x, y) is within the geometry.
+        Subclasses override it with array comparisons; this fallback calls point_on_bulk.
+        """
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        mask = np.zeros(x.shape, dtype=bool)
+        for idx in np.ndindex(x.shape):
+            mask[idx] = self.point_on_bulk({'x': x[idx], 'y': y[idx]})
+        return mask
+
     def __len__(self):
         """
         Returns the number of modules.
@@ -255,6 +298,16 @@ class PlaneGeometry(Geometry):
                 return True
         return False
 
+    def points_on_bulk(self, x, y):
+        """
+        Checks which points (x, y) are within the boundaries of at least one plane.
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        mask = np.zeros(np.broadcast_shapes(x.shape, y.shape), dtype=bool)
+        for lx, ly in set(zip(self.lx, self.ly)):
+            mask |= (x < lx) & (x > -lx) & (y < ly) & (y > -ly)
+        return mask
+
 
 # -------------------------------------------------------------------------
 # Detector geometry with a rectangular void in the middle
@@ -292,6 +345,16 @@ class RectangularVoidGeometry(Geometry):
         else:
             return True
 
+    def points_on_bulk(self, x, y):
+        """
+        Checks which points (x, y) are outside the void region and inside the detector.
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        in_void = ((x < self.void_x_boundary) & (x > -self.void_x_boundary) &
+                   (y < self.void_y_boundary) & (y > -self.void_y_boundary))
+        outside = (x > self.lx[0]) | (x < -self.lx[0]) | (y > self.ly[0]) | (y < -self.ly[0])
+        return ~(in_void | outside)
+
 @dataclasses.dataclass
 class Event:
     detector_geometry: Geometry
@@ -307,55 +370,74 @@ class Event:
     def __eq__(self, __value: object) -> bool:
         return self is __value
 
-    def plot_segments(self):
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection='3d')
-        hits = []
-        for segment in self.segments:
-            hits.extend(segment.hits)
-
-        X = [h.z for h in hits]
-        Y = [h.y for h in hits]
-        Z = [h.x for h in hits]
-        ax.scatter(X, Y, Z, c='r', marker='o')
-
-        for segment in self.segments:
-            x = [h.z for h in segment.hits]
-            y = [h.y for h in segment.hits]
-            z = [h.x for h in segment.hits]
-            ax.plot(x, y, z, c='b')
-
-        resolution = 25  # Increase for finer mesh
-        for mod_id, lx, ly, zpos in self.detector_geometry:
-            xs = np.linspace(-lx, lx, resolution)
-            ys = np.linspace(-ly, ly, resolution)
-            X, Y = np.meshgrid(xs, ys)
-            Z = np.full_like(X, zpos, dtype=float)
+    #-------------------------------------------------------------------------------------
+    # Lazily built lookup indexes
+    #  - hit_id -> hit (first hit of self.hits with this id)
+    #  - hit -> segments of self.segments containing it (keyed by id(hit), hits are not hashable)
+    #  - module_id -> hits, track_id -> hits (in the order of self.hits)
+    # An index is rebuilt on first use after the list it is built from is reassigned or
+    # changes length; call invalidate_indexes() after replacing elements in place.
+    #-------------------------------------------------------------------------------------
+    _INDEX_SOURCES = {"hit_id": ("hits",), "hit_segments": ("segments",), "module_id": ("hits",), "track_id": ("hits",)}
+
+    def __setattr__(self, name, value):
+        if name in ("hits", "segments"):
+            self.__dict__.pop("_indexes", None)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # id() keys are meaningless in another process
+        state = dict(self.__dict__)
+        state.pop("_indexes", None)
+        return state
+
+    def invalidate_indexes(self):
+        self.__dict__.pop("_indexes", None)
+
+    def _index(self, name: str) -> dict:
+        indexes = self.__dict__.setdefault("_indexes", {})
+        sources = [getattr(self, s) or [] for s in self._INDEX_SOURCES[name]]
+        key = tuple((id(s), len(s)) for s in sources)
+        cached = indexes.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        index = {}
+        if name == "hit_id":
+            for h in sources[0]:
+                index.setdefault(h.hit_id, h)
+        elif name == "hit_segments":
+            for s in sources[0]:
+                for h in s.hits:
+                    segments = index.setdefault(id(h), [])
+                    if not segments or segments[-1] is not s:
+                        segments.append(s)
+        else:
+            for h in sources[0]:
+                index.setdefault(getattr(h, name), []).append(h)
+        indexes[name] = (key, index)
+        return index
 
-            for idx in np.ndindex(X.shape):
-                x_val = X[idx]
-                y_val = Y[idx]
-                if not self.detector_geometry.point_on_bulk({'x': x_val, 'y': y_val, 'z': zpos}):
-                    X[idx], Y[idx], Z[idx] = np.nan, np.nan, np.nan
+    def get_hit(self, hit_id: int, default=None):
+        """First hit of the event with hit_id, or default."""
+        return self._index("hit_id").get(hit_id, default)
 
-            ax.plot_surface(Z, Y, X, alpha=0.3, color='gray')
+    def hit_index(self) -> dict:
+        """Dictionary hit_id -> first hit of the event with this id."""
+        return self._index("hit_id")
 
-        ghost_hits = [h for h in self.hits if not any(h in s.hits for s in self.segments)]
-        X = [h.z for h in ghost_hits]
-        Y = [h.y for h in ghost_hits]
-        Z = [h.x for h in ghost_hits]
-        ax.scatter(X, Y, Z, c='g', marker='x')
+    def segments_of_hit(self, hit: Hit) -> list:
+        """Segments of the event containing hit."""
+        return self._index("hit_segments").get(id(hit), [])
 
-        ax.set_xlabel('Z (horizontal)')
-        ax.set_ylabel('Y')
-        ax.set_zlabel('X')
-        plt.tight_layout()
-        plt.show()
+    def hits_in_module(self, module_id: int) -> list:
+        return self._index("module_id").get(module_id, [])
 
-    def save_plot_segments(self, filename : str, params: dict = None):
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection='3d')
+    def hits_of_track(self, track_id: int) -> list:
+        return self._index("track_id").get(track_id, [])
 
+    def _draw_segments(self, ax):
+        """Draws the hits, segments, bulk of the modules and ghost hits of the event on a 3D axis."""
         hits = []
         for segment in self.segments:
             hits.extend(segment.hits)
@@ -373,24 +455,21 @@ class Event:
             ax.plot(x, y, z, c='b')
 
         # Draw planes from geometry, but only show regions that are in the bulk
-        resolution = 25
+        resolution = 25  # Increase for finer mesh
         for mod_id, lx, ly, zpos in self.detector_geometry:
             xs = np.linspace(-lx, lx, resolution)
             ys = np.linspace(-ly, ly, resolution)
             X, Y = np.meshgrid(xs, ys)
             Z = np.full_like(X, zpos, dtype=float)
 
-            for idx in np.ndindex(X.shape):
-                x_val = X[idx]
-                y_val = Y[idx]
-                if not self.detector_geometry.point_on_bulk({'x': x_val, 'y': y_val, 'z': zpos}):
-                    X[idx], Y[idx], Z[idx] = np.nan, np.nan, np.nan
+            off_bulk = ~self.detector_geometry.points_on_bulk(X, Y)
+            X[off_bulk], Y[off_bulk], Z[off_bulk] = np.nan, np.nan, np.nan
 
             # Plot, using (Z, Y, X) to match the existing axis mappings
             ax.plot_surface(Z, Y, X, alpha=0.3, color='gray')
 
         # plot ghost_hits (hits that are not part of a segment)
-        ghost_hits = [h for h in self.hits if not any(h in s.hits for s in self.segments)]
+        ghost_hits = [h for h in self.hits if not self.segments_of_hit(h)]
         X = [h.z for h in ghost_hits]
         Y = [h.y for h in ghost_hits]
         Z = [h.x for h in ghost_hits]
@@ -399,6 +478,18 @@ class Event:
         ax.set_xlabel('Z (horizontal)')
         ax.set_ylabel('Y')
         ax.set_zlabel('X')
+
+    def plot_segments(self):
+        fig = plt.figure()
+        ax = fig.add_subplot(111, projection='3d')
+        self._draw_segments(ax)
+        plt.tight_layout()
+        plt.show()
+
+    def save_plot_segments(self, filename : str, params: dict = None):
+        fig = plt.figure()
+        ax = fig.add_subplot(111, projection='3d')
+        self._draw_segments(ax)
         if params:
             plt.title(f"Event Parameters: {params}")
 
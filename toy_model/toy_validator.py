@@ -128,6 +128,7 @@ class EventValidator:
     Fast retuning:
       - recompute_from_track_table(...) re-derives all metrics for arbitrary gates
         without re-doing hit intersections.
+      - scan_thresholds(...) does the same for whole grids of gates in one vectorized pass.
     """
 
     # -------------------------------------------------------------------------
@@ -148,6 +149,13 @@ class EventValidator:
             tid: {h.hit_id for h in t.hits} for tid, t in self.truth_tracks.items()
         }
 
+        # Inverted index hit_id -> truth ids holding that hit, in truth_tracks order
+        self.truth_ids_by_hit: Dict[int, List[int]] = {}
+        for tid, T_j in self.truth_track_hits.items():
+            for hit_id in T_j:
+                self.truth_ids_by_hit.setdefault(hit_id, []).append(tid)
+        self._truth_rank: Dict[int, int] = {tid: k for k, tid in enumerate(self.truth_track_hits)}
+
         #------------------------------------------------------------------------------------------------------
         # Reco maps
         # Updated by Alain Chancé
@@ -224,8 +232,22 @@ class EventValidator:
             best_truth_hits = 0
 
             if r_size > 0:
-                for truth_id, T_j in self.truth_track_hits.items():
-                    correct = len(R_i & T_j)
+                # Shared hit counts, only for truths sharing at least one hit (inverted index)
+                shared: Dict[int, int] = {}
+                for hit_id in R_i:
+                    for truth_id in self.truth_ids_by_hit.get(hit_id, ()):
+                        shared[truth_id] = shared.get(truth_id, 0) + 1
+
+                # A truth sharing no hit has purity 0 and only wins when no truth shares a hit;
+                # the first truth then wins the ties, as when scanning every truth
+                if shared:
+                    scanned = sorted(shared, key=self._truth_rank.__getitem__)
+                else:
+                    scanned = list(self.truth_track_hits)[:1]
+
+                for truth_id in scanned:
+                    T_j = self.truth_track_hits[truth_id]
+                    correct = shared.get(truth_id, 0)
                     purity = correct / r_size if r_size else 0.0
                     t_size = len(T_j) if len(T_j) > 0 else 1
                     completeness = correct / t_size
@@ -616,6 +638,104 @@ class EventValidator:
             "m_n_matched_truth": len(matched_truth_ids),
         }
 
+    # -------------------------------------------------------------------------
+    # Threshold scans from per-track table (vectorized over a grid of gates)
+    # -------------------------------------------------------------------------
+    def scan_thresholds(
+        self,
+        track_df: pd.DataFrame,
+        purity_grid=(0.7,),
+        completeness_grid=(0.7,),
+        min_shared_hits_grid=(0,),
+        max_cells: int = 20_000_000,
+    ) -> pd.DataFrame:
+        """
+        recompute_from_track_table() for every combination of purity_min, completeness_min
+        (None: no completeness gate) and min_shared_hits in the grids, in one pass.
+
+        Candidates are sorted once by (best truth, correct hits desc, purity desc, table order),
+        the order in which recompute_from_track_table() picks primaries. For each gate
+        combination, the acceptance mask is a row of a (gates x tracks) boolean matrix and a
+        running count of accepted tracks within each truth group marks the primaries (first
+        accepted track of the group). Metrics are then row sums and matrix products. Gates
+        are processed in blocks of at most max_cells matrix cells.
+
+        Returns one row per gate combination with the gate values and the m_* metrics of
+        recompute_from_track_table().
+        """
+        cand = track_df[track_df["candidate"] == True]  # noqa: E712
+        truth = cand["best_truth_id"].to_numpy(dtype=float)
+        correct = cand["correct_hits"].to_numpy(dtype=np.int64)
+        purity = cand["purity"].to_numpy(dtype=float)
+        completeness = cand["completeness"].to_numpy(dtype=float)
+        truth_hits = cand["truth_hits"].to_numpy(dtype=float)
+
+        # Sort once; tracks without a best truth go last and never become primaries
+        has_truth = ~np.isnan(truth)
+        truth_key = np.where(has_truth, truth, np.inf)
+        order = np.lexsort((np.arange(len(cand)), -purity, -correct, truth_key))
+        truth, has_truth = truth[order], has_truth[order]
+        correct, purity, completeness, truth_hits = correct[order], purity[order], completeness[order], truth_hits[order]
+        n = len(truth)
+
+        # Start of the truth group of each sorted track
+        new_group = np.ones(n, dtype=bool)
+        new_group[1:] = truth[1:] != truth[:-1]
+        group_start = np.maximum.accumulate(np.where(new_group, np.arange(n), 0)) if n else np.zeros(0, dtype=int)
+        recon = has_truth & np.isin(np.where(has_truth, truth, -1), list(self.reconstructible_truth_ids))
+
+        grid = np.array(
+            [(p, np.nan if c is None else c, s)
+             for p in purity_grid for c in completeness_grid for s in min_shared_hits_grid],
+            dtype=float,
+        ).reshape(-1, 3)
+        total_rec_candidates = int(n)
+        total_reconstructible = int(len(self.reconstructible_truth_ids))
+
+        def ratio(a, b):
+            return np.divide(a, b, out=np.zeros(len(a)), where=b > 0)
+
+        block = max(1, int(max_cells // max(n, 1)))
+        rows = []
+        for start in range(0, len(grid), block):
+            g = grid[start:start + block]
+            p_min, c_min, s_min = g[:, 0:1], g[:, 1:2], g[:, 2:3]
+
+            accepted = (purity >= p_min) & (correct >= s_min)
+            accepted &= np.isnan(c_min) | (completeness >= c_min)
+
+            # Primary: first accepted track of its truth group
+            counts = np.cumsum(accepted, axis=1)
+            before = np.where(group_start > 0, counts[:, np.maximum(group_start - 1, 0)], 0) if n else counts
+            primary = accepted & has_truth & (counts - before == 1)
+
+            n_acc = accepted.sum(axis=1)
+            n_primary = primary.sum(axis=1)
+            n_clones = (accepted & has_truth).sum(axis=1) - n_primary
+            n_matched_truth = (primary & recon).sum(axis=1)
+            n_ghosts = total_rec_candidates - n_acc
+
+            w_sum = primary @ truth_hits
+            rows.append(pd.DataFrame({
+                "purity_min": g[:, 0],
+                "completeness_min": g[:, 1],
+                "min_shared_hits": g[:, 2].astype(int),
+                "m_reconstruction_efficiency": ratio(n_matched_truth, np.full(len(g), total_reconstructible)),
+                "m_ghost_rate": ratio(n_ghosts, np.full(len(g), total_rec_candidates)),
+                "m_clone_fraction_total": ratio(n_clones, np.full(len(g), total_rec_candidates)),
+                "m_clone_fraction_among_matched": ratio(n_clones, n_acc),
+                "m_purity_all_matched": ratio(accepted @ purity, n_acc),
+                "m_purity_primary_only": ratio(primary @ purity, n_primary),
+                "m_hit_efficiency_mean": ratio(primary @ completeness, n_primary),
+                "m_hit_efficiency_weighted": ratio(primary @ (completeness * truth_hits), w_sum),
+                "m_total_rec_candidates": total_rec_candidates,
+                "m_n_ghosts": n_ghosts,
+                "m_n_clones": n_clones,
+                "m_n_matched_reco": n_acc,
+                "m_n_matched_truth": n_matched_truth,
+            }))
+        return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+
     # -------------------------------------------------------------------------
     # Optional: truth-length binning (useful diagnostics)
     # -------------------------------------------------------------------------
@@ -648,4 +768,226 @@ class EventValidator:
                 "matched": int(tid in truth_to_recs),
                 "reconstructible": int(tid in self.reconstructible_truth_ids),
             })
-        return pd.DataFrame(rows)
\ No newline at end of file
+        return pd.DataFrame(rows)
+
+# -----------------------------------------------------------------------------
+# Batch validation (many events at once, columnar)
+# -----------------------------------------------------------------------------
+
+def batch_label_arrays(
+    events,
+    reconstructible_filter: Optional[Callable[[Track], bool]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Columnar hit labels of many events for validate_batch().
+
+    events: iterable of (truth_event, rec_tracks), as passed to EventValidator.
+
+    Returns a dict of arrays with two levels of offsets (events -> tracks -> hits):
+      truth_event_offsets  truth tracks of event e: truth_event_offsets[e]:truth_event_offsets[e + 1]
+      truth_track_ids      track_id of each truth track
+      truth_hit_offsets    hits of truth track k: truth_hit_offsets[k]:truth_hit_offsets[k + 1]
+      truth_hit_ids        hit_id of each truth hit
+      reconstructible      reconstructible_filter(track) of each truth track (all True if None)
+      rec_event_offsets, rec_track_ids, rec_hit_offsets, rec_hit_ids: the same for reco tracks
+    """
+    out = {k: [] for k in ("truth_track_ids", "truth_hit_ids", "truth_lengths", "reconstructible",
+                           "rec_track_ids", "rec_hit_ids", "rec_lengths", "truth_counts", "rec_counts")}
+    for truth_event, rec_tracks in events:
+        out["truth_counts"].append(len(truth_event.tracks))
+        for t in truth_event.tracks:
+            out["truth_track_ids"].append(t.track_id)
+            out["truth_lengths"].append(len(t.hits))
+            out["truth_hit_ids"].extend(h.hit_id for h in t.hits)
+            out["reconstructible"].append(True if reconstructible_filter is None else bool(reconstructible_filter(t)))
+        out["rec_counts"].append(len(rec_tracks))
+        for t in rec_tracks:
+            out["rec_track_ids"].append(t.track_id)
+            out["rec_lengths"].append(len(t.hits))
+            out["rec_hit_ids"].extend(h.hit_id for h in t.hits)
+
+    def offsets(counts):
+        return np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+
+    return {
+        "truth_event_offsets": offsets(out["truth_counts"]),
+        "truth_track_ids": np.array(out["truth_track_ids"], dtype=np.int64),
+        "truth_hit_offsets": offsets(out["truth_lengths"]),
+        "truth_hit_ids": np.array(out["truth_hit_ids"], dtype=np.int64),
+        "reconstructible": np.array(out["reconstructible"], dtype=bool),
+        "rec_event_offsets": offsets(out["rec_counts"]),
+        "rec_track_ids": np.array(out["rec_track_ids"], dtype=np.int64),
+        "rec_hit_offsets": offsets(out["rec_lengths"]),
+        "rec_hit_ids": np.array(out["rec_hit_ids"], dtype=np.int64),
+    }
+
+
+def _unique_pairs(track_offsets: np.ndarray, hit_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(track, hit_id) pairs without duplicate hits per track, and the hit set size of each track."""
+    n_tracks = len(track_offsets) - 1
+    track = np.repeat(np.arange(n_tracks), np.diff(track_offsets))
+    order = np.lexsort((hit_ids, track))
+    track, hit_ids = track[order], hit_ids[order]
+    keep = np.ones(len(track), dtype=bool)
+    keep[1:] = (track[1:] != track[:-1]) | (hit_ids[1:] != hit_ids[:-1])
+    track, hit_ids = track[keep], hit_ids[keep]
+    return track, hit_ids, np.bincount(track, minlength=n_tracks)
+
+
+def validate_batch(
+    labels: Dict[str, np.ndarray],
+    purity_min: float = 0.7,
+    completeness_min: float = 0.7,
+    min_rec_hits: Optional[int | float] = None,
+    enforce_completeness: bool = False,
+    return_tracks: bool = False,
+):
+    """
+    Vectorized EventValidator.compute_metrics() over many events.
+
+    labels is the output of batch_label_arrays(). Hits are joined to truth tracks per
+    event, shared hit counts are grouped per (reco, truth) pair, and best matches,
+    primaries, clones and ghosts are selected with sorts instead of per-track loops,
+    following the same rules as EventValidator.
+
+    Returns a DataFrame with one row per event (column "event", the counters and the
+    m_* metrics of compute_metrics, without the ID lists) and, if return_tracks is True,
+    the per-track table of build_track_table() for all events (with an "event" column).
+    """
+    t_ev_off = labels["truth_event_offsets"]
+    r_ev_off = labels["rec_event_offsets"]
+    n_events = len(t_ev_off) - 1
+    n_truth = len(labels["truth_track_ids"])
+    n_rec = len(labels["rec_track_ids"])
+
+    t_event = np.repeat(np.arange(n_events), np.diff(t_ev_off))
+    r_event = np.repeat(np.arange(n_events), np.diff(r_ev_off))
+    t_rank = np.arange(n_truth) - t_ev_off[t_event]
+    reconstructible = labels["reconstructible"]
+
+    t_pair, t_hit, t_size = _unique_pairs(labels["truth_hit_offsets"], labels["truth_hit_ids"])
+    r_pair, r_hit, r_size = _unique_pairs(labels["rec_hit_offsets"], labels["rec_hit_ids"])
+
+    # Reco-level gate
+    t_len = np.diff(labels["truth_hit_offsets"])
+    max_hits = np.zeros(n_events, dtype=np.int64)
+    np.maximum.at(max_hits, t_event[reconstructible], t_len[reconstructible])
+    if min_rec_hits is None:
+        gate = purity_min * max_hits
+    else:
+        gate = np.full(n_events, int(np.ceil(min_rec_hits)))
+    candidate = r_size >= gate[r_event]
+
+    # Shared hits of every (reco, truth) pair sharing at least one hit, joined on (event, hit_id)
+    shared = pd.merge(
+        pd.DataFrame({"e": r_event[r_pair], "h": r_hit, "r": r_pair}),
+        pd.DataFrame({"e": t_event[t_pair], "h": t_hit, "t": t_pair}),
+        on=["e", "h"],
+    )
+    pair_key, correct = np.unique(shared["r"].to_numpy() * max(n_truth, 1) + shared["t"].to_numpy(),
+                                  return_counts=True)
+    pr, pt = pair_key // max(n_truth, 1), pair_key % max(n_truth, 1)
+
+    # Best truth per reco: max correct hits, then smallest |T| (higher completeness), then truth order
+    order = np.lexsort((t_rank[pt], t_size[pt], -correct, pr))
+    pr, pt, correct = pr[order], pt[order], correct[order]
+    first = np.unique(pr, return_index=True)[1]
+
+    best = np.full(n_rec, -1, dtype=np.int64)
+    best_correct = np.zeros(n_rec, dtype=np.int64)
+    best[pr[first]] = pt[first]
+    best_correct[pr[first]] = correct[first]
+
+    # Without shared hits, the first truth of the event is the best association (purity 0)
+    n_truth_event = np.diff(t_ev_off)
+    no_shared = (best < 0) & (r_size > 0) & (n_truth_event[r_event] > 0)
+    best[no_shared] = t_ev_off[r_event[no_shared]]
+
+    has_best = best >= 0
+    truth_hits = np.where(has_best, t_size[np.maximum(best, 0)] if n_truth else 0, 0)
+    purity = np.where(has_best, best_correct / np.maximum(r_size, 1), 0.0)
+    completeness = np.where(has_best, best_correct / np.maximum(truth_hits, 1), 0.0)
+
+    accepted = candidate & has_best & (purity >= purity_min)
+    if enforce_completeness:
+        accepted &= completeness >= completeness_min
+
+    # Primary per truth: max correct hits, then max purity, then reco order; others are clones
+    acc = np.flatnonzero(accepted)
+    acc = acc[np.lexsort((acc, -purity[acc], -best_correct[acc], best[acc]))]
+    is_primary = np.zeros(n_rec, dtype=bool)
+    is_primary[acc[np.unique(best[acc], return_index=True)[1]]] = True
+    is_clone = accepted & ~is_primary
+    is_ghost = candidate & (purity < float(purity_min)) & ~is_clone
+
+    # Per-event sums
+    def per_event(mask, weights=None):
+        w = None if weights is None else weights[mask]
+        return np.bincount(r_event[mask], weights=w, minlength=n_events)
+
+    N_true = n_truth_event
+    N_rec = per_event(candidate).astype(int)
+    N_good = per_event(is_primary).astype(int)
+    N_clone = per_event(is_clone).astype(int)
+    N_ghost = per_event(is_ghost).astype(int)
+
+    def ratio(a, b):
+        return np.divide(a, b, out=np.zeros(n_events), where=b > 0)
+
+    purity_avg = ratio(per_event(is_primary, purity), N_good)
+    comp_mean = ratio(per_event(is_primary, completeness), N_good)
+    w_sum = per_event(is_primary, truth_hits.astype(float))
+    comp_weighted = ratio(per_event(is_primary, completeness * truth_hits), w_sum)
+
+    matched_truth = np.zeros(n_truth, dtype=bool)
+    matched_truth[best[is_primary]] = True
+    n_reconstructible = np.bincount(t_event[reconstructible], minlength=n_events)
+    n_matched_recon = np.bincount(t_event[matched_truth & reconstructible], minlength=n_events)
+
+    ghost_rate = ratio(N_ghost, N_rec)
+    metrics = pd.DataFrame({
+        "event": np.arange(n_events),
+        "n_true_tracks": N_true,
+        "n_rec_tracks": N_rec,
+        "n_rec_good": N_good,
+        "n_rec_ghost": N_ghost,
+        "n_rec_clone": N_clone,
+        "track_efficiency_good_over_true": ratio(N_good, N_true),
+        "track_ghost_rate_over_rec": ghost_rate,
+        "hit_purity_mean_primary": purity_avg,
+        "hit_efficiency_mean_primary": comp_mean,
+        "hit_efficiency_weighted_primary": comp_weighted,
+        "m_total_truth_tracks": N_true,
+        "m_total_reconstructible_truth": n_reconstructible,
+        "m_total_rec_candidates": N_rec,
+        "m_reconstruction_efficiency": ratio(n_matched_recon, n_reconstructible),
+        "m_ghost_rate": ghost_rate,
+        "m_clone_fraction_total": ratio(N_clone, N_rec),
+        "m_clone_fraction_among_matched": ratio(N_clone, N_good + N_clone),
+        "m_purity_all_matched": purity_avg,
+        "m_purity_primary_only": purity_avg,
+        "m_hit_efficiency_mean": comp_mean,
+        "m_hit_efficiency_weighted": comp_weighted,
+        "m_n_ghosts": N_ghost,
+        "m_n_clones": N_clone,
+        "m_n_matched_reco": N_good + N_clone,
+        "m_n_matched_truth": np.bincount(t_event[matched_truth], minlength=n_events),
+    })
+    if not return_tracks:
+        return metrics
+
+    truth_ids = labels["truth_track_ids"]
+    tracks = pd.DataFrame({
+        "event": r_event,
+        "rec_id": labels["rec_track_ids"],
+        "best_truth_id": np.where(has_best, truth_ids[np.maximum(best, 0)] if n_truth else 0, np.nan),
+        "accepted_truth_id": np.where(accepted, truth_ids[np.maximum(best, 0)] if n_truth else 0, np.nan),
+        "candidate": candidate,
+        "accepted": accepted,
+        "rec_hits": r_size,
+        "truth_hits": truth_hits,
+        "correct_hits": best_correct,
+        "purity": purity,
+        "completeness": completeness,
+    })[candidate].reset_index(drop=True)
+    return metrics, tracks
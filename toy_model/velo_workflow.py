@@ -8,32 +8,95 @@ Subcommands
    Batched Velo Toy worker that records full events per parameter combo.
 
    For each row in the selected batch from --params:
+     - Seeds the generator from the combo's event-generation parameters and --seed
      - Builds geometry and generates events (truth)
      - Applies noise (ghost/drop) and reconstructs
-     - Saves a compressed snapshot (.pkl.gz) containing:
+     - Saves a compressed snapshot containing:
            params, truth_event, noisy_event, reco_tracks, reco_event,
            classical_solution, disc_solution, hamiltonian
+       as columnar arrays (.npz, see toy_model.event_snapshot) or, with
+       --format pkl, as a dill pickle (.pkl.gz)
      - Appends a lightweight index row to events_index.csv
-       in the given job output directory.
+       in the given job output directory, through a buffered
+       writer (IndexWriter) that flushes every --index-flush rows to a
+       per-process shard and merges it into events_index.csv at the end.
+
+   Combos with the same event-generation parameters (meas, coll, ghost, drop,
+   repeat, n_particles, phi_max) share one generated event and its segments;
+   only the reconstruction (e_win, step_flag, erf_sigma) runs per combo.
+
+   Each combo has a stable key (combo_key, also written to events_index.csv).
+   With --resume, combos whose key is in completed_combos.txt or in an index
+   row are skipped, and temporary snapshot files left on this host by dead
+   processes are removed; other files and index rows are not touched. Under
+   --resume the key of each combo is appended to completed_combos.txt once
+   its index row is written, so an interrupted run loses at most
+   --index-flush combos (default 1 with --resume).
+
+   With --workers N > 1, combos run in a pool of N processes with at most
+   --max-in-flight pending tasks (one task per generation key). Only the parent process writes
+   events_index.csv, in combo order, so rows are identical for any N.
 
 2) aggregate
    Process ONE batch of saved event snapshots:
      - scans runs_dir/batch_<batch>/*/events_index.csv
-     - loads each events_*.pkl.gz
+     - loads each events_*.npz or events_*.pkl.gz
      - runs EventValidator(noisy, reco)
      - writes (in the *batch folder* out_dir = runs_dir/batch_<batch>/):
-         event_store.pkl.gz   (params + metrics; optionally full objects)
+         event_store/         (params + metrics; optionally full events), a
+                              memory-mapped store (see toy_model.event_store),
+                              or event_store.pkl.gz with --store-format pkl
          metrics.csv          (flat table for quick analysis)
          events_index.csv     (merged per-job indices for the batch)
+         aggregate_manifest.csv (name and signature of aggregated snapshots)
+
+   With --workers N, snapshots are loaded and validated on N processes.
+   With --incremental, snapshots already listed in aggregate_manifest.csv
+   with an unchanged size and mtime are skipped; snapshots whose validation
+   failed are aggregated again.
+
+3) run
+   Streaming alternative to generate + aggregate. Each combo goes through
+   generator stages (generate_stage -> reconstruct_stage -> validate_stage)
+   that hold one generated event at a time, and only its metrics row is
+   appended to outdir/metrics.csv (same columns as aggregate). With
+   --snapshots compact|full, npz snapshots and events_index.csv are also
+   written. --workers, --max-in-flight and --seed behave as for generate.
+
+4) coordinate / work
+   Built-in alternative to splitting params.csv by batch for an external
+   scheduler. 'coordinate' writes the combos of --params as tasks (one per
+   generation key) in a --queue directory, collects the results and writes
+   events_index.csv in combo order. Any number of 'work' processes, on any
+   node sharing the filesystem, claim tasks by atomic renames, run them and
+   send heartbeats; tasks of a worker that stops beating are requeued.
+   --queue must be empty or a previous queue directory: nothing else is
+   cleared. Idle workers exit when the coordinator stops beating.
+
+5) convert
+   Converts events_*.pkl.gz snapshots under a directory to .npz and
+   updates the file column of the events_index.csv next to them.
 """
 
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 import csv
 import gzip
+import hashlib
+import io
+import json
+import os
 from pathlib import Path
+import re
+import shutil
+import socket
 import sys
+import threading
+import time
 
 import numpy as np
 import pandas as pd
@@ -43,6 +106,7 @@ from toy_model.state_event_generator import StateEventGenerator
 from toy_model import state_event_model
 from toy_model.simple_hamiltonian import SimpleHamiltonianFast, get_tracks_fast, construct_event
 from toy_model.toy_validator import EventValidator as evl
+from toy_model import event_snapshot, event_store
 
 # Prefer dill for broader object support; fall back to pickle
 try:
@@ -50,6 +114,11 @@ try:
 except ImportError:  # pragma: no cover
     import pickle as _pickle
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 
 # =====================================================================
 # Shared configuration
@@ -102,18 +171,10 @@ def epsilon_window(meas_err, coll_noise, dz, scale, theta_min):
 
 def dump_pickle(obj, path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with gzip.open(path, "wb") as f:
+    tmp = path.with_name(path.name + f".{socket.gethostname()}.{os.getpid()}.tmp")
+    with gzip.open(tmp, "wb") as f:
         _pickle.dump(obj, f, protocol=_pickle.HIGHEST_PROTOCOL)
-
-
-def append_index_row(index_csv: Path, row_dict: dict) -> None:
-    index_csv.parent.mkdir(parents=True, exist_ok=True)
-    new_file = not index_csv.exists()
-    with open(index_csv, "a", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=row_dict.keys())
-        if new_file:
-            w.writeheader()
-        w.writerow(row_dict)
+    tmp.replace(path)
 
 
 def make_detector():
@@ -122,21 +183,204 @@ def make_detector():
     )
 
 
+def combo_seed(meas, coll, ghost, drop, repeat, n_particles_config, phi_max, base_seed=0) -> np.random.SeedSequence:
+    """
+    Seed sequence of one combo, derived from its event-generation parameters and base_seed.
+
+    It does not depend on the worker count or the order in which combos run, and combos
+    that differ only in reconstruction parameters (e_win, step_flag, erf_sigma) generate
+    the same events.
+    """
+    key = (
+        f"m{float(meas)}_c{float(coll)}_g{float(ghost)}_d{float(drop)}_r{int(repeat)}"
+        f"_np_{n_particles_config}_phi{float(phi_max)}"
+    )
+    digest = hashlib.sha256(key.encode()).digest()
+    spawn_key = tuple(int.from_bytes(digest[i:i + 4], "little") for i in range(0, 16, 4))
+    return np.random.SeedSequence(entropy=int(base_seed), spawn_key=spawn_key)
+
+
+# =====================================================================
+# events_index.csv writer and reader
+# =====================================================================
+
+def index_shards(index_csv: Path) -> list:
+    """Shards left next to index_csv by IndexWriter, e.g. .events_index.<host>.<pid>.shard.csv."""
+    return sorted(index_csv.parent.glob(f".{index_csv.stem}.*.shard.csv"))
+
+
+@contextmanager
+def index_lock(index_csv: Path):
+    """
+    Exclusive lock on index_csv, held while it is rewritten (no-op without fcntl).
+    The lock is taken on a hidden file (.events_index.csv.lock) that the holder removes
+    before releasing it; a process that locked a file removed meanwhile retries.
+    """
+    index_csv.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = index_csv.parent / f".{index_csv.name}.lock"
+    if fcntl is None:
+        yield
+        return
+    while True:
+        f = open(lock_path, "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(lock_path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        f.close()
+    try:
+        yield
+    finally:
+        lock_path.unlink(missing_ok=True)
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+def merge_index_shards(index_csv: Path, shards: list = None) -> None:
+    """
+    Appends the rows of index shards to index_csv and removes the shards.
+    shards defaults to every shard next to index_csv. index_csv is rewritten
+    under a lock through a temporary file and a rename, so readers never see
+    a partial file and concurrent writers do not lose rows.
+    """
+    with index_lock(index_csv):
+        if shards is None:
+            shards = index_shards(index_csv)
+        shards = [s for s in shards if s.exists()]
+        if not shards:
+            return
+
+        def read_lines(path):
+            with open(path, newline="") as f:
+                return f.readlines()
+
+        lines = read_lines(index_csv) if index_csv.exists() else []
+        for shard in shards:
+            shard_lines = read_lines(shard)
+            if not shard_lines:
+                continue
+            if not lines:
+                lines = shard_lines
+            elif shard_lines[0] == lines[0]:
+                lines.extend(shard_lines[1:])
+            else:
+                # Different columns: let pandas align them
+                merged = pd.concat([pd.read_csv(io.StringIO("".join(lines))), pd.read_csv(shard)], ignore_index=True)
+                lines = merged.to_csv(index=False, lineterminator="\r\n").splitlines(keepends=True)
+
+        tmp = index_csv.with_name(index_csv.name + f".{os.getpid()}.tmp")
+        with open(tmp, "w", newline="") as f:
+            f.writelines(lines)
+        tmp.replace(index_csv)
+        for shard in shards:
+            shard.unlink()
+
+
+class IndexWriter:
+    """
+    Buffered, append-only writer of events_index.csv (also used for the
+    metrics.csv of the run subcommand).
+
+    Rows are buffered in memory and appended to a shard private to this process
+    every flush_every rows, with one open() and one csv.DictWriter per flush.
+    close() merges the shard into index_csv (merge_index_shards). The
+    shard of a process that dies before close() is kept and still read by
+    read_index().
+    """
+
+    def __init__(self, index_csv: Path, flush_every: int = 64, on_flush=None):
+        self.index_csv = Path(index_csv)
+        self.flush_every = max(1, int(flush_every))
+        self.on_flush = on_flush  # called with the rows of each flush, once they are in the shard
+        self.shard = self.index_csv.parent / f".{self.index_csv.stem}.{socket.gethostname()}.{os.getpid()}.shard.csv"
+        self._rows = []
+
+    def write(self, row_dict: dict) -> None:
+        self._rows.append(row_dict)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        self.shard.parent.mkdir(parents=True, exist_ok=True)
+        new_file = not self.shard.exists()
+        with open(self.shard, "a", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=self._rows[0].keys())
+            if new_file:
+                w.writeheader()
+            w.writerows(self._rows)
+        rows, self._rows = self._rows, []
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    def close(self) -> None:
+        self.flush()
+        if self.shard.exists():
+            merge_index_shards(self.index_csv, [self.shard])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_index(index_csv: Path) -> pd.DataFrame:
+    """
+    Reads events_index.csv together with any shard left next to it, in one
+    concatenated DataFrame. Returns an empty DataFrame if there is neither.
+    """
+    paths = ([index_csv] if index_csv.exists() else []) + index_shards(index_csv)
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+
+
+def append_index_row(index_csv: Path, row_dict: dict) -> None:
+    with IndexWriter(index_csv, flush_every=1) as writer:
+        writer.write(row_dict)
+
+
 # =====================================================================
 # Subcommand: generate  (event generation + reconstruction)
 # =====================================================================
 
-def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_particles_config, outdir: Path, phi_max=0.02):
+def generation_key(row: dict) -> tuple:
+    """
+    Event-generation parameters of a params.csv row:
+    (meas, coll, ghost, drop, repeat, n_particles, phi_max).
+    Rows with the same key generate the same events and differ only in reconstruction.
+    """
+    return (
+        float(row["meas"]),
+        float(row["coll"]),
+        float(row["ghost"]),
+        float(row["drop"]),
+        int(row["repeat"]),
+        # Get n_particles config, default to "default" if not in params
+        str(row.get("n_particles", "default")),
+        # Get phi_max, default to 0.02 for backwards compatibility
+        float(row.get("phi_max", 0.02)),
+    )
+
+
+def generate_event(meas, coll, ghost, drop, repeat, n_particles_config, phi_max=0.02, seed=0) -> dict:
+    """
+    Generates the truth and noisy events of one generation key and constructs their
+    segments once. Returns the dict consumed by reconstruct_event().
+    """
     # Parse n_particles configuration
     n_particles_per_event = parse_n_particles(n_particles_config)
     events = len(n_particles_per_event)
     total_particles = int(np.sum(n_particles_per_event))
-    
-    # Reproducible randomness per combo - seed based on repeat index
-    np.random.seed(repeat)
+
+    # Reproducible randomness per combo, independent of the process running it
+    seed_seq = combo_seed(meas, coll, ghost, drop, repeat, n_particles_config, phi_max, base_seed=seed)
 
     Detector = make_detector()
-    eps_win, threshold = epsilon_window(meas, coll, DZ_MM, e_win, THETA_MIN)
 
     seg = StateEventGenerator(
         Detector,
@@ -148,6 +392,7 @@ def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_pa
         n_particles=n_particles_per_event,
         measurement_error=float(meas),
         collision_noise=float(coll),
+        seed=seed_seq,
     )
 
     phi, theta = seg.phi_max, seg.theta_max
@@ -161,9 +406,47 @@ def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_pa
     seg.generate_particles(event_particles)
     event_tracks = seg.generate_complete_events()  # "truth" with associations
 
-    # Inject noise and reconstruct
+    # Inject noise
     false_tracks = seg.make_noisy_event(drop_rate=float(drop), ghost_rate=float(ghost))
+
+    # Segments and the connectivity + angle table do not depend on the reconstruction parameters
+    segments = SimpleHamiltonianFast(epsilon=0.0, gamma=2.0, delta=1.0)
+    segments.construct_segments(event_tracks)
+    segments.construct_angle_table()
+
+    return {
+        "meas": meas,
+        "coll": coll,
+        "ghost": ghost,
+        "drop": drop,
+        "repeat": int(repeat),
+        "n_particles_config": n_particles_config,
+        "n_particles_per_event": n_particles_per_event,
+        "events": events,
+        "total_particles": total_particles,
+        "phi": phi,
+        "theta": theta,
+        "truth_event": event_tracks,
+        "noisy_event": false_tracks,
+        "segments": segments,
+    }
+
+
+def reconstruct(generated: dict, e_win, thresh_flag, erf_sigma):
+    """
+    Reconstructs an event returned by generate_event() with one set of reconstruction
+    parameters. Returns the snapshot tag and the snapshot payload.
+    """
+    meas, coll, ghost, drop = generated["meas"], generated["coll"], generated["ghost"], generated["drop"]
+    repeat, n_particles_config = generated["repeat"], generated["n_particles_config"]
+    phi, theta = generated["phi"], generated["theta"]
+    event_tracks, false_tracks = generated["truth_event"], generated["noisy_event"]
+
+    eps_win, threshold = epsilon_window(meas, coll, DZ_MM, e_win, THETA_MIN)
+
+    # Reconstruct, reusing the segments of the event
     ham = SimpleHamiltonianFast(epsilon=float(eps_win), gamma=2.0, delta=1.0, theta_d=erf_sigma)
+    ham.share_segments(generated["segments"])
     ham.construct_hamiltonian(event=event_tracks, convolution=thresh_flag)
 
     classical_solution = ham.solve_classicaly()
@@ -182,7 +465,6 @@ def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_pa
         f"m{meas}_c{coll}_g{ghost}_d{drop}_r{repeat}_s{e_win}"
         f"_t_{thresh_flag}_e_{erf_sigma}_np_{n_particles_config}_phi{float(phi)}_theta{float(theta)}"
     )
-    snapshot_path = outdir / f"events_{tag}.pkl.gz"
     payload = {
         "params": {
             "hit_res": float(meas),
@@ -202,9 +484,9 @@ def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_pa
             "phi_max": float(phi),
             "theta_max": float(theta),
             "n_particles_config": n_particles_config,
-            "n_particles_per_event": n_particles_per_event,
-            "total_particles": total_particles,
-            "events": events,
+            "n_particles_per_event": generated["n_particles_per_event"],
+            "total_particles": generated["total_particles"],
+            "events": generated["events"],
         },
         "truth_event": event_tracks,      # before ghosts/drops
         "noisy_event": false_tracks,      # after ghosts/drops
@@ -214,28 +496,294 @@ def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_pa
         "disc_solution": discretized_solution,
         "hamiltonian": ham,
     }
-    dump_pickle(payload, snapshot_path)
-
-    # Lightweight index row for quick discovery without unpickling
-    index_csv = outdir / "events_index.csv"
-    append_index_row(
-        index_csv,
-        {
-            "file": snapshot_path.name,
-            "hit_res": meas,
-            "multi_scatter": coll,
-            "ghost_rate": ghost,
-            "drop_rate": drop,
-            "repeat": int(repeat),
-            "epsilon": float(ham.epsilon),
-            "scale": e_win,
-            "layers": LAYERS,
-            "events": events,
-            "particles_total": total_particles,
-            "n_particles_config": n_particles_config,
-            "thresh_flag": thresh_flag,
-        },
+    return tag, payload
+
+
+def snapshot_name(tag: str, snapshot_format: str = "npz") -> str:
+    suffix = event_snapshot.SNAPSHOT_SUFFIX if snapshot_format == "npz" else ".pkl.gz"
+    return f"events_{tag}{suffix}"
+
+
+def save_payload(payload: dict, path: Path, snapshot_format: str = "npz") -> None:
+    if snapshot_format == "npz":
+        event_snapshot.save_snapshot(payload, path)
+    else:
+        dump_pickle(payload, path)
+
+
+def make_index_row(generated: dict, e_win, thresh_flag, epsilon, fname: str) -> dict:
+    """Lightweight index row for quick discovery without loading the snapshot."""
+    return {
+        "file": fname,
+        "hit_res": generated["meas"],
+        "multi_scatter": generated["coll"],
+        "ghost_rate": generated["ghost"],
+        "drop_rate": generated["drop"],
+        "repeat": generated["repeat"],
+        "epsilon": float(epsilon),
+        "scale": e_win,
+        "layers": LAYERS,
+        "events": generated["events"],
+        "particles_total": generated["total_particles"],
+        "n_particles_config": generated["n_particles_config"],
+        "thresh_flag": thresh_flag,
+    }
+
+
+def reconstruct_event(generated: dict, e_win, thresh_flag, erf_sigma, outdir: Path, snapshot_format="npz") -> dict:
+    """
+    Reconstructs an event returned by generate_event() with one set of reconstruction
+    parameters and saves its snapshot. Returns its events_index.csv row.
+    """
+    tag, payload = reconstruct(generated, e_win, thresh_flag, erf_sigma)
+    fname = snapshot_name(tag, snapshot_format)
+    save_payload(payload, outdir / fname, snapshot_format)
+    return make_index_row(generated, e_win, thresh_flag, payload["params"]["epsilon"], fname)
+
+
+def run_one(meas, coll, ghost, drop, repeat, e_win, thresh_flag, erf_sigma, n_particles_config, outdir: Path, phi_max=0.02,
+            seed=0, write_index=True, snapshot_format="npz") -> dict:
+    """
+    Generates, reconstructs and saves one combo. Returns its events_index.csv row,
+    which is also appended to outdir/events_index.csv if write_index is True.
+    snapshot_format is "npz" (columnar, toy_model.event_snapshot) or "pkl" (dill + gzip).
+    """
+    generated = generate_event(meas, coll, ghost, drop, repeat, n_particles_config, phi_max=phi_max, seed=seed)
+    index_row = reconstruct_event(generated, e_win, thresh_flag, erf_sigma, outdir, snapshot_format=snapshot_format)
+    if write_index:
+        append_index_row(outdir / "events_index.csv", index_row)
+    return index_row
+
+
+def run_group(rows: list, outdir: Path, seed: int = 0, snapshot_format: str = "npz") -> list:
+    """
+    Runs params.csv rows sharing one generation key without writing the index: the event
+    is generated once and reconstructed for each row.
+    Returns, for each row, (index_row, None) on success and (None, error message) on failure,
+    so that a failing combo never propagates out of a worker process.
+    """
+    try:
+        generated = generate_event(*generation_key(rows[0]), seed=seed)
+    except Exception as e:
+        return [(None, f"{type(e).__name__}: {e}")] * len(rows)
+
+    results = []
+    for row in rows:
+        try:
+            index_row = reconstruct_event(
+                generated,
+                int(row["e_win"]),
+                int(row["step_flag"]),
+                float(row["erf_sigma"]),
+                outdir,
+                snapshot_format=snapshot_format,
+            )
+            results.append((index_row, None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def run_combo(row: dict, outdir: Path, seed: int = 0, snapshot_format: str = "npz"):
+    """
+    Runs one params.csv row without writing the index.
+    Returns (index_row, None) on success and (None, error message) on failure.
+    """
+    return run_group([row], outdir, seed, snapshot_format)[0]
+
+
+def group_combos(rows: list) -> list:
+    """
+    Groups the positions of rows by generation key, in order of first appearance.
+    A row whose key cannot be parsed forms its own group and fails when it runs.
+    """
+    groups = {}
+    for pos, row in enumerate(rows):
+        try:
+            key = generation_key(row)
+        except Exception:
+            key = ("row", pos)
+        groups.setdefault(key, []).append(pos)
+    return list(groups.values())
+
+
+def iter_group_results(rows: list, task, task_args: tuple = (), workers: int = 1, max_in_flight: int = None,
+                       label: str = "generate"):
+    """
+    Yields (position, result, error) for each row of rows, in completion order.
+
+    Rows are grouped by generation key (group_combos) and each group is one task:
+    task(group_rows, *task_args) returns one (result, error) per row of the group.
+    workers <= 1 runs the tasks in this process. Otherwise at most max_in_flight
+    (default 2 * workers) tasks are submitted to a pool of worker processes at a time.
+    If a worker process dies, the pool is restarted and the tasks it was running are
+    retried once before being reported as failed.
+    """
+    groups = group_combos(rows)
+
+    def group_rows(g):
+        return [rows[pos] for pos in groups[g]]
+
+    if workers <= 1:
+        for g in range(len(groups)):
+            for pos, (result, error) in zip(groups[g], task(group_rows(g), *task_args)):
+                yield pos, result, error
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    next_group = 0
+    retries = {}
+    retry_queue = []
+    executor = ProcessPoolExecutor(max_workers=workers)
+    in_flight = {}
+    try:
+        while next_group < len(groups) or retry_queue or in_flight:
+            while len(in_flight) < max_in_flight and (retry_queue or next_group < len(groups)):
+                if retry_queue:
+                    g = retry_queue.pop(0)
+                else:
+                    g = next_group
+                    next_group += 1
+                in_flight[executor.submit(task, group_rows(g), *task_args)] = g
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            lost = []
+            for future in done:
+                g = in_flight.pop(future)
+                try:
+                    results = future.result()
+                except BrokenProcessPool:
+                    lost.append(g)
+                    continue
+                for pos, (result, error) in zip(groups[g], results):
+                    yield pos, result, error
+
+            if lost:
+                # Every pending future of a broken pool fails: retry them once in a new pool
+                lost.extend(in_flight.values())
+                in_flight.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                print(f"[WARN] [{label}] A worker process died, restarting the process pool")
+                executor = ProcessPoolExecutor(max_workers=workers)
+                for g in sorted(lost):
+                    retries[g] = retries.get(g, 0) + 1
+                    if retries[g] > 1:
+                        for pos in groups[g]:
+                            yield pos, None, "worker process died"
+                    else:
+                        retry_queue.append(g)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_combo_results(rows: list, outdir: Path, seed: int = 0, workers: int = 1, max_in_flight: int = None,
+                       snapshot_format: str = "npz"):
+    """
+    Yields (position, index_row, error) for each row of rows, in completion order,
+    running run_group() on each generation-key group (see iter_group_results).
+    """
+    return iter_group_results(rows, run_group, (outdir, seed, snapshot_format), workers=workers,
+                              max_in_flight=max_in_flight, label="generate")
+
+
+# Checkpoints: one stable key per combo
+
+CHECKPOINT_FILE = "completed_combos.txt"
+COMBO_KEY_LENGTH = 16
+
+
+def combo_key(row: dict, seed: int = 0, snapshot_format: str = "npz") -> str:
+    """
+    Stable key of one combo: a hash of its generation key, its reconstruction
+    parameters (e_win, step_flag, erf_sigma), the base seed and the snapshot format.
+    """
+    key = (
+        generation_key(row),
+        int(row["e_win"]),
+        int(row["step_flag"]),
+        float(row["erf_sigma"]),
+        int(seed),
+        snapshot_format,
     )
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:COMBO_KEY_LENGTH]
+
+
+def load_checkpoint(path: Path) -> set:
+    """
+    Reads the completed combo keys. The file is append-only with one key per line,
+    so a line torn by a crash is shorter than a key and is ignored.
+    """
+    if not path.exists():
+        return set()
+    keys = (line.strip() for line in path.read_text().splitlines())
+    return {k for k in keys if len(k) == COMBO_KEY_LENGTH}
+
+
+def record_checkpoint(path: Path, keys: list) -> None:
+    """Appends completed combo keys to the checkpoint in a single write."""
+    if not keys:
+        return
+    with open(path, "a") as f:
+        f.write("".join(f"{k}\n" for k in keys))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def pid_alive(pid: int) -> bool:
+    """Whether a process with this pid runs on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clean_partial_outputs(outdir: Path) -> int:
+    """
+    Removes the temporary snapshot files (events_*.<host>.<pid>.tmp) left in outdir
+    by dead processes of this host. Files of live processes and of other hosts are kept.
+    Returns the number of files removed.
+    """
+    host = socket.gethostname()
+    suffix = re.compile(re.escape(f".{host}.") + r"(\d+)\.tmp$")
+    removed = 0
+    for tmp in outdir.glob("events_*.tmp"):
+        match = suffix.search(tmp.name)
+        if match is None or pid_alive(int(match.group(1))):
+            continue
+        tmp.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def recover_completed(outdir: Path, completed: set, keys: list) -> set:
+    """
+    Keys of keys that have an events_index.csv row (or a row in a leftover shard)
+    but are not in completed, i.e. combos flushed before a crash but never recorded.
+    They are appended to the checkpoint; the index is only read.
+    """
+    df_idx = read_index(outdir / "events_index.csv")
+    if "combo_key" not in df_idx.columns:
+        return set()
+    indexed = set(df_idx["combo_key"].dropna().astype(str))
+    recovered = [k for k in dict.fromkeys(keys) if k in indexed and k not in completed]
+    record_checkpoint(outdir / CHECKPOINT_FILE, recovered)
+    return set(recovered)
+
+
+def resume_combos(outdir: Path, row_ids: list, rows: list, keys: list, label: str):
+    """Cleans partial outputs in outdir and returns (row_ids, rows, keys) of the combos not completed yet."""
+    completed = load_checkpoint(outdir / CHECKPOINT_FILE)
+    recovered = recover_completed(outdir, completed, keys)
+    completed |= recovered
+    removed = clean_partial_outputs(outdir)
+    todo = [pos for pos, key in enumerate(keys) if key not in completed]
+    print(f"[INFO] [{label}] Resuming: {len(rows) - len(todo)} combos already completed, {len(todo)} to run"
+          + (f", {len(recovered)} recovered from the index" if recovered else "")
+          + (f", {removed} temporary files removed" if removed else ""))
+    return [row_ids[p] for p in todo], [rows[p] for p in todo], [keys[p] for p in todo]
 
 
 def cmd_generate(args: argparse.Namespace) -> None:
@@ -248,32 +796,40 @@ def cmd_generate(args: argparse.Namespace) -> None:
         raise ValueError("params.csv must contain a 'batch' column.")
 
     sub = df[df["batch"] == args.batch]
-    print(f"[INFO] [generate] Processing batch {args.batch} with {len(sub)} combos -> {outdir}")
-
+    workers = max(1, int(args.workers))
+    print(f"[INFO] [generate] Processing batch {args.batch} with {len(sub)} combos on {workers} worker(s) -> {outdir}")
+
+    row_ids = list(sub.index)
+    rows = [row.to_dict() for _, row in sub.iterrows()]
+    keys = [combo_key(row, args.seed, args.format) for row in rows]
+
+    # Under --resume, completed combos are recorded once their index rows are in the index shard
+    checkpoint = outdir / CHECKPOINT_FILE
+    if args.resume:
+        row_ids, rows, keys = resume_combos(outdir, row_ids, rows, keys, "generate")
+
+    index_flush = args.index_flush or (1 if args.resume else 64)
+    on_flush = None
+    if args.resume:
+        on_flush = lambda flushed: record_checkpoint(checkpoint, [r["combo_key"] for r in flushed])
+
+    # Results arrive in completion order; index rows are written in combo order
+    pending = {}
+    next_to_write = 0
     failures = 0
-    for i, row in sub.iterrows():
-        try:
-            # Get n_particles config, default to "default" if not in params
-            n_particles_config = str(row.get("n_particles", "default"))
-            # Get phi_max, default to 0.02 for backwards compatibility
-            phi_max = float(row.get("phi_max", 0.02))
-            
-            run_one(
-                float(row["meas"]),
-                float(row["coll"]),
-                float(row["ghost"]),
-                float(row["drop"]),
-                int(row["repeat"]),
-                int(row["e_win"]),
-                int(row["step_flag"]),
-                float(row["erf_sigma"]),
-                n_particles_config,
-                outdir,
-                phi_max=phi_max,
-            )
-        except Exception as e:
-            failures += 1
-            print(f"[WARN] [generate] combo at row {i} failed: {e}")
+    with IndexWriter(outdir / "events_index.csv", flush_every=index_flush, on_flush=on_flush) as index_writer:
+        for pos, index_row, error in iter_combo_results(rows, outdir, seed=args.seed, workers=workers,
+                                                        max_in_flight=args.max_in_flight,
+                                                        snapshot_format=args.format):
+            if error is not None:
+                failures += 1
+                print(f"[WARN] [generate] combo at row {row_ids[pos]} failed: {error}")
+            pending[pos] = index_row
+            while next_to_write in pending:
+                index_row = pending.pop(next_to_write)
+                if index_row is not None:
+                    index_writer.write({**index_row, "combo_key": keys[next_to_write]})
+                next_to_write += 1
 
     if failures:
         print(f"[INFO] [generate] Completed with {failures} failures.")
@@ -281,31 +837,418 @@ def cmd_generate(args: argparse.Namespace) -> None:
         print("[INFO] [generate] All combos completed successfully.")
 
 
+# =====================================================================
+# Subcommands: coordinate / work  (shared-filesystem work queue)
+# =====================================================================
+#
+# queue_dir/
+#   pending/task_<n>.json            tasks waiting for a worker
+#   claimed/task_<n>.<worker>.json   tasks being run; claimed by an atomic rename
+#   results/task_<n>.json            per-row (index_row, error) of finished tasks
+#   heartbeats/<worker>              counter rewritten by each worker every few seconds
+#   COORDINATOR                      counter rewritten by the coordinator at every scan
+#   STOP                             written by the coordinator when all tasks are collected
+#
+# A task is one generation-key group of combos (group_combos). Idle workers pull the
+# next pending task, so fast workers take over the remaining work of slow ones. The
+# coordinator returns the claimed tasks of a worker whose heartbeat has not changed
+# for --heartbeat-timeout seconds (by its own clock) to pending/. An idle worker exits
+# when the coordinator heartbeat has not changed for --coordinator-timeout seconds,
+# so workers do not wait forever for the STOP of a coordinator that died.
+
+QUEUE_DIRS = ("pending", "claimed", "results", "heartbeats")
+QUEUE_FILES = ("COORDINATOR", "STOP")
+
+
+def reset_queue_dir(queue_dir: Path, outdir: Path) -> None:
+    """
+    Prepares queue_dir for a new coordinator run. queue_dir must not exist, be empty or
+    hold only the queue layout (QUEUE_DIRS and QUEUE_FILES); the queue subdirectories
+    and files of a previous run are removed, nothing else. Raises ValueError otherwise.
+    """
+    if queue_dir == outdir or queue_dir in outdir.parents:
+        raise ValueError(f"The queue directory {queue_dir} must not contain the output directory {outdir}")
+    if queue_dir.exists():
+        if not queue_dir.is_dir():
+            raise ValueError(f"The queue directory {queue_dir} is not a directory")
+        unknown = sorted(
+            p.name for p in queue_dir.iterdir()
+            if not (p.name in QUEUE_DIRS and p.is_dir()) and not (p.name in QUEUE_FILES and p.is_file())
+        )
+        if unknown:
+            raise ValueError(
+                f"The queue directory {queue_dir} is neither empty nor a queue directory "
+                f"(found {', '.join(unknown[:5])}{', ...' if len(unknown) > 5 else ''}), refusing to clear it"
+            )
+        for name in QUEUE_DIRS:
+            if (queue_dir / name).exists():
+                shutil.rmtree(queue_dir / name)
+        for name in QUEUE_FILES:
+            (queue_dir / name).unlink(missing_ok=True)
+    for name in QUEUE_DIRS:
+        (queue_dir / name).mkdir(parents=True, exist_ok=True)
+
+
+def write_json_atomic(path: Path, obj) -> None:
+    tmp = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(obj, default=event_snapshot._json_default))
+    tmp.replace(path)
+
+
+def claim_task(queue_dir: Path, worker_id: str):
+    """Claims the oldest pending task. Returns (claimed path, task) or None if there is none."""
+    for path in sorted((queue_dir / "pending").glob("task_*.json")):
+        claimed = queue_dir / "claimed" / f"{path.stem}.{worker_id}.json"
+        try:
+            path.rename(claimed)  # only one worker wins the rename
+        except (FileNotFoundError, OSError):
+            continue
+        try:
+            return claimed, json.loads(claimed.read_text())
+        except (FileNotFoundError, ValueError):
+            continue  # requeued by the coordinator in the meantime
+    return None
+
+
+def worker_loop(queue_dir: Path, heartbeat: float = 5.0, poll: float = 1.0,
+                coordinator_timeout: float = 300.0) -> int:
+    """
+    Runs tasks from queue_dir until the coordinator writes STOP, or until the coordinator
+    heartbeat has not changed for coordinator_timeout seconds while the worker is idle.
+    A background thread rewrites the heartbeat file of the worker every heartbeat seconds.
+    Returns the number of tasks run.
+    """
+    queue_dir = Path(queue_dir)
+    worker_id = f"{socket.gethostname()}.{os.getpid()}"
+    stop = threading.Event()
+
+    def beat():
+        count_beats = 0
+        while not stop.is_set():
+            count_beats += 1
+            try:
+                write_json_atomic(queue_dir / "heartbeats" / worker_id, count_beats)
+            except OSError:
+                pass
+            stop.wait(heartbeat)
+
+    beater = threading.Thread(target=beat, daemon=True)
+    beater.start()
+    n_tasks = 0
+    coordinator = (None, time.monotonic())  # last coordinator heartbeat, time it was last seen changing
+    try:
+        while not (queue_dir / "STOP").exists():
+            claimed = claim_task(queue_dir, worker_id)
+            if claimed is None:
+                try:
+                    value = (queue_dir / "COORDINATOR").read_text()
+                except OSError:
+                    value = None
+                if value != coordinator[0]:
+                    coordinator = (value, time.monotonic())
+                elif time.monotonic() - coordinator[1] > coordinator_timeout:
+                    print(f"[WARN] [work] No coordinator heartbeat for {coordinator_timeout:g} s, exiting")
+                    break
+                time.sleep(poll)
+                continue
+            path, task = claimed
+            results = run_group(task["rows"], Path(task["outdir"]), task["seed"], task["format"])
+            write_json_atomic(queue_dir / "results" / f"task_{task['task']:06d}.json",
+                              {"task": task["task"], "results": results})
+            path.unlink(missing_ok=True)
+            n_tasks += 1
+    finally:
+        stop.set()
+        beater.join()
+        (queue_dir / "heartbeats" / worker_id).unlink(missing_ok=True)
+    return n_tasks
+
+
+def cmd_work(args: argparse.Namespace) -> None:
+    """Implements the 'work' subcommand: --processes worker loops on this node."""
+    queue_dir = args.queue.resolve()
+    print(f"[INFO] [work] Starting {args.processes} worker(s) on {socket.gethostname()} for {queue_dir}")
+    loop_args = (queue_dir, args.heartbeat, 1.0, args.coordinator_timeout)
+    if args.processes <= 1:
+        n_tasks = worker_loop(*loop_args)
+    else:
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            futures = [executor.submit(worker_loop, *loop_args) for _ in range(args.processes)]
+            n_tasks = sum(f.result() for f in futures)
+    print(f"[OK] [work] Ran {n_tasks} tasks")
+
+
+def requeue_stale_tasks(queue_dir: Path, beats: dict, timeout: float, requeues: dict, max_requeues: int = 2) -> list:
+    """
+    Returns the claimed tasks of workers whose heartbeat has not changed for timeout
+    seconds to pending/. beats maps worker -> (last heartbeat, time it was last seen changing).
+    Returns the ids of tasks given up after max_requeues requeues.
+    """
+    now = time.monotonic()
+    lost = []
+    for path in sorted((queue_dir / "claimed").glob("task_*.json")):
+        stem, worker = path.stem.split(".", 1)
+        try:
+            value = (queue_dir / "heartbeats" / worker).read_text()
+        except OSError:
+            value = None
+        last = beats.get(worker)
+        if last is None or last[0] != value:
+            beats[worker] = (value, now)
+            continue
+        if now - last[1] < timeout:
+            continue
+
+        task_id = int(stem[5:])
+        requeues[task_id] = requeues.get(task_id, 0) + 1
+        if requeues[task_id] > max_requeues:
+            path.unlink(missing_ok=True)
+            lost.append(task_id)
+            print(f"[WARN] [coordinate] {stem} lost {max_requeues} times, giving up")
+            continue
+        try:
+            path.rename(queue_dir / "pending" / f"{stem}.json")
+            print(f"[WARN] [coordinate] Worker {worker} stopped sending heartbeats, requeued {stem}")
+        except OSError:
+            pass  # finished in the meantime
+    return lost
+
+
+def cmd_coordinate(args: argparse.Namespace) -> None:
+    """
+    Implements the 'coordinate' subcommand: serves the combos of --params (all rows,
+    or one --batch) as tasks in --queue, collects the results of any number of
+    'work' processes and writes events_index.csv in combo order.
+    """
+    outdir = args.outdir.resolve()
+    outdir.mkdir(parents=True, exist_ok=True)
+    queue_dir = args.queue.resolve()
+
+    df = pd.read_csv(args.params)
+    if args.batch is not None:
+        if "batch" not in df.columns:
+            raise ValueError("params.csv must contain a 'batch' column.")
+        df = df[df["batch"] == args.batch]
+
+    row_ids = list(df.index)
+    rows = [row.to_dict() for _, row in df.iterrows()]
+    keys = [combo_key(row, args.seed, args.format) for row in rows]
+    checkpoint = outdir / CHECKPOINT_FILE
+    if args.resume:
+        row_ids, rows, keys = resume_combos(outdir, row_ids, rows, keys, "coordinate")
+
+    # Fresh queue
+    reset_queue_dir(queue_dir, outdir)
+    beat_count = 0
+    write_json_atomic(queue_dir / "COORDINATOR", beat_count)
+    groups = group_combos(rows)
+    for task_id, positions in enumerate(groups):
+        write_json_atomic(queue_dir / "pending" / f"task_{task_id:06d}.json", {
+            "task": task_id,
+            "rows": [rows[pos] for pos in positions],
+            "outdir": str(outdir),
+            "seed": args.seed,
+            "format": args.format,
+        })
+    print(f"[INFO] [coordinate] Serving {len(rows)} combos as {len(groups)} tasks in {queue_dir} -> {outdir}")
+
+    index_flush = args.index_flush or (1 if args.resume else 64)
+    on_flush = None
+    if args.resume:
+        on_flush = lambda flushed: record_checkpoint(checkpoint, [r["combo_key"] for r in flushed])
+
+    # Results arrive in completion order; index rows are written in combo order
+    collected = set()
+    beats, requeues = {}, {}
+    pending = {}
+    next_to_write = 0
+    failures = 0
+    with IndexWriter(outdir / "events_index.csv", flush_every=index_flush, on_flush=on_flush) as index_writer:
+        while len(collected) < len(groups):
+            beat_count += 1
+            write_json_atomic(queue_dir / "COORDINATOR", beat_count)
+            for path in sorted((queue_dir / "results").glob("task_*.json")):
+                result = json.loads(path.read_text())
+                path.unlink()
+                task_id = result["task"]
+                if task_id in collected:
+                    continue  # duplicate of a requeued task
+                collected.add(task_id)
+                for leftover in (queue_dir / "pending").glob(f"task_{task_id:06d}.json"):
+                    leftover.unlink(missing_ok=True)
+                for pos, (index_row, error) in zip(groups[task_id], result["results"]):
+                    pending[pos] = (index_row, error)
+
+            for task_id in requeue_stale_tasks(queue_dir, beats, args.heartbeat_timeout, requeues):
+                collected.add(task_id)
+                for pos in groups[task_id]:
+                    pending[pos] = (None, "worker lost")
+
+            while next_to_write in pending:
+                index_row, error = pending.pop(next_to_write)
+                if error is not None:
+                    failures += 1
+                    print(f"[WARN] [coordinate] combo at row {row_ids[next_to_write]} failed: {error}")
+                if index_row is not None:
+                    index_writer.write({**index_row, "combo_key": keys[next_to_write]})
+                next_to_write += 1
+
+            if len(collected) < len(groups):
+                time.sleep(args.poll)
+
+    (queue_dir / "STOP").write_text("")
+    if failures:
+        print(f"[INFO] [coordinate] Completed with {failures} failures.")
+    else:
+        print("[INFO] [coordinate] All combos completed successfully.")
+
+
 # =====================================================================
 # Subcommand: aggregate  (post-processing + metrics)
 # =====================================================================
 
 def load_snapshot(p: Path):
+    """Loads a snapshot: a lazy event_snapshot.Snapshot for .npz files, else a dill pickle."""
+    if p.suffix == event_snapshot.SNAPSHOT_SUFFIX:
+        return event_snapshot.load_snapshot(p)
     with gzip.open(p, "rb") as f:
         return _pickle.load(f)
 
 
+def load_event_store(path: Path) -> dict:
+    with gzip.open(path, "rb") as f:
+        return _pickle.load(f)
+
+
 def dump_event_store(store: dict, path: Path):
     path.parent.mkdir(parents=True, exist_ok=True)
     with gzip.open(path, "wb") as f:
         _pickle.dump(store, f, protocol=_pickle.HIGHEST_PROTOCOL)
 
 
+# Manifest signature of a snapshot whose validation failed: it never matches, so the
+# next incremental run aggregates the snapshot again and replaces its metrics row
+FAILED_SIGNATURE = "failed"
+
+
+def snapshot_signature(path: Path) -> str:
+    """Size and modification time of a snapshot; a changed file gets a new signature."""
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_manifest(path: Path) -> dict:
+    """Reads aggregate_manifest.csv as {(job, file): signature}."""
+    if not path.exists():
+        return {}
+    df = pd.read_csv(path, dtype=str)
+    return {(r.job, r.file): r.signature for r in df.itertuples(index=False)}
+
+
+def write_manifest(manifest: dict, path: Path) -> None:
+    rows = [{"job": job, "file": fname, "signature": sig} for (job, fname), sig in sorted(manifest.items())]
+    tmp = path.with_name(path.name + ".tmp")
+    pd.DataFrame(rows, columns=["job", "file", "signature"]).to_csv(tmp, index=False)
+    tmp.replace(path)
+
+
+def validate_event(noisy, reco):
+    """
+    Runs EventValidator(noisy, reco) where reco is the reconstructed Event or its list of tracks.
+    Returns (metrics, None), or ({}, error message) if validation fails.
+    """
+    try:
+        # EventValidator expects the list of reconstructed tracks
+        rec_tracks = reco.tracks if isinstance(reco, Event) else reco
+        validator = evl(noisy, rec_tracks)
+        return validator.compute_metrics(), None
+    except Exception as e:
+        return {}, str(e)
+
+
+def flat_metrics(fname: str, params: dict, metrics: dict) -> dict:
+    """One metrics.csv row: file, p_<param> and m_<metric> columns."""
+    flat = {"file": fname}
+    flat.update({f"p_{k}": v for k, v in params.items()})
+    if isinstance(metrics, dict):
+        flat.update({f"m_{k}": v for k, v in metrics.items()})
+    return flat
+
+
+def aggregate_snapshot(event_path: Path, store_full: bool = False):
+    """
+    Loads one snapshot and runs EventValidator(noisy, reco) on it.
+    Returns (entry, flat, warning, error); entry and flat are None if the snapshot cannot be
+    loaded, error is the validator error message (None if validation succeeded).
+    Runs in worker processes with --workers > 1.
+    """
+    fname = event_path.name
+    try:
+        snap = load_snapshot(event_path)
+    except Exception as e:
+        return None, None, f"Failed to load {event_path}: {e}", None
+
+    params = snap.get("params", {})
+    truth = snap.get("truth_event", None)
+    noisy = snap.get("noisy_event", None)
+    reco = snap.get("reco_event", None)
+
+    warning = None
+    metrics, error = validate_event(noisy, reco)
+    if error is not None:
+        warning = f"Validator failed on {event_path}: {error}"
+
+    entry = {
+        "params": params,
+        "metrics": metrics,
+    }
+    if store_full:
+        entry.update({"truth": truth, "noisy": noisy, "reco": reco})
+
+    return entry, flat_metrics(fname, params, metrics), warning, error
+
+
+def write_metrics(df_new: pd.DataFrame, path: Path, replaced_files: set, append: bool) -> None:
+    """
+    Writes metrics.csv. With append, rows of df_new are appended to the existing file when
+    the columns match and no existing row is replaced; otherwise the file is rewritten with
+    the rows of replaced_files, a set of (job, file), dropped.
+    """
+    if not append or not path.exists():
+        path.write_text(df_new.to_csv(index=False))
+        return
+
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    if not replaced_files and set(df_new.columns) <= set(columns):
+        if not df_new.empty:
+            df_new.reindex(columns=columns).to_csv(path, mode="a", header=False, index=False)
+        return
+
+    df_old = pd.read_csv(path)
+    if "job" in df_old.columns:
+        keys = pd.Series(list(zip(df_old["job"].astype(str), df_old["file"].astype(str))), index=df_old.index)
+        df_old = df_old[~keys.isin(replaced_files)]
+    else:
+        df_old = df_old[~df_old["file"].isin({fname for _, fname in replaced_files})]
+    path.write_text(pd.concat([df_old, df_new], ignore_index=True).to_csv(index=False))
+
+
 def cmd_aggregate(args: argparse.Namespace) -> None:
     """
     Aggregate all job results for one batch.
 
     - Reads per-job events_index.csv files
-    - Loads snapshots and computes metrics
+    - Loads snapshots and computes metrics, on --workers processes
     - Writes in out_dir (= runs_dir/batch_<batch>):
-        event_store.pkl.gz
+        event_store/ (or event_store.pkl.gz with --store-format pkl)
         metrics.csv
         events_index.csv   (merged per-job indices)
+        aggregate_manifest.csv (signature of every aggregated snapshot)
+
+    With --incremental, snapshots whose name and signature are already in
+    aggregate_manifest.csv are skipped, new entries are written as a new part
+    of event_store/ (or merged into event_store.pkl.gz) and new rows are
+    appended to metrics.csv.
     """
     runs_dir = args.runs_dir.resolve()
     out_dir = args.out_dir.resolve()
@@ -320,85 +1263,109 @@ def cmd_aggregate(args: argparse.Namespace) -> None:
     if not job_dirs:
         print(f"[WARN] [aggregate] No job directories under {batch_dir}")
 
-    event_store = {}
-    metrics_rows = []
-    processed = 0
+    manifest_path = out_dir / "aggregate_manifest.csv"
+    manifest = load_manifest(manifest_path) if args.incremental else {}
+
+    # Collect the snapshots to process
+    tasks = []          # (job, fname, path, signature)
+    replaced_files = set()
+    skipped = 0
     index_frames = []
 
     for job in job_dirs:
         idx = job / "events_index.csv"
-        if not idx.exists():
-            continue
-
         try:
-            df_idx = pd.read_csv(idx)
-            df_idx["job"] = job.name
-            index_frames.append(df_idx)
+            df_idx = read_index(idx)
         except Exception as e:
             print(f"[WARN] [aggregate] Could not read {idx}: {e}")
             continue
+        if df_idx.empty:
+            continue
+        df_idx["job"] = job.name
+        index_frames.append(df_idx)
 
-        for _, row in df_idx.iterrows():
-            fname = str(row.get("file", ""))
-            if not fname:
+        for fname in df_idx.get("file", pd.Series(dtype=str)).astype(str):
+            if not fname or fname == "nan":
                 continue
             event_path = job / fname
             if not event_path.exists():
                 print(f"[WARN] [aggregate] Missing snapshot {event_path}")
                 continue
 
-            try:
-                snap = load_snapshot(event_path)
-            except Exception as e:
-                print(f"[WARN] [aggregate] Failed to load {event_path}: {e}")
+            signature = snapshot_signature(event_path)
+            known = manifest.get((job.name, fname))
+            if known == signature:
+                skipped += 1
                 continue
+            if known is not None:
+                replaced_files.add((job.name, fname))
+            tasks.append((job.name, fname, event_path, signature))
+
+    if args.max_files:
+        tasks = tasks[: args.max_files]
+
+    if args.incremental:
+        print(f"[INFO] [aggregate] batch {args.batch}: {len(tasks)} new or changed snapshots, {skipped} already aggregated")
+
+    # Load and validate, in order
+    paths = [t[2] for t in tasks]
+    workers = max(1, int(args.workers))
+    if workers > 1 and len(paths) > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunksize = max(1, len(paths) // (4 * workers))
+        results = executor.map(aggregate_snapshot, paths, [args.store_full] * len(paths), chunksize=chunksize)
+    else:
+        executor = None
+        results = (aggregate_snapshot(p, args.store_full) for p in paths)
+
+    if args.store_format == "pkl":
+        store_path = out_dir / "event_store.pkl.gz"
+        pickled_store = {}
+        if args.incremental and store_path.exists():
+            pickled_store = load_event_store(store_path)
+    else:
+        store_path = out_dir / "event_store"
+        if not args.incremental and store_path.exists():
+            shutil.rmtree(store_path)
+        store_entries = []
 
-            params = snap.get("params", {})
-            truth = snap.get("truth_event", None)
-            noisy = snap.get("noisy_event", None)
-            reco = snap.get("reco_event", None)
-
-            try:
-                validator = evl(noisy, reco)
-                metrics = validator.compute_metrics()
-            except Exception as e:
-                print(f"[WARN] [aggregate] Validator failed on {event_path}: {e}")
-                metrics = {}
-
-            entry = {
-                "params": params,
-                "metrics": metrics,
-            }
-            if args.store_full:
-                entry.update({"truth": truth, "noisy": noisy, "reco": reco})
-
-            event_store[fname] = entry
+    metrics_rows = []
+    processed = 0
+    try:
+        for (job_name, fname, event_path, signature), (entry, flat, warning, error) in zip(tasks, results):
+            if warning is not None:
+                print(f"[WARN] [aggregate] {warning}")
+            if entry is None:
+                continue
 
-            flat = {"file": fname}
-            flat.update({f"p_{k}": v for k, v in params.items()})
-            if isinstance(metrics, dict):
-                flat.update({f"m_{k}": v for k, v in metrics.items()})
-            metrics_rows.append(flat)
+            if args.store_format == "pkl":
+                pickled_store[fname] = entry
+            else:
+                store_entries.append((f"{job_name}/{fname}", job_name, fname, entry))
+            metrics_rows.append({"file": fname, "job": job_name, **flat})
+            manifest[(job_name, fname)] = signature if error is None else FAILED_SIGNATURE
 
             processed += 1
             if args.verbose and processed % 50 == 0:
                 print(f"[INFO] [aggregate] batch {args.batch}: processed {processed} snapshots...")
-            if args.max_files and processed >= args.max_files:
-                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-        if args.max_files and processed >= args.max_files:
-            break
-
-    store_path = out_dir / "event_store.pkl.gz"
-    dump_event_store(event_store, store_path)
+    if args.store_format == "pkl":
+        dump_event_store(pickled_store, store_path)
+    elif store_entries or not store_path.exists():
+        event_store.write_event_store_part(store_path, store_entries)
 
     df_metrics = pd.DataFrame(metrics_rows)
-    (out_dir / "metrics.csv").write_text(df_metrics.to_csv(index=False))
+    write_metrics(df_metrics, out_dir / "metrics.csv", replaced_files, append=args.incremental)
 
     if index_frames:
         df_index_all = pd.concat(index_frames, ignore_index=True)
         (out_dir / "events_index.csv").write_text(df_index_all.to_csv(index=False))
 
+    write_manifest(manifest, manifest_path)
+
     print(f"[OK] [aggregate] batch {args.batch}: wrote {store_path}")
     print(f"[OK] [aggregate] batch {args.batch}: wrote {out_dir / 'metrics.csv'}")
     if index_frames:
@@ -406,13 +1373,185 @@ def cmd_aggregate(args: argparse.Namespace) -> None:
     print(f"[INFO] [aggregate] batch {args.batch}: total snapshots processed: {processed}")
 
 
+# =====================================================================
+# Subcommand: run  (streaming generate -> reconstruct -> validate)
+# =====================================================================
+
+# Payload keys written by run --snapshots compact; reco_event is rebuilt from reco_tracks
+COMPACT_PAYLOAD_KEYS = ("params", "truth_event", "noisy_event", "reco_tracks")
+
+
+def generate_stage(groups, seed: int = 0):
+    """
+    Stage 1: for each list of rows sharing a generation key, yields
+    (rows, generated, error) with the event generated once by generate_event().
+    """
+    for rows in groups:
+        try:
+            yield rows, generate_event(*generation_key(rows[0]), seed=seed), None
+        except Exception as e:
+            yield rows, None, f"{type(e).__name__}: {e}"
+
+
+def reconstruct_stage(stream):
+    """
+    Stage 2: reconstructs each generated event for every row of its group and
+    yields (row, generated, tag, payload, error). Only the current event is alive.
+    """
+    for rows, generated, error in stream:
+        for row in rows:
+            if error is not None:
+                yield row, None, None, None, error
+                continue
+            try:
+                tag, payload = reconstruct(generated, int(row["e_win"]), int(row["step_flag"]), float(row["erf_sigma"]))
+            except Exception as e:
+                yield row, None, None, None, f"{type(e).__name__}: {e}"
+                continue
+            yield row, generated, tag, payload, None
+
+
+def validate_stage(stream, outdir: Path, snapshots: str = "none"):
+    """
+    Stage 3: validates each reconstruction and yields ((metrics_row, index_row), None)
+    or (None, error). With snapshots "compact" or "full", the NPZ snapshot is saved and
+    index_row is its events_index.csv row; otherwise index_row is None.
+    """
+    for row, generated, tag, payload, error in stream:
+        if error is not None:
+            yield None, error
+            continue
+        metrics, error = validate_event(payload["noisy_event"], payload["reco_tracks"])
+        if error is not None:
+            yield None, f"Validator failed: {error}"
+            continue
+
+        fname = snapshot_name(tag)
+        index_row = None
+        try:
+            if snapshots != "none":
+                if snapshots == "compact":
+                    payload = {k: payload[k] for k in COMPACT_PAYLOAD_KEYS}
+                save_payload(payload, outdir / fname)
+                index_row = make_index_row(generated, int(row["e_win"]), int(row["step_flag"]),
+                                           payload["params"]["epsilon"], fname)
+        except Exception as e:
+            yield None, f"{type(e).__name__}: {e}"
+            continue
+        yield (flat_metrics(fname, payload["params"], metrics), index_row), None
+
+
+def run_group_stream(rows: list, outdir: Path, seed: int = 0, snapshots: str = "none") -> list:
+    """
+    Pipes rows sharing one generation key through the generate, reconstruct and
+    validate stages. Returns one ((metrics_row, index_row), None) or (None, error) per row.
+    """
+    return list(validate_stage(reconstruct_stage(generate_stage([rows], seed)), outdir, snapshots))
+
+
+def cmd_run(args: argparse.Namespace) -> None:
+    """
+    Implements the 'run' subcommand: generates, reconstructs and validates each
+    combo of a batch in one pass and streams the metrics to outdir/metrics.csv,
+    without the snapshot round trip through disk of generate + aggregate.
+    """
+    outdir = args.outdir
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    df = pd.read_csv(args.params)
+    if "batch" not in df.columns:
+        raise ValueError("params.csv must contain a 'batch' column.")
+
+    sub = df[df["batch"] == args.batch]
+    workers = max(1, int(args.workers))
+    print(f"[INFO] [run] Processing batch {args.batch} with {len(sub)} combos on {workers} worker(s) -> {outdir}")
+
+    row_ids = list(sub.index)
+    rows = [row.to_dict() for _, row in sub.iterrows()]
+
+    # Rows are written in combo order, at most --flush rows are buffered per file
+    pending = {}
+    next_to_write = 0
+    failures = 0
+    metrics_writer = IndexWriter(outdir / "metrics.csv", flush_every=args.flush)
+    index_writer = IndexWriter(outdir / "events_index.csv", flush_every=args.flush)
+    try:
+        results = iter_group_results(rows, run_group_stream, (outdir, args.seed, args.snapshots),
+                                     workers=workers, max_in_flight=args.max_in_flight, label="run")
+        for pos, result, error in results:
+            if error is not None:
+                failures += 1
+                print(f"[WARN] [run] combo at row {row_ids[pos]} failed: {error}")
+            pending[pos] = result
+            while next_to_write in pending:
+                result = pending.pop(next_to_write)
+                if result is not None:
+                    metrics_row, index_row = result
+                    metrics_writer.write(metrics_row)
+                    if index_row is not None:
+                        index_writer.write(index_row)
+                next_to_write += 1
+                if args.verbose and next_to_write % 50 == 0:
+                    print(f"[INFO] [run] batch {args.batch}: validated {next_to_write} combos...")
+    finally:
+        metrics_writer.close()
+        index_writer.close()
+
+    print(f"[OK] [run] batch {args.batch}: wrote {outdir / 'metrics.csv'}")
+    if failures:
+        print(f"[INFO] [run] Completed with {failures} failures.")
+    else:
+        print("[INFO] [run] All combos completed successfully.")
+
+
+# =====================================================================
+# Subcommand: convert  (dill + gzip snapshots -> columnar NPZ)
+# =====================================================================
+
+def cmd_convert(args: argparse.Namespace) -> None:
+    """
+    Converts every events_*.pkl.gz under args.root to .npz and rewrites the
+    file column of the events_index.csv in the same folder.
+    """
+    root = args.root.resolve()
+    sources = sorted(root.rglob("events_*.pkl.gz"))
+    print(f"[INFO] [convert] Converting {len(sources)} snapshots under {root}")
+
+    converted = {}
+    failures = 0
+    for src in sources:
+        try:
+            dst = event_snapshot.convert_pickle_snapshot(src)
+        except Exception as e:
+            failures += 1
+            print(f"[WARN] [convert] Failed to convert {src}: {e}")
+            continue
+        converted.setdefault(src.parent, {})[src.name] = dst.name
+        if args.remove:
+            src.unlink()
+
+    for folder, names in converted.items():
+        idx = folder / "events_index.csv"
+        merge_index_shards(idx)
+        if not idx.exists():
+            continue
+        with index_lock(idx):
+            df_idx = pd.read_csv(idx)
+            df_idx["file"] = df_idx["file"].map(lambda f: names.get(f, f))
+            tmp = idx.with_name(idx.name + ".tmp")
+            df_idx.to_csv(tmp, index=False)
+            tmp.replace(idx)
+
+    print(f"[OK] [convert] Converted {sum(len(n) for n in converted.values())} snapshots, {failures} failures")
+
+
 # =====================================================================
 # Top-level CLI
 # =====================================================================
 
 def build_arg_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(
-        description="Unified Velo Toy workflow: generate events and aggregate metrics."
+        description="Unified Velo Toy workflow: generate events, aggregate metrics, run streaming sweeps, serve work queues and convert snapshots."
     )
     subparsers = ap.add_subparsers(dest="command", required=True)
 
@@ -428,6 +1567,41 @@ def build_arg_parser() -> argparse.ArgumentParser:
         required=True,
         help="Destination directory for outputs (e.g. runs_X/batch_0/123.0)",
     )
+    gen.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (default 1: run combos in this process)",
+    )
+    gen.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=None,
+        help="Maximum number of generation-key groups submitted to the pool at a time (default 2 * workers)",
+    )
+    gen.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Base seed combined with each combo's generation parameters",
+    )
+    gen.add_argument(
+        "--format",
+        choices=["npz", "pkl"],
+        default="npz",
+        help="Snapshot format: columnar npz (default) or dill pickle pkl.gz",
+    )
+    gen.add_argument(
+        "--index-flush",
+        type=int,
+        default=None,
+        help="Number of buffered events_index.csv rows written per flush (default 64, 1 with --resume)",
+    )
+    gen.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip combos recorded in completed_combos.txt or events_index.csv, record completed combos and clean up after an interrupted run",
+    )
     gen.set_defaults(func=cmd_generate)
 
     agg = subparsers.add_parser(
@@ -452,12 +1626,29 @@ def build_arg_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Also store truth/noisy/reco objects in event_store (memory heavy)",
     )
+    agg.add_argument(
+        "--store-format",
+        choices=["mmap", "pkl"],
+        default="mmap",
+        help="Event store format: memory-mapped event_store/ (default) or event_store.pkl.gz",
+    )
     agg.add_argument(
         "--max-files",
         type=int,
         default=None,
         help="Limit number of files (debug / testing)",
     )
+    agg.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes loading and validating snapshots (default 1)",
+    )
+    agg.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only process snapshots not yet in aggregate_manifest.csv and append to the outputs",
+    )
     agg.add_argument(
         "--verbose",
         action="store_true",
@@ -465,6 +1656,122 @@ def build_arg_parser() -> argparse.ArgumentParser:
     )
     agg.set_defaults(func=cmd_aggregate)
 
+    run = subparsers.add_parser(
+        "run",
+        help="Generate, reconstruct and validate a batch in one streaming pass, writing metrics.csv."
+    )
+    run.add_argument("--params", type=Path, required=True, help="Path to params.csv")
+    run.add_argument("--batch", type=int, required=True, help="Batch id to process")
+    run.add_argument(
+        "--outdir",
+        type=Path,
+        required=True,
+        help="Destination directory for metrics.csv and optional snapshots",
+    )
+    run.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (default 1: run combos in this process)",
+    )
+    run.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=None,
+        help="Maximum number of generation-key groups submitted to the pool at a time (default 2 * workers)",
+    )
+    run.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Base seed combined with each combo's generation parameters",
+    )
+    run.add_argument(
+        "--snapshots",
+        choices=["none", "compact", "full"],
+        default="none",
+        help="Also save npz snapshots: none (default), compact (events and reco tracks) or full",
+    )
+    run.add_argument(
+        "--flush",
+        type=int,
+        default=64,
+        help="Number of buffered metrics.csv and events_index.csv rows written per flush",
+    )
+    run.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print progress messages every 50 combos",
+    )
+    run.set_defaults(func=cmd_run)
+
+    coord = subparsers.add_parser(
+        "coordinate",
+        help="Serve the combos of params.csv to 'work' processes through a shared-filesystem queue."
+    )
+    coord.add_argument("--params", type=Path, required=True, help="Path to params.csv")
+    coord.add_argument("--batch", type=int, default=None, help="Serve only this batch (default: all rows)")
+    coord.add_argument("--outdir", type=Path, required=True, help="Destination directory for snapshots and events_index.csv")
+    coord.add_argument("--queue", type=Path, required=True, help="Queue directory, on a filesystem shared with the workers")
+    coord.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Base seed combined with each combo's generation parameters",
+    )
+    coord.add_argument(
+        "--format",
+        choices=["npz", "pkl"],
+        default="npz",
+        help="Snapshot format: columnar npz (default) or dill pickle pkl.gz",
+    )
+    coord.add_argument(
+        "--heartbeat-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds without a heartbeat after which the tasks of a worker are requeued",
+    )
+    coord.add_argument("--poll", type=float, default=1.0, help="Seconds between two scans of the queue")
+    coord.add_argument(
+        "--index-flush",
+        type=int,
+        default=None,
+        help="Number of buffered events_index.csv rows written per flush (default 64, 1 with --resume)",
+    )
+    coord.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip combos recorded in completed_combos.txt or events_index.csv, record completed combos and clean up after an interrupted run",
+    )
+    coord.set_defaults(func=cmd_coordinate)
+
+    work = subparsers.add_parser(
+        "work",
+        help="Run tasks served by 'coordinate' until it has collected all results."
+    )
+    work.add_argument("--queue", type=Path, required=True, help="Queue directory of the coordinator")
+    work.add_argument("--processes", type=int, default=1, help="Number of worker processes on this node")
+    work.add_argument("--heartbeat", type=float, default=5.0, help="Seconds between two heartbeats")
+    work.add_argument(
+        "--coordinator-timeout",
+        type=float,
+        default=300.0,
+        help="Seconds without a coordinator heartbeat after which an idle worker exits",
+    )
+    work.set_defaults(func=cmd_work)
+
+    conv = subparsers.add_parser(
+        "convert",
+        help="Convert events_*.pkl.gz snapshots to the columnar npz format."
+    )
+    conv.add_argument("--root", type=Path, required=True, help="Directory searched recursively for snapshots")
+    conv.add_argument(
+        "--remove",
+        action="store_true",
+        help="Delete each .pkl.gz after a successful conversion",
+    )
+    conv.set_defaults(func=cmd_convert)
+
     return ap
 
 